@@ -14,9 +14,14 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# migrate whatever database the app is configured for (DATABASE_URL), not just the ini default
+from database.structure import database_url
+config.set_main_option("sqlalchemy.url", database_url)
+
 # add your model's MetaData object here
 # for 'autogenerate' support
 from sqlmodels.tables_schema import Videos as Base
+import push_notify.sub  # PushSubscription lives outside tables_schema
 # target_metadata = mymodel.Base.metadata
 target_metadata = Base.metadata
 
@@ -0,0 +1,54 @@
+"""Add upload sessions for resumable uploads
+
+Revision ID: 3b8e51c0d6a4
+Revises: f7a29217cf4d
+Create Date: 2026-10-18 10:12:31.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8e51c0d6a4'
+down_revision: Union[str, Sequence[str], None] = 'f7a29217cf4d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('uploadsessions',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('creator_id', sa.Integer(), nullable=False),
+    sa.Column('s3_key', sa.String(), nullable=False),
+    sa.Column('upload_id', sa.String(), nullable=True),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('category', sa.String(), nullable=True),
+    sa.Column('tags', sa.String(), nullable=True),
+    sa.Column('disable_comments', sa.Boolean(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=True),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('video_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['creator_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['video_id'], ['videos.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('uploadparts',
+    sa.Column('session_id', sa.String(), nullable=False),
+    sa.Column('part_number', sa.Integer(), nullable=False),
+    sa.Column('etag', sa.String(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['session_id'], ['uploadsessions.id'], ),
+    sa.PrimaryKeyConstraint('session_id', 'part_number')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('uploadparts')
+    op.drop_table('uploadsessions')
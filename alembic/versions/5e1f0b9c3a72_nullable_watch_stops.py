@@ -0,0 +1,35 @@
+"""Allow paused and unfinished watches
+
+Revision ID: 5e1f0b9c3a72
+Revises: 9c4d2e7a1f38
+Create Date: 2026-10-18 13:05:44.918302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e1f0b9c3a72'
+down_revision: Union[str, Sequence[str], None] = '9c4d2e7a1f38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # batch mode so SQLite can rebuild the table
+    with op.batch_alter_table('wacthvideos') as batch_op:
+        batch_op.alter_column('last_stop', existing_type=sa.DateTime(), nullable=True)
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("UPDATE wacthvideos SET last_stop = start_time WHERE last_stop IS NULL")
+    op.execute("UPDATE wacthvideos SET end_time = start_time WHERE end_time IS NULL")
+    with op.batch_alter_table('wacthvideos') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+        batch_op.alter_column('last_stop', existing_type=sa.DateTime(), nullable=False)
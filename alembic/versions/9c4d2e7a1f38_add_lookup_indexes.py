@@ -0,0 +1,75 @@
+"""Add indexes for the hot lookups
+
+Revision ID: 9c4d2e7a1f38
+Revises: 3b8e51c0d6a4
+Create Date: 2026-10-18 11:40:07.215934
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4d2e7a1f38'
+down_revision: Union[str, Sequence[str], None] = '3b8e51c0d6a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # keep the latest vote so the unique index below can be built
+    op.execute(
+        "DELETE FROM likesdislikes WHERE id NOT IN "
+        "(SELECT MAX(id) FROM likesdislikes GROUP BY video_id, user_id)"
+    )
+    # duplicate accounts can't be merged blindly, every other table points at them
+    duplicates = op.get_bind().execute(sa.text(
+        "SELECT email, COUNT(*) FROM users GROUP BY email HAVING COUNT(*) > 1")).all()
+    if duplicates:
+        listed = ", ".join(f"{email} ({count} rows)" for email, count in duplicates)
+        raise RuntimeError(
+            f"users.email can't be made unique, merge or delete the duplicate accounts first: {listed}")
+
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    op.create_index('ix_users_role', 'users', ['role'], unique=False)
+    op.create_index('ix_videos_creator_id', 'videos', ['creator_id'], unique=False)
+    op.create_index('ix_wacthvideos_video_id_user_id', 'wacthvideos', ['video_id', 'user_id'], unique=False)
+    op.create_index('ix_wacthvideos_creator_id', 'wacthvideos', ['creator_id'], unique=False)
+    op.create_index('ix_wacthvideos_user_id', 'wacthvideos', ['user_id'], unique=False)
+    op.create_index('ix_comments_user_id', 'comments', ['user_id'], unique=False)
+    op.create_index('ix_comments_video_id', 'comments', ['video_id'], unique=False)
+    op.create_index('ix_comments_parent_comment_id', 'comments', ['parent_comment_id'], unique=False)
+    op.create_index('ix_subscription_creator_id_user_id', 'subscription', ['creator_id', 'user_id'], unique=False)
+    op.create_index('ix_subscription_user_id', 'subscription', ['user_id'], unique=False)
+    op.create_index('ix_notificaions_user_id_is_read', 'notificaions', ['user_id', 'is_read'], unique=False)
+    op.create_index('ix_likesdislikes_video_id_user_id', 'likesdislikes', ['video_id', 'user_id'], unique=True)
+    op.create_index('ix_likesdislikes_user_id_is_like', 'likesdislikes', ['user_id', 'is_like'], unique=False)
+    op.create_index('ix_analytics_video_id', 'analytics', ['video_id'], unique=False)
+    op.create_index('ix_analytics_creator_id', 'analytics', ['creator_id'], unique=False)
+    op.create_index('ix_channels_creator_id', 'channels', ['creator_id'], unique=False)
+    op.create_index('ix_history_user_id', 'history', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_history_user_id', table_name='history')
+    op.drop_index('ix_channels_creator_id', table_name='channels')
+    op.drop_index('ix_analytics_creator_id', table_name='analytics')
+    op.drop_index('ix_analytics_video_id', table_name='analytics')
+    op.drop_index('ix_likesdislikes_user_id_is_like', table_name='likesdislikes')
+    op.drop_index('ix_likesdislikes_video_id_user_id', table_name='likesdislikes')
+    op.drop_index('ix_notificaions_user_id_is_read', table_name='notificaions')
+    op.drop_index('ix_subscription_user_id', table_name='subscription')
+    op.drop_index('ix_subscription_creator_id_user_id', table_name='subscription')
+    op.drop_index('ix_comments_parent_comment_id', table_name='comments')
+    op.drop_index('ix_comments_video_id', table_name='comments')
+    op.drop_index('ix_comments_user_id', table_name='comments')
+    op.drop_index('ix_wacthvideos_user_id', table_name='wacthvideos')
+    op.drop_index('ix_wacthvideos_creator_id', table_name='wacthvideos')
+    op.drop_index('ix_wacthvideos_video_id_user_id', table_name='wacthvideos')
+    op.drop_index('ix_videos_creator_id', table_name='videos')
+    op.drop_index('ix_users_role', table_name='users')
+    op.drop_index('ix_users_email', table_name='users')
@@ -0,0 +1,57 @@
+"""Merge analytics into one row per video and per channel
+
+Revision ID: a83f6c2d94b1
+Revises: 5e1f0b9c3a72
+Create Date: 2026-10-18 14:21:09.530177
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a83f6c2d94b1'
+down_revision: Union[str, Sequence[str], None] = '5e1f0b9c3a72'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+METRICS = ('views', 'likes', 'dislikes', 'comments', 'subscription', 'watch_time')
+
+
+def merge_into_first(group: str, channel_rows: bool) -> None:
+    # the lowest id of each group keeps the sums, the other rows go
+    scope = "video_id IS NULL" if channel_rows else "video_id IS NOT NULL"
+    sums = ", ".join(
+        f"{m} = (SELECT SUM(COALESCE(a.{m}, 0)) FROM analytics a "
+        f"WHERE a.{group} = analytics.{group} AND a.{scope})"
+        for m in METRICS
+    )
+    keep = f"SELECT MIN(id) FROM analytics WHERE {scope} AND {group} IS NOT NULL GROUP BY {group}"
+    op.execute(f"UPDATE analytics SET {sums} WHERE id IN ({keep})")
+    op.execute(f"DELETE FROM analytics WHERE {scope} AND {group} IS NOT NULL AND id NOT IN ({keep})")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # channel rows have no video, tables made by create_all declared the column NOT NULL
+    with op.batch_alter_table('analytics') as batch_op:
+        batch_op.alter_column('video_id', existing_type=sa.Integer(), nullable=True)
+
+    merge_into_first('video_id', channel_rows=False)
+    merge_into_first('creator_id', channel_rows=True)
+
+    op.drop_index('ix_analytics_video_id', table_name='analytics')
+    op.create_index('ix_analytics_video_id', 'analytics', ['video_id'], unique=True)
+    op.create_index('ix_analytics_creator_channel', 'analytics', ['creator_id'], unique=True,
+                    sqlite_where=sa.text('video_id IS NULL'),
+                    postgresql_where=sa.text('video_id IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_analytics_creator_channel', table_name='analytics')
+    op.drop_index('ix_analytics_video_id', table_name='analytics')
+    op.create_index('ix_analytics_video_id', 'analytics', ['video_id'], unique=False)
+    # video_id stays nullable, the channel rows left behind would violate NOT NULL
@@ -0,0 +1,32 @@
+"""Add appliedsegment, the watch buffer batches already committed
+
+Revision ID: b6f3a8d2e591
+Revises: e4a7c9d1b2f6
+Create Date: 2026-10-18 19:41:07.268113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6f3a8d2e591'
+down_revision: Union[str, Sequence[str], None] = 'e4a7c9d1b2f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('appliedsegment',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('applied_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('appliedsegment')
@@ -0,0 +1,58 @@
+"""Add hourly and daily analytics rollups
+
+Revision ID: c1d7e4a0b562
+Revises: a83f6c2d94b1
+Create Date: 2026-10-18 15:02:48.117630
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c1d7e4a0b562'
+down_revision: Union[str, Sequence[str], None] = 'a83f6c2d94b1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def create_rollup(name: str) -> None:
+    op.create_table(name,
+    sa.Column('creator_id', sa.Integer(), nullable=False),
+    sa.Column('views', sa.Integer(), nullable=False),
+    sa.Column('unique_viewers', sa.Integer(), nullable=False),
+    sa.Column('watch_seconds', sa.Integer(), nullable=False),
+    sa.Column('likes', sa.Integer(), nullable=False),
+    sa.Column('dislikes', sa.Integer(), nullable=False),
+    sa.Column('comments', sa.Integer(), nullable=False),
+    sa.Column('video_id', sa.Integer(), nullable=False),
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['creator_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['video_id'], ['videos.id'], ),
+    sa.PrimaryKeyConstraint('video_id', 'bucket')
+    )
+    op.create_index(f'ix_{name}_creator_id_bucket', name, ['creator_id', 'bucket'], unique=False)
+    op.create_index(f'ix_{name}_bucket', name, ['bucket'], unique=False)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    create_rollup('hourlyrollup')
+    create_rollup('dailyrollup')
+    op.create_table('rollupwatermark',
+    sa.Column('source', sa.String(), nullable=False),
+    sa.Column('last_id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('source')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('rollupwatermark')
+    for name in ('dailyrollup', 'hourlyrollup'):
+        op.drop_index(f'ix_{name}_bucket', table_name=name)
+        op.drop_index(f'ix_{name}_creator_id_bucket', table_name=name)
+        op.drop_table(name)
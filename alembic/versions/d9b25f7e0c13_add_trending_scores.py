@@ -0,0 +1,50 @@
+"""Add decayed trending scores and top-K snapshot columns
+
+Revision ID: d9b25f7e0c13
+Revises: c1d7e4a0b562
+Create Date: 2026-10-18 15:47:30.662841
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9b25f7e0c13'
+down_revision: Union[str, Sequence[str], None] = 'c1d7e4a0b562'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('trendingscore',
+    sa.Column('video_id', sa.Integer(), nullable=False),
+    sa.Column('creator_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['creator_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['video_id'], ['videos.id'], ),
+    sa.PrimaryKeyConstraint('video_id')
+    )
+    op.create_index('ix_trendingscore_score', 'trendingscore', ['score'], unique=False)
+
+    # the old job only ever appended, the first run rebuilds the snapshot
+    op.execute("DELETE FROM trending")
+    with op.batch_alter_table('trending') as batch_op:
+        batch_op.add_column(sa.Column('video_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('score', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('rank', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_trending_video_id_videos', 'videos', ['video_id'], ['id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('trending') as batch_op:
+        batch_op.drop_constraint('fk_trending_video_id_videos', type_='foreignkey')
+        batch_op.drop_column('rank')
+        batch_op.drop_column('score')
+        batch_op.drop_column('video_id')
+    op.drop_index('ix_trendingscore_score', table_name='trendingscore')
+    op.drop_table('trendingscore')
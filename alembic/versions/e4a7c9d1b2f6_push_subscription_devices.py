@@ -0,0 +1,47 @@
+"""Restore pushsubscription with one row per device endpoint
+
+Revision ID: e4a7c9d1b2f6
+Revises: d9b25f7e0c13
+Create Date: 2026-10-18 17:12:41.503218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a7c9d1b2f6'
+down_revision: Union[str, Sequence[str], None] = 'd9b25f7e0c13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # f7a29217cf4d dropped the table because the model wasn't in the migration metadata,
+    # databases set up through create_all() still have it, with duplicates per endpoint
+    if sa.inspect(op.get_bind()).has_table('pushsubscription'):
+        op.execute(
+            "DELETE FROM pushsubscription WHERE id NOT IN "
+            "(SELECT MAX(id) FROM pushsubscription GROUP BY endpoint)"
+        )
+    else:
+        op.create_table('pushsubscription',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('endpoint', sa.String(), nullable=False),
+        sa.Column('p256dh', sa.String(), nullable=False),
+        sa.Column('auth', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+    op.create_index(op.f('ix_pushsubscription_user_id'), 'pushsubscription', ['user_id'], unique=False)
+    op.create_index(op.f('ix_pushsubscription_endpoint'), 'pushsubscription', ['endpoint'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_pushsubscription_endpoint'), table_name='pushsubscription')
+    op.drop_index(op.f('ix_pushsubscription_user_id'), table_name='pushsubscription')
+    op.drop_table('pushsubscription')
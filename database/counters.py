@@ -0,0 +1,77 @@
+from sqlalchemy import update, case, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodels.tables_schema import Analytics
+
+# Every video has one canonical Analytics row and every creator one row with video_id NULL
+# for channel level metrics. Counters only move through UPDATE ... SET x = x + n, so
+# concurrent requests never read-modify-write and no increment is lost.
+VIDEO_METRICS = ("views", "likes", "dislikes", "comments", "watch_time")
+CREATOR_METRICS = ("subscription",)
+
+def increments(model, deltas: dict, clamp: bool = True) -> dict:
+    values = {}
+    for metric, n in deltas.items():
+        column = getattr(model, metric)
+        value = func.coalesce(column, 0) + n
+        # decrements stop at zero instead of going negative
+        values[metric] = case((value < 0, 0), else_=value) if n < 0 and clamp else value
+    return values
+
+def counter_filter(video_id: int | None, creator_id: int | None):
+    if video_id is not None:
+        return Analytics.video_id == video_id
+    return (Analytics.creator_id == creator_id) & Analytics.video_id.is_(None)
+
+def dialect_insert(dialect: str):
+    # both dialects' insert() support ON CONFLICT, the generic one does not
+    return postgresql.insert if dialect == "postgresql" else sqlite.insert
+
+def insert_canonical(dialect: str, video_id: int | None, creator_id: int | None):
+    stmt = dialect_insert(dialect)(Analytics).values(video_id=video_id, creator_id=creator_id, views=0, likes=0,
+                                    dislikes=0, comments=0, subscription=0, watch_time=0)
+    # the unique indexes decide the winner when two requests create the row at once
+    if video_id is not None:
+        return stmt.on_conflict_do_nothing(index_elements=["video_id"])
+    return stmt.on_conflict_do_nothing(index_elements=["creator_id"],
+                                       index_where=Analytics.video_id.is_(None))
+
+def check_metrics(deltas: dict, allowed: tuple) -> dict:
+    unknown = set(deltas) - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown counters {sorted(unknown)}")
+    return {metric: n for metric, n in deltas.items() if n}
+
+def bump(session: Session, video_id: int | None, creator_id: int | None, deltas: dict) -> None:
+    if not deltas:
+        return
+    stmt = update(Analytics).where(counter_filter(video_id, creator_id)).values(increments(Analytics, deltas))
+    # decrements never create a row, there is nothing to take away from
+    if session.execute(stmt).rowcount == 0 and any(n > 0 for n in deltas.values()):
+        session.execute(insert_canonical(session.get_bind().dialect.name, video_id, creator_id))
+        session.execute(stmt)
+
+async def bump_async(session: AsyncSession, video_id: int | None, creator_id: int | None, deltas: dict) -> None:
+    if not deltas:
+        return
+    stmt = update(Analytics).where(counter_filter(video_id, creator_id)).values(increments(Analytics, deltas))
+    if (await session.execute(stmt)).rowcount == 0 and any(n > 0 for n in deltas.values()):
+        await session.execute(insert_canonical(session.bind.dialect.name, video_id, creator_id))
+        await session.execute(stmt)
+
+def bump_video(session: Session, video_id: int, creator_id: int, **deltas: int) -> None:
+    """Adds to the video's counters, e.g. bump_video(session, 3, 1, likes=1, dislikes=-1).
+
+    Runs in the caller's transaction, it is applied by the caller's commit.
+    """
+    bump(session, video_id, creator_id, check_metrics(deltas, VIDEO_METRICS))
+
+def bump_creator(session: Session, creator_id: int, **deltas: int) -> None:
+    bump(session, None, creator_id, check_metrics(deltas, CREATOR_METRICS))
+
+async def bump_video_async(session: AsyncSession, video_id: int, creator_id: int, **deltas: int) -> None:
+    await bump_async(session, video_id, creator_id, check_metrics(deltas, VIDEO_METRICS))
+
+async def bump_creator_async(session: AsyncSession, creator_id: int, **deltas: int) -> None:
+    await bump_async(session, None, creator_id, check_metrics(deltas, CREATOR_METRICS))
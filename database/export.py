@@ -0,0 +1,60 @@
+import csv
+import io
+import json
+import zlib
+from decouple import config
+from sqlmodel import Session, select
+from database.structure import engine
+from sqlmodels.tables_schema import Users, Analytics, Reports, Complain
+
+# rows fetched per round trip, and so the most rows held in memory at once
+EXPORT_BATCH_ROWS: int = config('EXPORT_BATCH_ROWS', cast=int, default=2000)
+EXPORT_GZIP_LEVEL: int = config('EXPORT_GZIP_LEVEL', cast=int, default=6)
+
+USER_COLUMNS = (Users.id, Users.name, Users.email, Users.role, Users.created_at,
+                Users.is_banned, Users.suspended_until)  # never the password hash
+
+# plain column selects, rows come back as tuples without building ORM objects
+EXPORTS = {
+    "users": select(*USER_COLUMNS).where(Users.role == "user").order_by(Users.id),
+    "creators": select(*USER_COLUMNS).where(Users.role == "creator").order_by(Users.id),
+    "analytics": select(*Analytics.__table__.columns).order_by(Analytics.id),
+    "reports": select(*Reports.__table__.columns).order_by(Reports.id),
+    "complains": select(*Complain.__table__.columns).order_by(Complain.id),
+}
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def ndjson_lines(columns: list[str], rows) -> str:
+    return "".join(json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in rows)
+
+def csv_lines(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+def export_rows(dataset: str, fmt: str, compress: bool = False):
+    """Yields the encoded export one batch at a time.
+
+    The session is opened here and not taken from the request, the response outlives the
+    handler and a request scoped session would be closed before the first batch is read.
+    `yield_per` makes the driver use a server side cursor where it has one (psycopg2, asyncpg).
+    """
+    gzip = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31) if compress else None
+
+    def encode(text: str) -> bytes:
+        data = text.encode()
+        # a sync flush ends every batch on a byte boundary, so the client can inflate it
+        # right away instead of waiting for deflate's window to fill
+        return gzip.compress(data) + gzip.flush(zlib.Z_SYNC_FLUSH) if gzip else data
+
+    with Session(engine) as session:
+        result = session.execute(EXPORTS[dataset].execution_options(yield_per=EXPORT_BATCH_ROWS))
+        columns = list(result.keys())
+        if fmt == "csv":
+            yield encode(csv_lines([columns]))
+        for rows in result.partitions():
+            chunk = encode(ndjson_lines(columns, rows) if fmt == "ndjson" else csv_lines(rows))
+            if chunk:
+                yield chunk
+    if gzip:
+        yield gzip.flush()
@@ -0,0 +1,46 @@
+import base64
+import binascii
+import json
+from decouple import config
+from fastapi import HTTPException, status
+from sqlmodel import Session
+
+PAGE_SIZE_DEFAULT: int = config('PAGE_SIZE_DEFAULT', cast=int, default=20)
+PAGE_SIZE_MAX: int = config('PAGE_SIZE_MAX', cast=int, default=100)
+
+def page_size(limit: int | None) -> int:
+    return min(max(1, limit or PAGE_SIZE_DEFAULT), PAGE_SIZE_MAX)
+
+def encode_cursor(value) -> str:
+    raw = json.dumps({"k": value}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value = json.loads(raw)["k"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Invalid cursor")
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Invalid cursor")
+    return value
+
+def paginate(session: Session, query, key, cursor: str | None = None,
+             limit: int | None = None, descending: bool = False) -> tuple[list, str | None]:
+    """One page of `query` ordered by the unique column `key`, plus the cursor of the next page.
+
+    The page starts after the key stored in `cursor`, so its cost does not grow with the
+    page number the way OFFSET does. One extra row is fetched to know whether a next page exists.
+    """
+    size = page_size(limit)
+    if cursor is not None:
+        after = decode_cursor(cursor)
+        query = query.where(key < after if descending else key > after)
+    query = query.order_by(key.desc() if descending else key).limit(size + 1)
+
+    items = session.exec(query).all()
+    if len(items) <= size:
+        return items, None
+    return items[:size], encode_cursor(getattr(items[size - 1], key.key))
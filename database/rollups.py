@@ -0,0 +1,148 @@
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decouple import config
+from sqlalchemy import update, desc
+from sqlmodel import Session, select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database.counters import increments, dialect_insert, bump_video, bump_video_async
+from sqlmodels.tables_schema import HourlyRollup, DailyRollup, RollupWatermark, WacthVideos, History, Videos
+
+# Rows per source table read and committed at once by the rollup job
+ROLLUP_BATCH_SIZE: int = config('ROLLUP_BATCH_SIZE', cast=int, default=5000)
+# one run keeps taking batches until every source is caught up or this is spent, below the beat interval
+ROLLUP_TIME_BUDGET_SECONDS: float = config('ROLLUP_TIME_BUDGET_SECONDS', cast=float, default=240)
+# ids are handed out before commit, so a row this recent may still have an invisible predecessor;
+# must stay above the longest transaction that inserts History or WacthVideos rows
+ROLLUP_SETTLE_SECONDS: float = config('ROLLUP_SETTLE_SECONDS', cast=float, default=60)
+
+ROLLUP_METRICS = ("views", "unique_viewers", "watch_seconds", "likes", "dislikes", "comments")
+GRANULARITIES = {"hourly": HourlyRollup, "daily": DailyRollup}
+
+def hour_of(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+def day_of(ts: datetime) -> datetime:
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def rollup_statements(dialect: str, video_id: int, creator_id: int, ts: datetime, deltas: dict):
+    """UPDATE and INSERT-if-missing pairs for the hour and the day of `ts`."""
+    for model, bucket in ((HourlyRollup, hour_of(ts)), (DailyRollup, day_of(ts))):
+        where = (model.video_id == video_id) & (model.bucket == bucket)
+        # a bucket holds the net change of its hour, unlikes can take it below zero
+        bump = update(model).where(where).values(increments(model, deltas, clamp=False))
+        create = dialect_insert(dialect)(model).values(
+            video_id=video_id, bucket=bucket, creator_id=creator_id,
+            **{metric: 0 for metric in ROLLUP_METRICS}
+        ).on_conflict_do_nothing(index_elements=["video_id", "bucket"])
+        yield bump, create
+
+def bump_rollups(session: Session, video_id: int, creator_id: int, ts: datetime, **deltas: int) -> None:
+    deltas = {metric: n for metric, n in deltas.items() if n}
+    if not deltas:
+        return
+    for bump, create in rollup_statements(session.get_bind().dialect.name, video_id, creator_id, ts, deltas):
+        if session.execute(bump).rowcount == 0:
+            session.execute(create)
+            session.execute(bump)
+
+async def bump_rollups_async(session: AsyncSession, video_id: int, creator_id: int, ts: datetime, **deltas: int) -> None:
+    deltas = {metric: n for metric, n in deltas.items() if n}
+    if not deltas:
+        return
+    for bump, create in rollup_statements(session.bind.dialect.name, video_id, creator_id, ts, deltas):
+        if (await session.execute(bump)).rowcount == 0:
+            await session.execute(create)
+            await session.execute(bump)
+
+def bump_engagement(session: Session, video_id: int, creator_id: int, **deltas: int) -> None:
+    """Counters and the current hour's rollups for likes, dislikes and comments.
+
+    Those rows are flipped and deleted after insert, which no watermark can see, so their
+    rollups move with every change instead of being picked up by update_rollups.
+    """
+    bump_video(session, video_id, creator_id, **deltas)
+    bump_rollups(session, video_id, creator_id, datetime.utcnow(), **deltas)
+
+async def bump_engagement_async(session: AsyncSession, video_id: int, creator_id: int, **deltas: int) -> None:
+    await bump_video_async(session, video_id, creator_id, **deltas)
+    await bump_rollups_async(session, video_id, creator_id, datetime.utcnow(), **deltas)
+
+# Append-only sources, each selects (id, video_id, creator_id, timestamp) for rows after its watermark
+def history_rows(last_id: int):
+    return (select(History.id, History.video_id, Videos.creator_id, History.watched_at)
+            .join(Videos, Videos.id == History.video_id).where(History.id > last_id))
+
+def watch_rows(last_id: int):
+    # play reuses the (video, viewer) row, so a new row is a new viewer of the video
+    return (select(WacthVideos.id, WacthVideos.video_id, WacthVideos.creator_id, WacthVideos.start_time)
+            .where(WacthVideos.id > last_id))
+
+SOURCES = {
+    "history": (History, history_rows, "views"),
+    "wacthvideos": (WacthVideos, watch_rows, "unique_viewers"),
+}
+
+def rollup_batch(session: Session, source: str) -> tuple[int, bool]:
+    """Folds the next batch of one source and moves its watermark, returns (rows, caught up)."""
+    model, rows_after, metric = SOURCES[source]
+    now = datetime.utcnow()
+    settled = now - timedelta(seconds=ROLLUP_SETTLE_SECONDS)
+    mark = session.get(RollupWatermark, source) or RollupWatermark(source=source, last_id=0)
+    rows = session.exec(rows_after(mark.last_id).order_by(model.id).limit(ROLLUP_BATCH_SIZE)).all()
+    caught_up = len(rows) < ROLLUP_BATCH_SIZE
+    for n, (_, _, _, ts) in enumerate(rows):
+        if ts is not None and ts >= settled:
+            # stop before it, the next run picks it up together with anything that committed late
+            rows, caught_up = rows[:n], True
+            break
+    if not rows:
+        return 0, caught_up
+
+    buckets = defaultdict(int)
+    for _, video_id, creator_id, ts in rows:
+        buckets[(video_id, creator_id, hour_of(ts or now))] += 1
+    for (video_id, creator_id, hour), n in buckets.items():
+        bump_rollups(session, video_id, creator_id, hour, **{metric: n})
+
+    mark.last_id = rows[-1][0]
+    mark.updated_at = now
+    session.add(mark)
+    # increments and the new watermark commit together, a crashed batch is redone as a whole
+    session.commit()
+    return len(rows), caught_up
+
+def update_rollups(session: Session) -> dict:
+    """Folds rows added since each source's watermark into the rollups.
+
+    Sources take turns batch by batch so a large backlog in one doesn't starve the others.
+    """
+    deadline = time.monotonic() + ROLLUP_TIME_BUDGET_SECONDS
+    processed = {source: 0 for source in SOURCES}
+    behind = list(SOURCES)
+    while behind and time.monotonic() < deadline:
+        for source in list(behind):
+            rows, caught_up = rollup_batch(session, source)
+            processed[source] += rows
+            if caught_up:
+                behind.remove(source)
+    return processed
+
+def rollup_report(session: Session, granularity: str = "daily", start: datetime | None = None,
+                  end: datetime | None = None, creator_id: int | None = None,
+                  order_by: str | None = None, limit: int | None = None) -> list[dict]:
+    """Per video totals over [start, end) read from the rollup tables only."""
+    model = GRANULARITIES[granularity]
+    columns = [func.sum(getattr(model, metric)).label(metric) for metric in ROLLUP_METRICS]
+    query = select(model.video_id, model.creator_id, *columns).group_by(model.video_id, model.creator_id)
+    if start is not None:
+        query = query.where(model.bucket >= (hour_of(start) if granularity == "hourly" else day_of(start)))
+    if end is not None:
+        query = query.where(model.bucket < end)
+    if creator_id is not None:
+        query = query.where(model.creator_id == creator_id)
+    if order_by in ROLLUP_METRICS:
+        query = query.order_by(desc(order_by))
+    if limit:
+        query = query.limit(limit)
+    return [dict(row._mapping) for row in session.exec(query).all()]
@@ -1,13 +1,84 @@
-from typing import Any, Generator
+from typing import Any, AsyncGenerator, Generator
 from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from decouple import config
+
+database_url: str = config('DATABASE_URL', cast=str, default="sqlite:///./data.db")
+
+DB_ECHO: bool = config('DB_ECHO', cast=bool, default=False)
+DB_POOL_SIZE: int = config('DB_POOL_SIZE', cast=int, default=10)
+DB_MAX_OVERFLOW: int = config('DB_MAX_OVERFLOW', cast=int, default=20)
+DB_POOL_PRE_PING: bool = config('DB_POOL_PRE_PING', cast=bool, default=True)
+DB_POOL_RECYCLE: int = config('DB_POOL_RECYCLE', cast=int, default=1800)  # seconds
+DB_STATEMENT_TIMEOUT_MS: int = config('DB_STATEMENT_TIMEOUT_MS', cast=int, default=30000)
+
+SQLITE_BUSY_TIMEOUT_MS: int = config('SQLITE_BUSY_TIMEOUT_MS', cast=int, default=5000)
+SQLITE_MMAP_SIZE: int = config('SQLITE_MMAP_SIZE', cast=int, default=256 * 1024 * 1024)
+
+is_sqlite = database_url.startswith("sqlite")
+
+# async drivers for the same database, used by the async route handlers
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def async_database_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+connect_args: dict[str, Any] = {}
+async_connect_args: dict[str, Any] = {}
+if is_sqlite:
+    connect_args = {"check_same_thread": False}
+elif database_url.startswith("postgresql"):
+    # server side limit so one runaway query can't hold a pooled connection forever
+    connect_args = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    async_connect_args = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+
+pool_options = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    pool_recycle=DB_POOL_RECYCLE)
 
-database_url = "sqlite:///./data.db"
- 
 engine = create_engine(
     database_url,
-    echo=True,
-    connect_args={"check_same_thread": False})
+    echo=DB_ECHO,
+    connect_args=connect_args,
+    **pool_options)
+
+async_pool_options = pool_options
+if is_sqlite:
+    # sqlite has one writer, extra connections only wait on the file lock with busy_timeout's
+    # backoff sleeps, which is what the p99 was made of; queue for one connection instead
+    async_pool_options = dict(pool_options, pool_size=1, max_overflow=0)
+
+async_engine = create_async_engine(
+    async_database_url(database_url),
+    echo=DB_ECHO,
+    connect_args=async_connect_args,
+    **async_pool_options)
+
+# objects stay usable after commit, async code can't lazy-load expired attributes
+async_session = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run while a writer commits; NORMAL is still safe under WAL
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+if is_sqlite:
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
 
 def get_session() -> Generator[Session, Any, None]:
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    async with async_session() as session:
+        yield session
@@ -0,0 +1,332 @@
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from decouple import config
+from sqlalchemy import Boolean, DateTime, bindparam, case, delete, update
+from sqlalchemy.exc import OperationalError, InterfaceError
+from sqlmodel import select
+from database.structure import async_session
+from sqlmodels.tables_schema import WacthVideos, AppliedSegment
+from database.counters import bump_video_async
+from database.rollups import bump_rollups_async
+from s3_worker.trending import bump_trending_async
+
+# pause/resume/end are folded per watch in memory and written in one transaction
+# when WATCH_BUFFER_MAX_EVENTS pile up or every WATCH_BUFFER_FLUSH_SECONDS
+WATCH_BUFFER_MAX_EVENTS: int = config('WATCH_BUFFER_MAX_EVENTS', cast=int, default=1000)
+WATCH_BUFFER_FLUSH_SECONDS: float = config('WATCH_BUFFER_FLUSH_SECONDS', cast=float, default=2.0)
+WATCH_BUFFER_DIR: str = config('WATCH_BUFFER_DIR', cast=str, default='./watch_buffer')
+WATCH_BUFFER_KNOWN_IDS: int = config('WATCH_BUFFER_KNOWN_IDS', cast=int, default=100000)
+# a batch rejected this many flushes in a row is moved aside as a .dead log for manual replay,
+# failures to reach the database don't count, the batch is fine and just waits
+WATCH_BUFFER_MAX_ATTEMPTS: int = config('WATCH_BUFFER_MAX_ATTEMPTS', cast=int, default=10)
+# sealed batches waiting for the database, past this new events keep folding into the open one
+WATCH_BUFFER_MAX_RETRY: int = config('WATCH_BUFFER_MAX_RETRY', cast=int, default=32)
+
+logger = logging.getLogger(__name__)
+
+UNREACHABLE = (OperationalError, InterfaceError, OSError, asyncio.TimeoutError)
+
+# "play" is a resume that also reopens an ended watch, sent when a viewer starts it again
+WATCH_EVENTS = ("play", "pause", "resume", "end")
+
+class WatchState:
+    """Net effect of a run of events on one WacthVideos row.
+
+    Only a leading pause/end depends on what is stored in the row (its last_stop),
+    everything after it is known locally, so any number of events folds into this.
+    """
+    __slots__ = ("touched", "first_stop", "added", "last_stop", "end_time", "reopened")
+
+    def __init__(self):
+        self.touched = False
+        self.first_stop: datetime | None = None
+        self.added = 0.0
+        self.last_stop: datetime | None = None  # None while paused
+        self.end_time: datetime | None = None
+        self.reopened = False
+
+    def fold(self, kind: str, ts: datetime) -> None:
+        if kind in ("play", "resume"):
+            self.touched = True
+            self.last_stop = ts
+            if kind == "play":
+                self.reopened = True
+                self.end_time = None
+            return
+
+        # pause and end both stop the clock
+        if not self.touched:
+            self.touched = True
+            self.first_stop = ts
+        elif self.last_stop is not None:
+            self.added += max(0.0, (ts - self.last_stop).total_seconds())
+        self.last_stop = None
+        if kind == "end":
+            self.end_time = ts
+
+    def changes(self, watch_id: int, last_stop: datetime | None) -> dict:
+        """Parameters of WATCH_UPDATE for the row, given the last_stop stored in it."""
+        accrued = self.added
+        if self.first_stop is not None and last_stop is not None:
+            accrued += max(0.0, (self.first_stop - last_stop).total_seconds())
+        return {"watch_id": watch_id, "added": int(accrued), "last_stop": self.last_stop,
+                "set_end": self.end_time is not None or self.reopened, "end_time": self.end_time}
+
+def fold_events(events) -> dict[int, WatchState]:
+    batch: dict[int, WatchState] = {}
+    for watch_id, kind, ts in events:
+        batch.setdefault(watch_id, WatchState()).fold(kind, ts)
+    return batch
+
+# duration is added in the statement, a "play" flushed by the worker that served /play_video
+# and the rest of the watch flushed by its sticky worker can't overwrite each other's time
+watches_table = WacthVideos.__table__
+WATCH_UPDATE = (update(watches_table)
+                .where(watches_table.c.id == bindparam("watch_id"))
+                .values(duration=watches_table.c.duration + bindparam("added"),
+                        last_stop=bindparam("last_stop"),
+                        end_time=case((bindparam("set_end", type_=Boolean), bindparam("end_time", type_=DateTime)),
+                                      else_=watches_table.c.end_time)))
+
+async def apply_batch(batch: dict[int, WatchState], applied: list[str] = (), forget: list[str] = ()) -> None:
+    """Writes a batch, marking the log segments in applied as done in the same transaction.
+
+    forget drops the marks of segments whose files are already deleted.
+    """
+    if not (batch or applied or forget):
+        return
+    async with async_session() as session:
+        watch_time = defaultdict(int)
+        if batch:
+            watches = (await session.exec(select(WacthVideos.id, WacthVideos.video_id, WacthVideos.creator_id,
+                                                 WacthVideos.last_stop)
+                                          .where(WacthVideos.id.in_(list(batch))))).all()
+            params = []
+            for watch in watches:  # rows deleted meanwhile are simply skipped
+                change = batch[watch.id].changes(watch.id, watch.last_stop)
+                params.append(change)
+                watch_time[(watch.video_id, watch.creator_id)] += change["added"]
+            if params:
+                await session.execute(WATCH_UPDATE, params)
+
+        now = datetime.utcnow()
+        for (video_id, creator_id), seconds in watch_time.items():
+            await bump_video_async(session, video_id, creator_id, watch_time=seconds)
+            await bump_rollups_async(session, video_id, creator_id, now, watch_seconds=seconds)
+            await bump_trending_async(session, video_id, creator_id, seconds / 60)
+        for name in applied:
+            session.add(AppliedSegment(name=name, applied_at=now))
+        if forget:
+            await session.execute(delete(AppliedSegment).where(AppliedSegment.name.in_(list(forget))))
+        await session.commit()
+
+async def applied_segments(names: list[str]) -> set[str]:
+    async with async_session() as session:
+        return set((await session.exec(select(AppliedSegment.name)
+                                       .where(AppliedSegment.name.in_(names)))).all())
+
+def read_log(path: str) -> list[tuple[int, str, datetime]]:
+    events = []
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                events.append((record["w"], record["k"], datetime.fromisoformat(record["t"])))
+            except (ValueError, KeyError):
+                continue  # torn last line of a crashed writer
+    return events
+
+class LogSegment:
+    """An append-only file holding the events of one batch, flock'ed while its owner lives."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "a")
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.file.close()
+            raise
+
+    @property
+    def key(self) -> str:
+        # the worker name, plus the batch number once sealed, unique across workers and restarts
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    def append(self, watch_id: int, kind: str, ts: datetime) -> None:
+        # flushed to the OS per event, that survives a worker crash (not a power cut)
+        self.file.write(json.dumps({"w": watch_id, "k": kind, "t": ts.isoformat()}) + "\n")
+        self.file.flush()
+
+    def seal(self, path: str) -> None:
+        # the lock follows the inode, so the renamed file stays claimed
+        os.rename(self.path, path)
+        self.path = path
+
+    def discard(self) -> None:
+        os.remove(self.path)
+        self.file.close()
+
+    def bury(self, path: str) -> None:
+        # renamed out of the replay globs and unlocked, only an operator replays it
+        self.seal(path)
+        self.file.close()
+
+class WatchBuffer:
+    """Per-process buffer of watch events, flushed to the database in batches.
+
+    Each worker folds only the events it received, so all events of one watch must reach the
+    same worker: route /*/pause_video, /*/resume_video and /*/end_video by the watch_id query
+    parameter (e.g. nginx `hash $arg_watch_id consistent`). A pause folded on one worker and a
+    resume on another would be applied in flush order, not in the order they happened.
+    A "play" is recorded by whichever worker served /*/play_video, it only restarts the clock
+    and the durations of both workers are added in SQL.
+
+    A batch's log file is deleted after its commit, a crash in between leaves the file behind.
+    The commit records the file's key in AppliedSegment, so the replay skips it instead of
+    applying the batch twice.
+    """
+
+    def __init__(self, directory: str = WATCH_BUFFER_DIR):
+        self.directory = directory
+        self.name = ""
+        self.pending: dict[int, WatchState] = {}
+        self.count = 0
+        self.segment: LogSegment | None = None
+        self.sealed = 0
+        self.retry: list[tuple[dict[int, WatchState], LogSegment]] = []
+        self.attempts = 0  # failed flushes of retry[0]
+        self.discarded: list[str] = []  # segments deleted since their mark was last cleared
+        self.known: OrderedDict[int, None] = OrderedDict()
+        self.wake = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.stopping = False
+
+    def is_known(self, watch_id: int) -> bool:
+        if watch_id in self.known:
+            self.known.move_to_end(watch_id)
+            return True
+        return False
+
+    def remember(self, watch_id: int) -> None:
+        self.known[watch_id] = None
+        self.known.move_to_end(watch_id)
+        while len(self.known) > WATCH_BUFFER_KNOWN_IDS:
+            self.known.popitem(last=False)
+
+    async def exists(self, session, watch_id: int) -> bool:
+        """Checks the watch row once, later events for it skip the database."""
+        if self.is_known(watch_id):
+            return True
+        if await session.get(WacthVideos, watch_id) is None:
+            return False
+        self.remember(watch_id)
+        return True
+
+    def record(self, watch_id: int, kind: str, ts: datetime) -> None:
+        """Accepts one transition, the row is updated by the next flush."""
+        if kind not in WATCH_EVENTS:
+            raise ValueError(f"Unknown watch event {kind}")
+        if self.segment is None:
+            raise RuntimeError("WatchBuffer.record() called before start()")
+        self.segment.append(watch_id, kind, ts)
+        self.pending.setdefault(watch_id, WatchState()).fold(kind, ts)
+        self.count += 1
+        if self.count == WATCH_BUFFER_MAX_EVENTS:
+            self.wake.set()
+
+    async def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        # named here rather than at import, forked workers must not share a log
+        self.name = f"{os.getpid()}-{time.time_ns()}"
+        await self.replay_orphans()
+        self.segment = LogSegment(os.path.join(self.directory, f"{self.name}.log"))
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        # let the loop finish its flush instead of cancelling it mid-commit
+        self.stopping = True
+        self.wake.set()
+        if self.task:
+            await self.task
+        await self.flush()
+        if not self.retry and not self.pending and self.segment:
+            self.segment.discard()
+            await apply_batch({}, forget=self.discarded)
+            self.discarded = []
+
+    async def run(self) -> None:
+        while not self.stopping:
+            try:
+                await asyncio.wait_for(self.wake.wait(), WATCH_BUFFER_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # batches stay queued with their log files, the next tick retries them
+                logger.exception("Watch buffer flush failed")
+
+    async def flush(self) -> None:
+        # while the database is away the open batch keeps folding, memory grows with watches, not events
+        if self.pending and len(self.retry) < WATCH_BUFFER_MAX_RETRY:
+            # seal the current log with its batch and start a new one before awaiting
+            self.sealed += 1
+            segment = self.segment
+            segment.seal(os.path.join(self.directory, f"{self.name}.{self.sealed:06d}.pending"))
+            self.retry.append((self.pending, segment))
+            self.segment = LogSegment(os.path.join(self.directory, f"{self.name}.log"))
+            self.pending = {}
+            self.count = 0
+
+        # older batches go first so a watch's events are applied in order
+        while self.retry:
+            batch, segment = self.retry[0]
+            try:
+                await apply_batch(batch, applied=[segment.key], forget=self.discarded)
+            except UNREACHABLE:
+                raise
+            except Exception:
+                self.attempts += 1
+                if self.attempts < WATCH_BUFFER_MAX_ATTEMPTS:
+                    raise
+                # poison batch, set it aside so the ones behind it aren't blocked forever
+                segment.bury(segment.path.replace(".pending", ".dead"))
+                logger.error("Watch buffer batch moved to %s after %d failed flushes", segment.path, self.attempts)
+            else:
+                segment.discard()
+                self.discarded = [segment.key]
+            self.retry.pop(0)
+            self.attempts = 0
+
+    async def replay_orphans(self) -> None:
+        """Applies log files left behind by workers that died before flushing them."""
+        orphans = []
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.pending"))
+                           + glob.glob(os.path.join(self.directory, "*.log"))):
+            try:
+                orphans.append(LogSegment(path))
+            except (BlockingIOError, FileNotFoundError):
+                continue  # a live worker still owns it
+
+        if not orphans:
+            return
+        # a batch committed just before its worker died is already in the database
+        done = await applied_segments([segment.key for segment in orphans])
+        todo = [segment for segment in orphans if segment.key not in done]
+        events = [event for segment in todo for event in read_log(segment.path)]
+        events.sort(key=lambda event: event[2])
+        await apply_batch(fold_events(events), applied=[segment.key for segment in todo])
+        for segment in orphans:
+            segment.discard()
+        self.discarded.extend(segment.key for segment in orphans)
+
+watch_buffer = WatchBuffer()
@@ -1,7 +1,14 @@
 from fastapi import FastAPI
 from routers import admin, creator, login, user
+from push_notify import sub
+from ws_router import websockets
+from ws_router.bus import notification_bus
+from ws_router.registry import connection_registry
 from sqlmodel import SQLModel
 from database.structure import engine
+from database.watch_buffer import watch_buffer
+from trending.index import trending_index
+from oauth2.password_pool import shutdown_pool
 import uvicorn
 
 app = FastAPI()
@@ -10,7 +17,39 @@ app.include_router(login.router)
 app.include_router(user.router)
 app.include_router(creator.router)
 app.include_router(admin.router)
+app.include_router(sub.router)
+app.include_router(websockets.router)
 
 @app.on_event("startup") 
 def on_startup() -> None:
-    SQLModel.metadata.create_all(engine) 
\ No newline at end of file
+    SQLModel.metadata.create_all(engine) 
+
+@app.on_event("startup")
+async def start_watch_buffer() -> None:
+    await watch_buffer.start()
+
+@app.on_event("startup")
+async def start_trending_index() -> None:
+    await trending_index.start()
+
+@app.on_event("startup")
+async def start_notification_bus() -> None:
+    await connection_registry.start()
+    await notification_bus.start(websockets.deliver)
+
+@app.on_event("shutdown")
+async def stop_watch_buffer() -> None:
+    await watch_buffer.stop()
+
+@app.on_event("shutdown")
+async def stop_trending_index() -> None:
+    await trending_index.stop()
+
+@app.on_event("shutdown")
+async def stop_notification_bus() -> None:
+    await notification_bus.stop()
+    await connection_registry.stop()
+
+@app.on_event("shutdown")
+def on_shutdown() -> None:
+    shutdown_pool()
@@ -9,6 +9,7 @@ from sqlmodel import Session, select
 import bcrypt
 from passlib.context import CryptContext
 from database.structure import get_session
+from oauth2.principal_cache import principal_cache
 
 pwd = CryptContext(schemes = ['bcrypt'], deprecated = 'auto')
 def hash_password(password : str):
@@ -25,8 +26,10 @@ bearer_scheme = HTTPBearer()
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) +( expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    now = datetime.now(timezone.utc)
+    expire = now +( expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    # iat is part of the principal cache key, a fresh login never reuses an old entry
+    to_encode.update({"exp": expire, "iat": now})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -45,6 +48,7 @@ def get_current_user(required_role: Optional[str] = None):
         username: str | None = payload.get("sub")
         user_id: int | None = payload.get("id")
         role : str | None = payload.get("role")
+        issued_at : int | None = payload.get("iat")
         if username is None or user_id is None or role is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
         
@@ -54,12 +58,18 @@ def get_current_user(required_role: Optional[str] = None):
                 detail="Access denied"
             )
 
-        query = select(Users).where(Users.email == username, Users.id == user_id)
-        user = session.exec(query).first()
-        if user is None:
-            raise credentials_exception
+        cached = principal_cache.get(user_id, issued_at)
+        if cached is not None:
+            # a fresh detached copy, requests never share one Users instance
+            user = Users(**cached)
+        else:
+            query = select(Users).where(Users.email == username, Users.id == user_id)
+            user = session.exec(query).first()
+            if user is None:
+                raise credentials_exception
+            principal_cache.put(user_id, issued_at, user.model_dump())
     
-        if user.role != role: 
+        if user.email != username or user.role != role: 
             raise credentials_exception
         return user
     except JWTError:
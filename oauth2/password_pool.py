@@ -0,0 +1,60 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from decouple import config
+from fastapi import HTTPException, status
+from oauth2.jwt_hashing import hash_password, check_hashed_password
+
+# bcrypt is pure CPU, so it runs in its own processes instead of the request threadpool.
+# At most HASH_POOL_WORKERS hashes run at once, HASH_QUEUE_MAX bounds the ones waiting.
+HASH_POOL_WORKERS: int = config('HASH_POOL_WORKERS', cast=int, default=os.cpu_count() or 1)
+HASH_QUEUE_MAX: int = config('HASH_QUEUE_MAX', cast=int, default=HASH_POOL_WORKERS * 8)
+
+_pool: ProcessPoolExecutor | None = None
+_in_flight = 0
+_rejected = 0
+
+def get_pool() -> ProcessPoolExecutor:
+    # created on first use so importing the module never forks
+    global _pool
+    if _pool is None:
+        # forking a process that runs an event loop, Redis and DB pools copies their locks and sockets
+        _pool = ProcessPoolExecutor(max_workers=HASH_POOL_WORKERS,
+                                    mp_context=multiprocessing.get_context("forkserver"))
+    return _pool
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+async def run_hashing(fn, *args):
+    # only touched from the event loop thread, plain counters are enough
+    global _in_flight, _rejected
+    if _in_flight >= HASH_POOL_WORKERS + HASH_QUEUE_MAX:
+        _rejected += 1
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                            detail="Too many password requests, try again shortly",
+                            headers={"Retry-After": "1"})
+    _in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_pool(), fn, *args)
+    finally:
+        _in_flight -= 1
+
+async def hash_password_async(password : str) -> str:
+    return await run_hashing(hash_password, password)
+
+async def check_hashed_password_async(plain_pass : str, hashed_pass : str) -> bool:
+    return await run_hashing(check_hashed_password, plain_pass, hashed_pass)
+
+def pool_stats() -> dict:
+    return {
+        "workers": HASH_POOL_WORKERS,
+        "in_flight": _in_flight,
+        "queue_depth": max(0, _in_flight - HASH_POOL_WORKERS),
+        "queue_max": HASH_QUEUE_MAX,
+        "rejected": _rejected,
+    }
@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+from decouple import config
+
+PRINCIPAL_CACHE_TTL: float = config('PRINCIPAL_CACHE_TTL', cast=float, default=60)
+PRINCIPAL_CACHE_SIZE: int = config('PRINCIPAL_CACHE_SIZE', cast=int, default=10000)
+
+class PrincipalCache:
+    """LRU + TTL cache of authenticated users keyed by (user id, token iat).
+
+    Entries are per process, so invalidate() only reaches the worker it runs in;
+    the TTL bounds how long any other worker can serve a stale user.
+    """
+
+    def __init__(self, max_size: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: int, iat: int | None) -> dict | None:
+        key = (user_id, iat)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id: int, iat: int | None, data: dict) -> None:
+        with self._lock:
+            self._entries[(user_id, iat)] = (time.monotonic() + self.ttl, data)
+            self._entries.move_to_end((user_id, iat))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: int) -> None:
+        """Drops every cached token of the user, call it after changing the user row."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+            }
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,132 @@
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import httpx
+from celery.utils.log import get_task_logger
+from decouple import config
+from pywebpush import WebPusher
+from sqlmodel import Session, select, delete
+from database.structure import engine
+from s3_worker.celery import celery_app
+from sqlmodels.tables_schema import Subscription
+from .sub import PushSubscription, subscriptions_for_users
+from .vapid import vapid_signer
+
+PUSH_BATCH_SIZE: int = config('PUSH_BATCH_SIZE', cast=int, default=500)  # recipients per task
+PUSH_CONCURRENCY: int = config('PUSH_CONCURRENCY', cast=int, default=200)  # requests in flight per task
+PUSH_ORIGIN_CONNECTIONS: int = config('PUSH_ORIGIN_CONNECTIONS', cast=int, default=50)  # pool per push service
+PUSH_TIMEOUT_SECONDS: float = config('PUSH_TIMEOUT_SECONDS', cast=float, default=10)
+PUSH_TTL_SECONDS: int = config('PUSH_TTL_SECONDS', cast=int, default=24 * 3600)
+PUSH_MAX_RETRIES: int = config('PUSH_MAX_RETRIES', cast=int, default=3)
+
+logger = get_task_logger(__name__)
+
+# the push service no longer knows the subscription, it will never accept it again
+EXPIRED = {404, 410}
+
+def origin_of(endpoint: str) -> str:
+    parts = urlsplit(endpoint)
+    return f"{parts.scheme}://{parts.netloc}"
+
+def encrypt(subscription: PushSubscription, msg: str) -> bytes:
+    info = {'endpoint': subscription.endpoint,
+            'keys': {'p256dh': subscription.p256dh, 'auth': subscription.auth}}
+    return WebPusher(info).encode(msg.encode(), "aes128gcm")["body"]
+
+def retry_after(response: httpx.Response) -> float:
+    """Seconds the push service asked us to wait, Retry-After is either seconds or an HTTP date."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return 0.0
+
+async def push_one(client: httpx.AsyncClient, limit: asyncio.Semaphore,
+                   subscription: PushSubscription, msg: str) -> httpx.Response | None:
+    """Response of the push service, None when it could not be reached."""
+    headers = dict(vapid_signer.headers_for(origin_of(subscription.endpoint)),
+                   **{"Content-Encoding": "aes128gcm", "TTL": str(PUSH_TTL_SECONDS)})
+    # a fresh ephemeral key per message is required by RFC 8291, only the VAPID part is cached
+    body = encrypt(subscription, msg)
+    async with limit:
+        try:
+            response = await client.post(subscription.endpoint, content=body, headers=headers)
+        except httpx.HTTPError:
+            return None
+    return response
+
+async def deliver(subscriptions: list[PushSubscription], msg: str) -> tuple[dict[str, list[str]], float]:
+    """Sends `msg` to every subscription concurrently and sorts the endpoints by outcome.
+
+    Also returns the longest Retry-After of the pushes to retry, 0 if none was given.
+    """
+    limit = asyncio.Semaphore(PUSH_CONCURRENCY)
+    clients = {
+        origin: httpx.AsyncClient(timeout=PUSH_TIMEOUT_SECONDS,
+                                  limits=httpx.Limits(max_connections=PUSH_ORIGIN_CONNECTIONS))
+        for origin in {origin_of(s.endpoint) for s in subscriptions}
+    }
+    try:
+        responses = await asyncio.gather(*(
+            push_one(clients[origin_of(s.endpoint)], limit, s, msg) for s in subscriptions))
+    finally:
+        await asyncio.gather(*(client.aclose() for client in clients.values()))
+
+    outcome = {"sent": [], "expired": [], "retry": [], "failed": []}
+    wait = 0.0
+    for subscription, response in zip(subscriptions, responses):
+        code = response.status_code if response is not None else None
+        if code is not None and 200 <= code < 300:
+            outcome["sent"].append(subscription.endpoint)
+        elif code in EXPIRED:
+            outcome["expired"].append(subscription.endpoint)
+        elif code is None or code == 429 or code >= 500:
+            outcome["retry"].append(subscription.endpoint)
+            if response is not None:
+                wait = max(wait, retry_after(response))
+        else:
+            logger.warning("Push to %s rejected with %s", origin_of(subscription.endpoint), code)
+            outcome["failed"].append(subscription.endpoint)
+    return outcome, wait
+
+@celery_app.task(bind=True, max_retries=PUSH_MAX_RETRIES)
+def deliver_batch(self, user_ids: list[int], msg: str, endpoints: list[str] | None = None):
+    # `endpoints` narrows a retry down to the pushes that failed for a temporary reason
+    with Session(engine) as session:
+        devices = subscriptions_for_users(session, user_ids, endpoints)
+        subscriptions = [subscription for found in devices.values() for subscription in found]
+        if not subscriptions:
+            return {"sent": 0}
+
+        outcome, wait = asyncio.run(deliver(subscriptions, msg))
+        if outcome["expired"]:
+            session.exec(delete(PushSubscription).where(PushSubscription.endpoint.in_(outcome["expired"])))
+            session.commit()
+
+    if outcome["retry"] and self.request.retries < self.max_retries:
+        # a throttling push service says how long to back off, sooner would only be refused again
+        self.retry(kwargs={"user_ids": user_ids, "msg": msg, "endpoints": outcome["retry"]},
+                   countdown=max(30 * 2 ** self.request.retries, wait))
+    return {key: len(endpoints) for key, endpoints in outcome.items()}
+
+@celery_app.task()
+def fan_out_subscribers(creator_id: int, msg: str):
+    # reads the subscriber ids here so the request only enqueues one small message
+    last_id = 0
+    with Session(engine) as session:
+        while True:
+            rows = session.exec(
+                select(Subscription.id, Subscription.user_id)
+                .where(Subscription.creator_id == creator_id, Subscription.id > last_id)
+                .order_by(Subscription.id).limit(PUSH_BATCH_SIZE)).all()
+            if not rows:
+                break
+            deliver_batch.delay([user_id for _, user_id in rows], msg)
+            last_id = rows[-1][0]
@@ -1,45 +1,13 @@
-from fastapi import APIRouter, HTTPException, status
-from .sub import PushSubscription
-from pywebpush import webpush, WebPushException
-from oauth2.jwt_hashing import get_current_user
-from database.structure import get_session
-from sqlmodels.tables_schema import Users
-from sqlmodel import SQLModel, Session, select
 import asyncio
+from .delivery import deliver_batch, fan_out_subscribers
 
-with open("vapid_private.pem", 'r') as f:
-    VAPID_PRIVATE_KEY = f.read()
-    
-def send_push_notifications( session : Session,
-                            user_id : int, msg : str):
-    
-    query = session.exec(select(PushSubscription).where(PushSubscription.user_id == user_id)).first()
-    if not query:
-        raise HTTPException(status_code = status.HTTP_404_NOT_FOUND,
-                            detail = "user not found")
-    
-    subscription = {
-            'endpoint' : query.endpoint,
-            'keys' : {
-                'p256dh' : query.p256dh,
-                'auth' : query.auth
-            }
-        }    
-    
-    try:
-        webpush(
-            subscription_info = subscription,
-            data = msg,
-            vapid_private_key = VAPID_PRIVATE_KEY,
-            vapid_claims = {
-                'sub' : 'test@example.gmail.com'
-            }
-        )
-        
-    except WebPushException as ex:    
-        if ex.response is not None:
-            try:
-                extra = ex.response.json() # parsing the error msg into json
-                print(f"Remote service replied with {extra.get('code')}:{extra.get('errno')}, {extra.get('message')}")
-            except Exception:
-                print("Remote service replied but response body is not valid JSON")        
\ No newline at end of file
+def send_push_notifications(user_id : int, msg : str):
+    # only queues the push, the Celery workers encrypt and send it to every device of the user
+    deliver_batch.delay([user_id], msg)
+
+async def send_push_notifications_async(user_id : int, msg : str):
+    # .delay() is a blocking broker round trip, keep it off the event loop
+    await asyncio.to_thread(deliver_batch.delay, [user_id], msg)
+
+def notify_subscribers(creator_id : int, msg : str):
+    fan_out_subscribers.delay(creator_id, msg)
@@ -1,29 +1,66 @@
-from fastapi import APIRouter, Body, Depends
-from sqlmodel import SQLModel, Field, Session
+from collections import defaultdict
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlmodel import SQLModel, Field, Session, select
 from database.structure import get_session
+from database.counters import dialect_insert
+from oauth2.jwt_hashing import get_current_user
+from sqlmodels.tables_schema import Users
 
 class PushSubscription(SQLModel, table=True):
+    # one row per browser/device, a user can have several
     id : int | None = Field(default=None, primary_key=True)
-    user_id : int
-    endpoint : str
+    user_id : int = Field(index=True)
+    endpoint : str = Field(unique=True, index=True)
+    p256dh : str
+    auth : str
+
+class PushKeys(SQLModel):
     p256dh : str
     auth : str
-    
+
+class BrowserSubscription(SQLModel):
+    # PushSubscription.toJSON() of the browser, expirationTime is ignored
+    endpoint : str
+    keys : PushKeys
+
+class SubscribeBody(SQLModel):
+    subscribe : BrowserSubscription
+
+def upsert_subscription(session : Session, user_id : int, endpoint : str, p256dh : str, auth : str) -> bool:
+    """Stores the device or refreshes its keys, False when the endpoint belongs to another user."""
+    stmt = dialect_insert(session.get_bind().dialect.name)(PushSubscription).values(
+        user_id=user_id, endpoint=endpoint, p256dh=p256dh, auth=auth)
+    # the endpoint identifies the device, only its owner may change the keys
+    stmt = stmt.on_conflict_do_update(index_elements=["endpoint"], set_={
+        "p256dh": stmt.excluded.p256dh, "auth": stmt.excluded.auth},
+        where=PushSubscription.user_id == stmt.excluded.user_id)
+    return session.execute(stmt).rowcount > 0
+
+def subscriptions_for(session : Session, user_id : int) -> list[PushSubscription]:
+    return session.exec(select(PushSubscription).where(PushSubscription.user_id == user_id)).all()
+
+def subscriptions_for_users(session : Session, user_ids : list[int],
+                            endpoints : list[str] | None = None) -> dict[int, list[PushSubscription]]:
+    """Every device of every user in `user_ids`, resolved with one query."""
+    query = select(PushSubscription).where(PushSubscription.user_id.in_(user_ids))
+    if endpoints is not None:
+        query = query.where(PushSubscription.endpoint.in_(endpoints))
+    devices = defaultdict(list)
+    for subscription in session.exec(query).all():
+        devices[subscription.user_id].append(subscription)
+    return devices
+
 router = APIRouter()
 
 @router.post('/subscribe')
-def susbcribe(body = Body(),
-              session : Session = Depends(get_session)):    
-    
-    sub = body['subscribe']
-    obj = PushSubscription(
-        user_id = body.get('user_id'),
-        endpoint = sub['endpoint'],
-        p256dh = sub['keys']['p256dh'],
-        auth = sub['keys']['auth']
-    )
-    session.add(obj)
+def susbcribe(body : SubscribeBody,
+              session : Session = Depends(get_session),
+              current_user : Users = Depends(get_current_user())):
+
+    sub = body.subscribe
+    if not upsert_subscription(session, current_user.id, sub.endpoint, sub.keys.p256dh, sub.keys.auth):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail = "This device receives notifications for another account")
     session.commit()
-    session.refresh(obj)
-    
-    return {'message' : 'OK'}
\ No newline at end of file
+
+    return {'message' : 'OK'}
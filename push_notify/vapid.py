@@ -0,0 +1,49 @@
+import threading
+import time
+from decouple import config
+from py_vapid import Vapid
+
+VAPID_PRIVATE_KEY_FILE: str = config('VAPID_PRIVATE_KEY_FILE', cast=str, default='vapid_private.pem')
+VAPID_SUBJECT: str = config('VAPID_SUBJECT', cast=str, default='mailto:test@example.gmail.com')
+# push services reject tokens valid for more than 24h
+VAPID_TOKEN_TTL_SECONDS: int = config('VAPID_TOKEN_TTL_SECONDS', cast=int, default=12 * 3600)
+VAPID_REFRESH_MARGIN_SECONDS: int = config('VAPID_REFRESH_MARGIN_SECONDS', cast=int, default=600)
+
+class VapidSigner:
+    """Loads the VAPID key once and signs one token per push service origin.
+
+    The claims only depend on the origin, so a signed header is reused for every push to
+    that service until it gets close to its expiry.
+    """
+
+    def __init__(self, key_file: str = VAPID_PRIVATE_KEY_FILE, subject: str = VAPID_SUBJECT):
+        self.key_file = key_file
+        self.subject = subject
+        self.vapid: Vapid | None = None
+        self.headers: dict[str, tuple[float, dict]] = {}
+        self.lock = threading.Lock()
+        self.signed = 0
+
+    def load(self) -> Vapid:
+        if self.vapid is None:
+            self.vapid = Vapid.from_file(self.key_file)
+        return self.vapid
+
+    def headers_for(self, origin: str) -> dict:
+        now = time.time()
+        with self.lock:
+            cached = self.headers.get(origin)
+            if cached and cached[0] - VAPID_REFRESH_MARGIN_SECONDS > now:
+                return cached[1]
+            expires = int(now) + VAPID_TOKEN_TTL_SECONDS
+            headers = self.load().sign({"sub": self.subject, "aud": origin, "exp": expires})
+            self.headers[origin] = (expires, headers)
+            self.signed += 1
+            return headers
+
+    def clear(self) -> None:
+        with self.lock:
+            self.vapid = None
+            self.headers.clear()
+
+vapid_signer = VapidSigner()
@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Form
+from fastapi import APIRouter, Depends, HTTPException, status, Form, Request
+from fastapi.responses import StreamingResponse
 from oauth2.jwt_hashing import get_current_user
+from oauth2.principal_cache import principal_cache
+from oauth2.password_pool import pool_stats
+from database.rollups import rollup_report, GRANULARITIES
+from database.pagination import paginate
+from database.export import export_rows, EXPORTS, FORMATS
 from sqlmodels.tables_schema import Users, Videos, Reports, WacthVideos, Analytics, Subscription,LikesDislikes, Comments, Complain, Channels, Requests
 from sqlmodel import Session, select, func, desc
 from database.structure import get_session
 from datetime import timedelta, datetime
 from typing import Optional
-from ws_router.websockets import active_connections
-import asyncio
+from ws_router.bus import notification_bus
+from ws_router.registry import connection_registry
 from push_notify.push_func import send_push_notifications
 
 router = APIRouter(
@@ -14,30 +20,34 @@ router = APIRouter(
 )
 
 @router.get('/see_trending')
-def see_trending(session:Session = Depends(get_session), 
+def see_trending(start : datetime | None = None, end : datetime | None = None,
+                 granularity : str = "daily",
+                 session:Session = Depends(get_session), 
                  current_user : Users = Depends(get_current_user())):
     
-    query = (select(WacthVideos.video_id, func.count(WacthVideos.id).label("video_count")
-             ).group_by(WacthVideos.video_id).order_by(desc("video_count")
-                                                      ).limit(10))
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = f"granularity must be one of {list(GRANULARITIES)}")
     
-    result = session.exec(query).all()
-    video_id = [r.video_id for r in result]
-    trending_videos = session.exec(select(Videos).where(Videos.id.in_(video_id))).all()
+    result = rollup_report(session, granularity, start, end, order_by="views", limit=10)
+    views = {r["video_id"]: r["views"] for r in result}
+    trending_videos = sorted(session.exec(select(Videos).where(Videos.id.in_(views))).all(),
+                             key=lambda v: views[v.id], reverse=True)
     
     return trending_videos
     
     
 @router.get('/view_reports')
-def get_reports(session: Session = Depends(get_session),
+def get_reports(cursor : str | None = None, limit : int | None = None,
+                session: Session = Depends(get_session),
                 current_user : Users = Depends(get_current_user())):
     
-    query = session.exec(select(Reports)).all()
+    query, next_cursor = paginate(session, select(Reports), Reports.id, cursor, limit)
     if not query:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND,
                             detail = "No reports filed")
     
-    return query
+    return {'reports' : query, 'next_cursor' : next_cursor}
 
 #  APPLY NOTIFICATIONS
 @router.put('/ban_or_suspend_user')
@@ -60,19 +70,13 @@ async def perform_ban_suspension(user_id : int, ban : bool = False, suspended_da
       
     session.add(query)
     session.commit()
+    principal_cache.invalidate(query.id)
         
     state = "banned" if ban else "suspended"    
         
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                f"User has been {state}"
-            )
-        )    
+    notification_bus.publish(current_user.id, f"User has been {state}")
     
-    send_push_notifications(session, query.id, f"Your account has been {state} due to constant reports filed against you")
+    send_push_notifications(query.id, f"Your account has been {state} due to constant reports filed against you")
     
     return {'message' : 'User has been sanctioned'}    
 
@@ -90,16 +94,9 @@ async def delete_video(video_id : int,
     session.delete(query)
     session.commit()    
     
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                "Your report has been submitted successfully"
-            )
-        )
+    notification_bus.publish(current_user.id, "Your report has been submitted successfully")
 
-    send_push_notifications(session, query.creator_id, "Your video has been taken down as it didnt follow our platform's guidelines")
+    send_push_notifications(query.creator_id, "Your video has been taken down as it didnt follow our platform's guidelines")
     return {'message' : 'Video has been deleted'}
 
 #  APPLY NOTIFICATIONS
@@ -118,50 +115,60 @@ def copyright(video_id : int,
     session.add(query)
     session.commit()
 
-    send_push_notifications(session, query.creator_id, f"Your {query.title} video violates our copyright policies")
+    send_push_notifications(query.creator_id, f"Your {query.title} video violates our copyright policies")
 
     return {'message' : 'Video has been copyrighted'}
 
 
 @router.get('/view_analytics')
-def view_analytics(session: Session = Depends(get_session),
+def view_analytics(start : datetime | None = None, end : datetime | None = None,
+                   granularity : str = "daily", creator_id : int | None = None,
+                   session: Session = Depends(get_session),
                    current_user : Users = Depends(get_current_user())):    
+    
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = f"granularity must be one of {list(GRANULARITIES)}")
         
-    get_analytics = session.exec(select(Analytics)).all()
+    get_analytics = rollup_report(session, granularity, start, end, creator_id=creator_id)
     return {'analytics' : get_analytics}    
 
 
 @router.get('/view_users')
-def view_users(session: Session = Depends(get_session),
+def view_users(cursor : str | None = None, limit : int | None = None,
+               session: Session = Depends(get_session),
                    current_user : Users = Depends(get_current_user())):    
         
-    get_users = session.exec(select(Users).where(Users.role == "user")).all()
-    return {'users' : get_users}
+    get_users, next_cursor = paginate(session, select(Users).where(Users.role == "user"), Users.id, cursor, limit)
+    return {'users' : get_users, 'next_cursor' : next_cursor}
 
 
 @router.get('/view_creators')
-def view_creators(session: Session = Depends(get_session),
+def view_creators(cursor : str | None = None, limit : int | None = None,
+                  session: Session = Depends(get_session),
                   current_user : Users = Depends(get_current_user())):
     
-    get_creators = session.exec(select(Users).where(Users.role == "creator")).all()
-    return {'creators' : get_creators}
+    get_creators, next_cursor = paginate(session, select(Users).where(Users.role == "creator"), Users.id, cursor, limit)
+    return {'creators' : get_creators, 'next_cursor' : next_cursor}
 
 
 @router.get('/view_channels')
-def view_channels(session: Session = Depends(get_session),
+def view_channels(cursor : str | None = None, limit : int | None = None,
+                  session: Session = Depends(get_session),
                   current_user : Users = Depends(get_current_user())):
     
-    get_channels = session.exec(select(Channels)).all()
+    get_channels, next_cursor = paginate(session, select(Channels), Channels.id, cursor, limit)
     
-    return {'channels' : get_channels}
+    return {'channels' : get_channels, 'next_cursor' : next_cursor}
 
 
 @router.get('/see_complains')
-def see_complains(session: Session = Depends(get_session),
+def see_complains(cursor : str | None = None, limit : int | None = None,
+                  session: Session = Depends(get_session),
                   current_user : Users = Depends(get_current_user())):
     
-    get_complains = session.exec(select(Complain)).all()
-    return {'complains' : get_complains}
+    get_complains, next_cursor = paginate(session, select(Complain), Complain.id, cursor, limit)
+    return {'complains' : get_complains, 'next_cursor' : next_cursor}
 
 @router.put('/resolve_complain')
 def resolve_complain(complain_id : int, 
@@ -190,7 +197,7 @@ def take_action_on_reports(report_id : int, action : str = Form(...),
         raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST,
                             detail="Action is required")
 
-    send_push_notifications(session, report.reporter, "Required actions have been taken based on your report")
+    send_push_notifications(report.reporter, "Required actions have been taken based on your report")
 
     report.action_taken = action
     session.commit()
@@ -228,9 +235,10 @@ def approve_reject_request(request_id : int, approval : bool,
     request.is_accepted = True
     
     session.commit()
+    principal_cache.invalidate(request.user_id)
     
     state = "approved" if approval else "rejected"
-    send_push_notifications(session, request.user_id, f"Your request to become a creator has been {state}")    
+    send_push_notifications(request.user_id, f"Your request to become a creator has been {state}")    
     
     
     return {'message' : 'Request status updated'}
@@ -301,9 +309,52 @@ def end_video(video_id : int,
 
     return {"message": "Video ended"} 
 
-async def send_notification(email:str, message:str):
-    #print(f"Sending notification to {email}: {message}")
-    if email in active_connections:
-        await active_connections[email].send_json({
-            "message": message
-        })     
\ No newline at end of file
+@router.get('/export/{dataset}')
+def export(dataset : str, request : Request, format : str = "ndjson",
+           current_user : Users = Depends(get_current_user())):
+    
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = "You are not an admin")
+    if dataset not in EXPORTS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail = f"dataset must be one of {list(EXPORTS)}")
+    if format not in FORMATS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = f"format must be one of {list(FORMATS)}")
+    
+    compress = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {"Content-Disposition" : f'attachment; filename="{dataset}.{format}"'}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(export_rows(dataset, format, compress),
+                             media_type=FORMATS[format], headers=headers)
+
+@router.get('/auth_cache_stats')
+def auth_cache_stats(current_user : Users = Depends(get_current_user())):
+    
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = "You are not an admin")
+    
+    return principal_cache.stats()
+
+@router.get('/password_pool_stats')
+def password_pool_stats(current_user : Users = Depends(get_current_user())):
+    
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = "You are not an admin")
+    
+    return pool_stats()
+
+@router.get('/ws_stats')
+def ws_stats(current_user : Users = Depends(get_current_user())):
+    
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = "You are not an admin")
+    
+    # sockets of the worker that answered, not the whole deployment
+    return connection_registry.stats()
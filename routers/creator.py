@@ -1,17 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, Form, Request
 from oauth2.jwt_hashing import get_current_user
-from sqlmodels.tables_schema import Users, Videos, Reports, WacthVideos, Trending, UpdateVideo, Requests,Comments, Subscription, LikesDislikes, Analytics, Channels, Complain, History,SubscriptionLink, Notificaions
+from oauth2.principal_cache import principal_cache
+from sqlmodels.tables_schema import Users, Videos, Reports, WacthVideos, Trending, UpdateVideo, Requests,Comments, Subscription, LikesDislikes, Analytics, Channels, Complain, History,SubscriptionLink, Notificaions, UploadSessions, UploadParts, CompleteUpload
 from sqlmodel import Session, select, func, desc
-from database.structure import get_session
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from database.structure import get_session, get_async_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database.watch_buffer import watch_buffer
+from database.counters import bump_video, bump_creator, bump_video_async
+from database.rollups import rollup_report, GRANULARITIES, bump_engagement, bump_engagement_async
+from database.pagination import paginate
+from trending.index import trending_index
 from datetime import timedelta, datetime, date
 from typing import Optional
 import boto3
 import uuid
-from s3_worker.server import upload_to_s3
+from s3_worker.server import stream_to_s3, UploadCancelled, start_multipart, upload_part, complete_multipart, abort_multipart, presigned_post, presigned_part_urls, object_size, delete_object, S3_UPLOAD_PART_MB
 from s3_worker.worker import process_video
 import asyncio 
-from ws_router.websockets import active_connections
-from push_notify.push_func import send_push_notifications
+from ws_router.bus import notification_bus
+from push_notify.push_func import send_push_notifications, send_push_notifications_async, notify_subscribers
+from decouple import config
+
+UPLOAD_CHUNK_MAX_MB: int = config('UPLOAD_CHUNK_MAX_MB', cast=int, default=64)
+# Direct uploads up to this size use a single presigned POST, bigger ones presigned multipart
+PRESIGNED_POST_MAX_MB: int = config('PRESIGNED_POST_MAX_MB', cast=int, default=100)
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 minimum for every part but the last
 
 router = APIRouter(
     tags=['Creator']
@@ -19,23 +34,34 @@ router = APIRouter(
  
 @router.post('/upload_video')
 async def upload_video(
-                 file: UploadFile, session: Session = Depends(get_session),
+                 file: UploadFile, request: Request, session: Session = Depends(get_session),
                  title: str = Form(), description: str = Form(),
                  category: str = Form(), tags : str = Form(),
                  disable_comments : bool = Form(),
                  current_user : Users = Depends(get_current_user())):
-    
+    """
+    Only the S3 side streams: the form parser has already spooled the whole body to a temp
+    file (on disk past 1 MB) before this runs, and it is then sent on in S3_UPLOAD_PART_MB parts.
+    Large files should go through /uploads, which takes the video in resumable parts.
+    """
     if current_user.role != "creator":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are not a creator")
-    
+
+    async def report_progress(sent : int):
+        if file.size:
+            notification_bus.publish(current_user.id, f"Upload {sent * 100 // file.size}% complete")
+
     try:  
         file_name = file.filename.split(".")[-1] # automatically gets the name and extension i.e mp4
         unique_filename = f"{uuid.uuid4()}.{file_name}" # unique id and file name
         s3_key = f"uploads/{unique_filename}" # unique id and file name
-        # file.file is a file-like object also automatically provided by FastAPI
         bucket_name = "my-fastapi-videos"
-        public_url = upload_to_s3(file.file, s3_key, bucket=bucket_name, extra_args= {"ACL": "public-read"})
+        # parts go to S3 from a worker thread so the event loop keeps serving other requests
+        public_url = await stream_to_s3(file.read, s3_key, bucket=bucket_name,
+                                        extra_args= {"ACL": "public-read"},
+                                        on_progress=report_progress,
+                                        is_cancelled=request.is_disconnected)
         
         video = Videos(
             creator_id = current_user.id,
@@ -54,59 +80,360 @@ async def upload_video(
 
         process_video.delay(s3_key, bucket_name, video.id)
 
+    except UploadCancelled as e:
+        raise HTTPException(status_code=499, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=str(e))
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                "Your video has been uploaded successfully"
-            )
-        )    
-    subscribers = session.exec(select(Subscription).where(Subscription.creator_id == current_user.id)).all()
-    for sub in subscribers:
-        send_push_notifications(session, sub.user_id, f"{current_user.name} just uploaded a new video!")
+    announce_upload(session, current_user)
     
     return {
             "message": "Video processing started",
             "video_id": video.id
             }    
+
+def announce_upload(session : Session, current_user : Users):
+    notification_bus.publish(current_user.id, "Your video has been uploaded successfully")
+    notify_subscribers(current_user.id, f"{current_user.name} just uploaded a new video!")
+
+def get_upload_session(session : Session, upload_id : str, current_user : Users) -> UploadSessions:
+    upload = session.get(UploadSessions, upload_id)
+    if not upload or upload.creator_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail = "Upload session not found")
+    if upload.status != "open":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail = f"Upload session is already {upload.status}")
+    return upload
+
+def claim_upload(session : Session, upload : UploadSessions, state : str) -> None:
+    # conditional UPDATE, of two concurrent complete/abort calls only one moves the session on
+    claimed = session.execute(update(UploadSessions)
+                              .where(UploadSessions.id == upload.id, UploadSessions.status == "open")
+                              .values(status=state))
+    session.commit()
+    if claimed.rowcount == 0:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail = "Upload session is already being completed or aborted")
+    session.refresh(upload)
+
+def reopen_upload(session : Session, upload : UploadSessions) -> None:
+    upload.status = "open"
+    session.add(upload)
+    session.commit()
+
+def received_offset(parts : list[UploadParts]) -> int:
+    # bytes the client can safely skip: every part up to the first gap
+    offset = 0
+    for expected, part in enumerate(sorted(parts, key=lambda p: p.part_number), start=1):
+        if part.part_number != expected:
+            break
+        offset += part.size
+    return offset
+
+# Resumable uploads: create a session, PUT numbered chunks (each one S3 multipart part),
+# ask for the offset after a dropped connection, then complete to start processing
+@router.post('/uploads')
+async def create_upload(filename : str = Form(), size : int | None = Form(None),
+                        title: str = Form(), description: str = Form(),
+                        category: str = Form(), tags : str = Form(),
+                        disable_comments : bool = Form(),
+                        session: Session = Depends(get_session),
+                        current_user : Users = Depends(get_current_user())):
+
+    if current_user.role != "creator":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = "You are not a creator")
+
+    extension = filename.split(".")[-1]
+    s3_key = f"uploads/{uuid.uuid4()}.{extension}"
+    bucket_name = "my-fastapi-videos"
+    upload_id = await asyncio.to_thread(start_multipart, s3_key, bucket_name, {"ACL": "public-read"})
+
+    upload = UploadSessions(
+        id = str(uuid.uuid4()),
+        creator_id = current_user.id,
+        s3_key = s3_key,
+        upload_id = upload_id,
+        title = title,
+        description = description,
+        category = category,
+        tags = tags,
+        disable_comments = disable_comments,
+        size = size,
+        status = "open",
+        created_at = datetime.utcnow()
+    )
+    session.add(upload)
+    session.commit()
+
+    return {"upload_id" : upload.id, "chunk_size" : max(S3_UPLOAD_PART_MB, 5) * 1024 * 1024}
+
+@router.put('/uploads/{upload_id}/chunks/{part_number}')
+async def upload_chunk(upload_id : str, part_number : int, request: Request,
+                       session: Session = Depends(get_session),
+                       current_user : Users = Depends(get_current_user())):
+
+    upload = get_upload_session(session, upload_id, current_user)
+    if not upload.upload_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = "This upload goes straight to storage, use /upload_complete")
+    if not 1 <= part_number <= 10000:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = "Chunk number must be between 1 and 10000")
+
+    length = request.headers.get("content-length")
+    if length is None or int(length) > UPLOAD_CHUNK_MAX_MB * 1024 * 1024:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail = f"Chunks must declare a Content-Length of at most {UPLOAD_CHUNK_MAX_MB} MB")
+
+    body = await request.body()
+    etag = await asyncio.to_thread(upload_part, upload.s3_key, "my-fastapi-videos",
+                                   upload.upload_id, part_number, body)
+
+    # re-sending a chunk replaces the earlier attempt, same as S3 does with the part
+    part = session.get(UploadParts, (upload.id, part_number))
+    if not part:
+        part = UploadParts(session_id = upload.id, part_number = part_number)
+    part.etag = etag
+    part.size = len(body)
+    session.add(part)
+    session.commit()
+
+    parts = session.exec(select(UploadParts).where(UploadParts.session_id == upload.id)).all()
+    return {"part_number" : part_number, "offset" : received_offset(parts)}
+
+@router.get('/uploads/{upload_id}')
+def upload_status(upload_id : str,
+                  session: Session = Depends(get_session),
+                  current_user : Users = Depends(get_current_user())):
+
+    upload = get_upload_session(session, upload_id, current_user)
+    parts = session.exec(select(UploadParts).where(UploadParts.session_id == upload.id)).all()
+
+    return {
+        "upload_id" : upload.id,
+        "size" : upload.size,
+        "offset" : received_offset(parts),
+        "parts" : sorted(p.part_number for p in parts)
+    }
+
+@router.post('/uploads/{upload_id}/complete')
+async def complete_upload(upload_id : str,
+                          session: Session = Depends(get_session),
+                          current_user : Users = Depends(get_current_user())):
+
+    upload = get_upload_session(session, upload_id, current_user)
+    parts = sorted(session.exec(select(UploadParts).where(UploadParts.session_id == upload.id)).all(),
+                   key=lambda p: p.part_number)
+
+    if not parts or [p.part_number for p in parts] != list(range(1, len(parts) + 1)):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = "Some chunks are missing")
+    if any(p.size < MIN_PART_SIZE for p in parts[:-1]):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = "Every chunk except the last must be at least 5 MB")
+    if upload.size is not None and sum(p.size for p in parts) != upload.size:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = "Uploaded size does not match the announced size")
+
+    claim_upload(session, upload, "completing")
+    try:
+        public_url = await asyncio.to_thread(complete_multipart, upload.s3_key, "my-fastapi-videos",
+                                             upload.upload_id, [(p.part_number, p.etag) for p in parts])
+    except Exception:
+        reopen_upload(session, upload)
+        raise
+    video = finish_upload(session, upload, public_url, current_user)
+
+    return {
+            "message": "Video processing started",
+            "video_id": video.id
+            }
+
+def finish_upload(session : Session, upload : UploadSessions, public_url : str, current_user : Users) -> Videos:
+    # the video only exists once every byte is in S3
+    video = Videos(
+        creator_id = current_user.id,
+        original_url = public_url,
+        title = upload.title,
+        description = upload.description,
+        category = upload.category,
+        tags = upload.tags,
+        disable_comments = upload.disable_comments,
+        status = "processing"
+    )
+    session.add(video)
+    session.commit()
+    session.refresh(video)
+
+    upload.status = "completed"
+    upload.video_id = video.id
+    session.add(upload)
+    session.commit()
+
+    process_video.delay(upload.s3_key, "my-fastapi-videos", video.id)
+    announce_upload(session, current_user)
+    return video
+
+@router.delete('/uploads/{upload_id}')
+async def abort_upload(upload_id : str,
+                       session: Session = Depends(get_session),
+                       current_user : Users = Depends(get_current_user())):
+
+    upload = get_upload_session(session, upload_id, current_user)
+    claim_upload(session, upload, "aborted")
+    if upload.upload_id:
+        await asyncio.to_thread(abort_multipart, upload.s3_key, "my-fastapi-videos", upload.upload_id)
+    else:
+        # presigned POST sessions have no multipart upload, only maybe an object already
+        await asyncio.to_thread(delete_object, upload.s3_key, "my-fastapi-videos")
+
+    parts = session.exec(select(UploadParts).where(UploadParts.session_id == upload.id)).all()
+    for part in parts:
+        session.delete(part)
+    session.commit()
+
+    return {"message" : "Upload aborted"}
         
+# Direct-to-S3 uploads: the API only hands out presigned URLs and records metadata,
+# the bytes never pass through this process
+@router.post('/upload_url')
+async def create_presigned_upload(filename : str = Form(), size : int = Form(),
+                                  title: str = Form(), description: str = Form(),
+                                  category: str = Form(), tags : str = Form(),
+                                  disable_comments : bool = Form(),
+                                  session: Session = Depends(get_session),
+                                  current_user : Users = Depends(get_current_user())):
+
+    if current_user.role != "creator":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = "You are not a creator")
+    if size <= 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = "File size must be positive")
+
+    extension = filename.split(".")[-1]
+    s3_key = f"uploads/{uuid.uuid4()}.{extension}"
+    bucket_name = "my-fastapi-videos"
+
+    upload = UploadSessions(
+        id = str(uuid.uuid4()),
+        creator_id = current_user.id,
+        s3_key = s3_key,
+        title = title,
+        description = description,
+        category = category,
+        tags = tags,
+        disable_comments = disable_comments,
+        size = size,
+        status = "open",
+        created_at = datetime.utcnow()
+    )
+
+    if size <= PRESIGNED_POST_MAX_MB * 1024 * 1024:
+        post = await asyncio.to_thread(presigned_post, s3_key, bucket_name, size)
+        response = {"upload_id" : upload.id, "method" : "post", "post" : post}
+    else:
+        chunk_size = max(S3_UPLOAD_PART_MB, 5) * 1024 * 1024
+        part_count = -(-size // chunk_size)
+        if part_count > 10000:
+            chunk_size = -(-size // 10000)
+            part_count = -(-size // chunk_size)
+        upload.upload_id = await asyncio.to_thread(start_multipart, s3_key, bucket_name, {"ACL": "public-read"})
+        parts = await asyncio.to_thread(presigned_part_urls, s3_key, bucket_name, upload.upload_id, part_count)
+        response = {"upload_id" : upload.id, "method" : "multipart",
+                    "chunk_size" : chunk_size, "parts" : parts}
+
+    session.add(upload)
+    session.commit()
+    return response
+
+@router.post('/upload_complete')
+async def complete_presigned_upload(upload_id : str, body : CompleteUpload,
+                                    session: Session = Depends(get_session),
+                                    current_user : Users = Depends(get_current_user())):
+
+    upload = get_upload_session(session, upload_id, current_user)
+    bucket_name = "my-fastapi-videos"
+    if upload.upload_id and not body.parts:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = "Part ETags are required to complete a multipart upload")
+
+    claim_upload(session, upload, "completing")
+    try:
+        if upload.upload_id:
+            parts = sorted((p.part_number, p.etag) for p in body.parts)
+            public_url = await asyncio.to_thread(complete_multipart, upload.s3_key, bucket_name,
+                                                 upload.upload_id, parts)
+        else:
+            public_url = f"https://{bucket_name}.s3.amazonaws.com/{upload.s3_key}"
+
+        # trust S3, not the client, that the object is really there
+        size = await asyncio.to_thread(object_size, upload.s3_key, bucket_name)
+    except Exception:
+        reopen_upload(session, upload)
+        raise
+    if size is None:
+        reopen_upload(session, upload)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = "Upload not found in storage")
+    if size != upload.size:
+        # a completed multipart upload can't be resumed, the client starts a new session
+        await asyncio.to_thread(delete_object, upload.s3_key, bucket_name)
+        upload.status = "aborted"
+        session.add(upload)
+        session.commit()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = f"Uploaded {size} bytes but {upload.size} were announced")
+
+    video = finish_upload(session, upload, public_url, current_user)
+
+    return {
+            "message": "Video processing started",
+            "video_id": video.id
+            }
+
 @router.get('/my_videos')        
-def my_videos(session: Session = Depends(get_session),
+def my_videos(cursor : str | None = None, limit : int | None = None,
+              session: Session = Depends(get_session),
               current_user : Users = Depends(get_current_user())):
 
     if current_user.role != "creator":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are not a creator")
     
-    query = session.exec(select(Videos).where(Videos.creator_id == current_user.id)).all()
+    query, next_cursor = paginate(session, select(Videos).where(Videos.creator_id == current_user.id),
+                                  Videos.id, cursor, limit, descending=True)
     if not query:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND,
                             detail = "No videos uploaded yet")
         
-    return query
+    return {'videos' : query, 'next_cursor' : next_cursor}
 
 @router.get('/view_most_viewed')    
-def most_viewed(session: Session = Depends(get_session),
+def most_viewed(start : datetime | None = None, end : datetime | None = None,
+                granularity : str = "daily",
+                session: Session = Depends(get_session),
                 current_user : Users = Depends(get_current_user())):
 
     if current_user.role != "creator":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are not a creator")
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = f"granularity must be one of {list(GRANULARITIES)}")
     
-    first_query = session.exec(select(WacthVideos.creator_id, func.count(WacthVideos.id).label(
-        "view_count")).group_by(WacthVideos.creator_id).where(WacthVideos.creator_id == current_user.id
-        ).order_by(desc("view_count"))).all()
+    first_query = rollup_report(session, granularity, start, end, creator_id=current_user.id,
+                                order_by="views")
     
     if not first_query:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND,
                             detail = "No views yet")
     
-    creator_ids = [r.creator_id for r in first_query]
-    trending_videos = session.exec(select(Videos).where(Videos.creator_id.in_(creator_ids))).all()
+    views = {r["video_id"]: r["views"] for r in first_query}
+    videos = session.exec(select(Videos).where(Videos.id.in_(views))).all()
+    trending_videos = sorted(videos, key=lambda v: views[v.id], reverse=True)
     
     return trending_videos
     
@@ -157,19 +484,12 @@ async def delete_video(video_id : int,
         
     session.commit()
     
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                "Your video has been deleted successfully"
-            )
-        )
+    notification_bus.publish(current_user.id, "Your video has been deleted successfully")
     return {'message' : 'Video deleted successfully'}
 
 @router.post('//creator/play_video')
-def play_video(video_id : int, 
-               session: Session = Depends(get_session),
+async def play_video(video_id : int, 
+               session: AsyncSession = Depends(get_async_session),
                current_user : Users = Depends(get_current_user())):
     
     if current_user.role != "creator":
@@ -177,16 +497,17 @@ def play_video(video_id : int,
                             detail = "You are not a creator")
     timestamp = datetime.utcnow()
     
-    video = session.get(Videos, video_id)
+    video = await session.get(Videos, video_id)
     if not video or video.status != "available":
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Video not found or not available")
         
-    query = session.exec(select(WacthVideos).where(WacthVideos.video_id == video_id, 
+    watch = (await session.exec(select(WacthVideos).where(WacthVideos.video_id == video_id, 
                                        WacthVideos.creator_id == video.creator_id,
-                                       WacthVideos.user_id == current_user.id)).first()  
-    
-    if not query:  
+                                       WacthVideos.user_id == current_user.id))).first()  
+    # an existing row belongs to the watch buffer, its clock restarts through a "play" event
+    replayed = watch is not None
+    if not watch:  
         watch = WacthVideos(
             video_id = video_id,
             creator_id = video.creator_id,
@@ -197,8 +518,7 @@ def play_video(video_id : int,
             duration = 0
         )
         session.add(watch)    
-        session.refresh(watch)
-        
+    
     store_history = History(
         video_id = video_id,
         video_url = video.original_url,
@@ -207,56 +527,37 @@ def play_video(video_id : int,
     )
     session.add(store_history)
     
-    analytics = session.exec(select(Analytics).where(Analytics.video_id == video_id)).first() 
-    if analytics:
-        analytics.views += 1   
-        
-    engagement = Analytics(
-        video_id = video_id,
-        creator_id = video.creator_id,
-        likes = 0,
-        dislikes = 0,
-        comments = 0,
-        watch_time = 0
-        )
-    if watch is not None:
-        engagement.views += 1
-        
-    session.add(engagement)
-    session.refresh(engagement)
-    session.commit()
-
+    await bump_video_async(session, video_id, video.creator_id, views=1)
+    await session.commit()
+    watch_buffer.remember(watch.id)
+    if replayed:
+        watch_buffer.record(watch.id, "play", timestamp)
+    trending_index.record_view(video_id)
     
     return {"message": f"Video started", "watch_id" : watch.id}
 
 @router.post('/creator/pause_video')
-def pause_video(watch_id : int, 
-               session: Session = Depends(get_session),
+async def pause_video(watch_id : int, 
+               session: AsyncSession = Depends(get_async_session),
                current_user : Users = Depends(get_current_user())):
       
     if current_user.role != "creator":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                            detail = "You are not a creator")     
+                            detail = "You are not a creator")      
       
     timestamp = datetime.utcnow()  
-    watch = session.get(WacthVideos, watch_id)
-    
-    if not watch:
+    if not await watch_buffer.exists(session, watch_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Watch session not found")
 
-    delta = (timestamp - watch.last_stop).total_seconds()
-    watch.duration += int(delta)
-    watch.last_stop = None
-        
-    session.commit()
+    watch_buffer.record(watch_id, "pause", timestamp)
 
     
     return {"message": "Video paused"} 
         
 @router.post('/creator/resume_video')
-def resume_video(watch_id : int, 
-               session: Session = Depends(get_session),
+async def resume_video(watch_id : int, 
+               session: AsyncSession = Depends(get_async_session),
                current_user : Users = Depends(get_current_user())):
 
     if current_user.role != "creator":
@@ -265,44 +566,31 @@ def resume_video(watch_id : int,
 
     timestamp = datetime.utcnow()  
     
-    watch = session.get(WacthVideos, watch_id)
-    
-    if not watch :
+    if not await watch_buffer.exists(session, watch_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Watch session not found")
 
-    watch.last_stop = timestamp
- 
-    session.commit()    
+    watch_buffer.record(watch_id, "resume", timestamp)
     
     return {"message": "Video resumed"}  
     
 @router.post('/creator/end_video')
-def end_video(watch_id : int,
-               session: Session = Depends(get_session),
+async def end_video(watch_id : int,
+               session: AsyncSession = Depends(get_async_session),
                current_user : Users = Depends(get_current_user())):
       
     if current_user.role != "creator":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                            detail = "You are not a creator")
-        
+                            detail = "You are not a creator")      
+      
     timestamp = datetime.utcnow()  
     
-    watch = session.get(WacthVideos, watch_id)
-    
-    if not watch :
+    if not await watch_buffer.exists(session, watch_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Watch session not found")
 
-    delta = (timestamp - watch.last_stop).total_seconds()
-    watch.duration += int(delta)
-    watch.end_time = timestamp
-    
-    analytics = session.exec(select(Analytics).where(Analytics.video_id == watch.video_id)).first()
-    if analytics:
-        analytics.watch_time += watch.duration
-    
-    session.commit()
+    # duration and the video's watch time are added when the buffer flushes
+    watch_buffer.record(watch_id, "end", timestamp)
 
     return {"message": "Video ended"} 
 
@@ -315,40 +603,30 @@ async def subscribe(creator_id : int,
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are not a creator")
 
-    query = session.exec(select(Channels).where(Channels.user_id == creator_id)).first()
+    query = session.exec(select(Channels).where(Channels.creator_id == creator_id)).first()
+    if not query:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail = "No creator or channel found")
         
-    if query:
-        subscribe = Subscription(
-            user_id = current_user.id,
-            creator_id = creator_id,
-            notifications = True
-        )
-        session.add(subscribe)
-        session.refresh(subscribe)
-        link = SubscriptionLink(
-            subsription_id = subscribe.id,
-            user_id = current_user.id
-        )
-        session.add(link)
-        session.refresh(link)
-    
-    engagement = Analytics(
-        creator_id = creator_id
-    )    
-    if subscribe:
-        engagement.subscribers += 1
+    subscribe = Subscription(
+        user_id = current_user.id,
+        creator_id = creator_id,
+        notifications = True
+    )
+    session.add(subscribe)
+    session.flush()  # assigns subscribe.id for the link
+    link = SubscriptionLink(
+        subsription_id = subscribe.id,
+        user_id = current_user.id
+    )
+    session.add(link)
+    
+    bump_creator(session, creator_id, subscription=1)
     session.commit()
     
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                f"Subscribed to {query.name}"
-            )
-        )
+    notification_bus.publish(current_user.id, f"Subscribed to {query.name}")
     
-    send_push_notifications(session, query.user_id, f"{current_user.name} just subscribed to you")
+    send_push_notifications(query.creator_id, f"{current_user.name} just subscribed to you")
         
     return {'message' : f'Subscribed to {query.name} successfully'}
 
@@ -363,25 +641,18 @@ async def unsubscribe(creator_id : int,
     
     query = session.exec(select(Subscription).where(Subscription.creator_id == creator_id,
                             Subscription.user_id == current_user.id)).first()
-    engagement = session.exec(select(Analytics).where(Analytics.creator_id == creator_id)).first()
     
-    if not query and engagement:
+    if not query:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Subscription not found")
         
     session.delete(query)
+    bump_creator(session, creator_id, subscription=-1)
     session.commit()
-    if engagement.subscribers > 0:
-        engagement.subscribers -= 1
-    
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                f"Unsubscribed to {query.name}"
-            )
-        )
+    
+    channel = session.exec(select(Channels).where(Channels.creator_id == creator_id)).first()
+    if channel:
+        notification_bus.publish(current_user.id, f"Unsubscribed to {channel.name}")
     
     return {'message' : 'Unsubscribed successfully'}    
         
@@ -404,27 +675,20 @@ async def turn_off_notifications(creator_id : int, notify : bool = False,
     session.add(query)
     session.commit()
     
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                "Notifications turned off"
-            )
-        )
+    notification_bus.publish(current_user.id, "Notifications turned off")
     
     return {'message' : 'Notification preference updated successfully'}
 
 @router.get('/get_notifications')
-def get_notifications(session: Session = Depends(get_session),
+async def get_notifications(session: AsyncSession = Depends(get_async_session),
                         current_user : Users = Depends(get_current_user())):
 
     if current_user.role != "creator":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are not a creator")
 
-    query = session.exec(select(Notificaions).where(Notificaions.user_id == current_user.id,
-                                                    Notificaions.is_read == False)).all()
+    query = (await session.exec(select(Notificaions).where(Notificaions.user_id == current_user.id,
+                                                    Notificaions.is_read == False))).all()
     if not query:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "No new notifications")
@@ -433,19 +697,20 @@ def get_notifications(session: Session = Depends(get_session),
         notify.is_read = True
         session.add(notify)
         
-    session.commit()
+    await session.commit()
+    
     return {'notifications' : query}
     
 @router.post('/comment')
-def post_comment(video_id : int, text : str = Form(),
-                 session: Session = Depends(get_session),
+async def post_comment(video_id : int, text : str = Form(),
+                 session: AsyncSession = Depends(get_async_session),
                  current_user : Users = Depends(get_current_user())):
 
     if current_user.role != "creator":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are not a creator")
 
-    video = session.get(Videos, video_id)
+    video = await session.get(Videos, video_id)
     if not video or video.status != "available":
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Video not found or not available")
@@ -463,21 +728,11 @@ def post_comment(video_id : int, text : str = Form(),
         created_at = date.today()
     )
     session.add(comment)
-    session.refresh(comment)
     
-    engagement = Analytics(
-        video_id = video_id,
-        creator_id = video.creator_id
-    )
-    if comment is not None:
-        engagement.comments += 1
-    
-    session.add(engagement)
+    await bump_engagement_async(session, video_id, video.creator_id, comments=1)
 
-    session.commit()
-    
-    send_push_notifications(session, video.creator_id, f"{current_user.name} just commented on your video")    
-    
+    await session.commit()
+    await send_push_notifications_async(video.creator_id, f"{current_user.name} just commented on your video")
     return {'message' : 'Comment posted successfully'}    
 
 @router.post('/reply_comment')
@@ -508,22 +763,17 @@ def reply_comment(video_id : int, parent_comment_id : int,
     created_at = date.today()
     )
     session.add(comment)
+    session.flush()
     session.refresh(comment)
 
-    engagement = Analytics(
-    video_id = video_id,
-    creator_id = comments.creator_id
-    )
-    if query is not None:
-        engagement.comments += 1
+    bump_engagement(session, video_id, comments.creator_id, comments=1)
     
-    send_push_notifications(session, query.user_id, f"{current_user.name} just replied to your comment")
+    send_push_notifications(query.user_id, f"{current_user.name} just replied to your comment")
     session.commit()
     return {'message' : 'Reply posted successfully'}
 
 @router.delete('/delete_comment')
-async def delete_comment(comment_id : int, creator_id : int,
-                   video_id,
+async def delete_comment(comment_id : int,
                    session: Session = Depends(get_session),
                    current_user : Users = Depends(get_current_user())):
 
@@ -532,25 +782,19 @@ async def delete_comment(comment_id : int, creator_id : int,
                             detail = "You are not a creator")
         
         
-    engagement = session.exec(select(Analytics).where(Analytics.video_id == video_id,
-                            Analytics.creator_id == creator_id)).first() 
     comment = session.get(Comments, comment_id)
     if not comment:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Comment not found")
       
-    session.delete(comment)
+    video = session.get(Videos, comment.video_id)
 
+    # read the replies first, deleting the parent would null their parent_comment_id on flush
     comment_replies = session.exec(select(Comments).where(Comments.parent_comment_id == comment_id)).all()
+    session.delete(comment)
     delete_count = 1 + len(comment_replies) # if no parent len is 0 count is 1
     
-    try:
-        if engagement.comments >= delete_count:       
-            engagement.comments -= delete_count 
-        else:
-            raise ValueError("Engagement comments are zero or less than delete count")
-    except ValueError as e: 
-        print(f"Error: {e}")  
+    bump_engagement(session, comment.video_id, video.creator_id, comments=-delete_count)
         
     for reply in comment_replies: # deleting all replies from comments table
             session.delete(reply)     
@@ -587,17 +831,10 @@ async def report_video(video_id : int, report : str = Form(),
     session.commit()
     session.refresh(report)
     
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                "Your report has been submitted successfully"
-            )
-        )
+    notification_bus.publish(current_user.id, "Your report has been submitted successfully")
     
     for x in query:
-            send_push_notifications(session, query.user_id, f"{current_user.name} just submitted  report")
+            send_push_notifications(query.user_id, f"{current_user.name} just submitted  report")
         
     return {'message' : 'Video reported successfully'}
 
@@ -632,22 +869,15 @@ async def report_comment(
      session.commit()
      session.refresh(report)
      
-     email = current_user.email
-     if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                "Your report has been submitted successfully"
-            )
-        )
+     notification_bus.publish(current_user.id, "Your report has been submitted successfully")
      for admin in admins:
-            send_push_notifications(session, admin.user_id, f"{current_user.name} just submitted  report")
+            send_push_notifications(admin.user_id, f"{current_user.name} just submitted  report")
      return {'message' : 'Comment reported successfully'}
  
     
 @router.post('/like_dislike') 
-def like_dislike(video_id : int, is_like : bool | None ,
-                 session: Session = Depends(get_session),
+async def like_dislike(video_id : int, is_like : bool | None ,
+                 session: AsyncSession = Depends(get_async_session),
                  current_user : Users = Depends(get_current_user())):
     
     if current_user.role != "creator":
@@ -658,21 +888,13 @@ def like_dislike(video_id : int, is_like : bool | None ,
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are already a creator")    
     
-    video = session.get(Videos, video_id)
+    video = await session.get(Videos, video_id)
     if not video or video.status != "available":
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Video either removed or unavailable") 
     
-    analytics = session.exec(select(Analytics).where(Analytics.video_id == video_id)).first()
-    if not analytics:
-        analytics = Analytics(
-        video_id = video_id,
-        creator_id = video.creator_id
-        )
-        session.add(analytics)
-        
-    confirmation = session.exec(select(LikesDislikes).where(LikesDislikes.video_id == video_id,
-                                LikesDislikes.user_id == current_user.id)).first()
+    confirmation = (await session.exec(select(LikesDislikes).where(LikesDislikes.video_id == video_id,
+                                LikesDislikes.user_id == current_user.id))).first()
     
     if not confirmation:
         reaction = LikesDislikes(
@@ -682,50 +904,55 @@ def like_dislike(video_id : int, is_like : bool | None ,
         )
         
         if is_like:
-            analytics.likes += 1
+            await bump_engagement_async(session, video_id, video.creator_id, likes=1)
         else:
-            analytics.dislikes += 1    
+            await bump_engagement_async(session, video_id, video.creator_id, dislikes=1)
             
         session.add(reaction)
 
     else:
         if confirmation.is_like != is_like:
             if is_like:
-                analytics.likes += 1
-                analytics.dislikes -= 1
+                await bump_engagement_async(session, video_id, video.creator_id, likes=1, dislikes=-1)
             else:
-                analytics.dislikes += 1
-                analytics.likes -= 1
+                await bump_engagement_async(session, video_id, video.creator_id, likes=-1, dislikes=1)
 
             confirmation.is_like = is_like        
              
-    session.commit()       
+    try:
+        await session.commit()
+    except IntegrityError:
+        # the same user's concurrent request inserted the reaction first, redo it as a flip
+        await session.rollback()
+        return await like_dislike(video_id, is_like, session, current_user)       
     
     # no option for None i.e no like or dislike
     state = "liked" if is_like else "disliked"
     
-    send_push_notifications(session, video.creator_id, f"{current_user.name} just {state} your video")
+    await send_push_notifications_async(video.creator_id, f"{current_user.name} just {state} your video")
     return {'message' : f'Video {state} successfully'}
 
 
 @router.get('/liked_videos')
-def liked_videos(session: Session = Depends(get_session),
+def liked_videos(cursor : str | None = None, limit : int | None = None,
+                session: Session = Depends(get_session),
                 current_user : Users = Depends(get_current_user())):
         
     if current_user.role != "creator":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are not a creator")       
         
-    liked = session.exec(select(LikesDislikes).where(LikesDislikes.user_id == current_user.id,
-                            LikesDislikes.is_like == True)).all()
+    liked, next_cursor = paginate(session, select(LikesDislikes).where(LikesDislikes.user_id == current_user.id,
+                            LikesDislikes.is_like == True), LikesDislikes.id, cursor, limit, descending=True)
     if not liked:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail= "No liked videos found")
         
     liked_videos_id = [l.video_id for l in liked]     
         
-    liked_videos = session.exec(select(Videos).where(Videos.id.in_(liked_videos_id))).all()
-    return {'liked_videos' : liked_videos}
+    videos = {v.id: v for v in session.exec(select(Videos).where(Videos.id.in_(liked_videos_id))).all()}
+    liked_videos = [videos[i] for i in liked_videos_id if i in videos]
+    return {'liked_videos' : liked_videos, 'next_cursor' : next_cursor}
     
    
 @router.get('/your_subscribtions')    
@@ -774,7 +1001,7 @@ def like_dislike_comment(comment_id : int, is_like : bool,
     session.commit()
     state = "liked" if is_like else "disliked"
     
-    send_push_notifications(session, comment.user_id, f"{current_user.name} just {state} your comment")
+    send_push_notifications(comment.user_id, f"{current_user.name} just {state} your comment")
     
     return {'message' : f'Comment {state} successfully'}
 
@@ -803,17 +1030,10 @@ async def file_a_complaint(subject : str = Form(),
     session.commit()
     session.refresh(complain)
     
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                "Your complain has been submitted successfully. We will get back to you shortly"
-            )
-        )
+    notification_bus.publish(current_user.id, "Your complain has been submitted successfully. We will get back to you shortly")
     
     for admin in admins:
-        send_push_notifications(session, admin.user_id, f"{current_user.name} just filed a complaint")
+        send_push_notifications(admin.user_id, f"{current_user.name} just filed a complaint")
     
     return {'message' : 'Your complaint has been filed successfully, we will get back to you soon.'}
 
@@ -852,46 +1072,47 @@ async def toggle_comments(video_id : int,
     session.commit()
     state = "enabled" if enable else "disabled"
     
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                f"Comments have been {state} for your video"
-            )
-        )
+    notification_bus.publish(current_user.id, f"Comments have been {state} for your video")
     
     return {"message": f"Comments {state} for this video"}
 
 @router.get('/get_subscribers')
-def get_subscribers(session: Session = Depends(get_session),
+def get_subscribers(cursor : str | None = None, limit : int | None = None,
+                    session: Session = Depends(get_session),
                     current_user : Users = Depends(get_current_user())):
     
     if current_user.role != "creator":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are not a creator")    
     
-    query = session.exec(select(Subscription).where(Subscription.creator_id == current_user.id)).all()
+    query, next_cursor = paginate(session, select(Subscription).where(Subscription.creator_id == current_user.id),
+                                  Subscription.id, cursor, limit, descending=True)
     if not query:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND,
                             detail = "No subscribers found")
     
     subscribers_id = [s.user_id for s in query]    
-    subscribers = session.exec(select(Users).where(Users.id.in_(subscribers_id))).all()
+    subscribers = session.exec(select(Users.name).where(Users.id.in_(subscribers_id))).all()
+    total = session.exec(select(func.count()).select_from(Subscription)
+                         .where(Subscription.creator_id == current_user.id)).one()
     
-    return {"subscribed accounts" : subscribers.name, "total_subscribers" : len(subscribers)}
+    return {"subscribed accounts" : subscribers, "total_subscribers" : total, "next_cursor" : next_cursor}
 
     
 @router.get('/analytics')  
-def analytics(
+def analytics(start : datetime | None = None, end : datetime | None = None,
+                granularity : str = "daily",
                 session: Session = Depends(get_session),
                 current_user : Users = Depends(get_current_user())):
     
     if current_user.role != "creator":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are not a creator")
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail = f"granularity must be one of {list(GRANULARITIES)}")
         
-    get_analytics = session.exec(select(Analytics).where(Analytics.creator_id == current_user.id)).all()
+    get_analytics = rollup_report(session, granularity, start, end, creator_id=current_user.id)
     
     if not get_analytics:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND,
@@ -900,19 +1121,21 @@ def analytics(
     return {'analytics' : get_analytics}
 
 @router.get('/see_history')
-def see_history(session: Session = Depends(get_session),
+def see_history(cursor : str | None = None, limit : int | None = None,
+                session: Session = Depends(get_session),
                  current_user : Users = Depends(get_current_user())):
     
     if current_user.role != "creator":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are not a creator")
         
-    history = session.exec(select(History).where(History.user_id == current_user.id)).all()
+    history, next_cursor = paginate(session, select(History).where(History.user_id == current_user.id),
+                                    History.id, cursor, limit, descending=True)
     if not history:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND,
                             detail = "No history found")
         
-    return {'history' : history}
+    return {'history' : history, 'next_cursor' : next_cursor}
 
 # delete account & history
 @router.delete('/delete_creator_account')
@@ -949,15 +1172,9 @@ async def delete_account(
         
     session.delete(user)
     session.commit()
+    principal_cache.invalidate(current_user.id)
     
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                "Your account has been deleted"
-            )
-        )
+    notification_bus.publish(current_user.id, "Your account has been deleted")
     return {'message' : 'Account deleted'}
 
 
@@ -974,14 +1191,7 @@ async def delete_history(
     session.delete(history)
     session.commit()
     
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                "Your history has been deleted"
-            )
-        )
+    notification_bus.publish(current_user.id, "Your history has been deleted")
     
     return {'message' : 'history deleted successfully'}   
 
@@ -992,9 +1202,3 @@ def see_your_trending_videos(
     
     query = session.exec(select(Trending).where(Trending.creator_id == current_user.id))
 
-async def send_notification(email:str, message:str):
-    #print(f"Sending notification to {email}: {message}")
-    if email in active_connections:
-        await active_connections[email].send_json({
-            "message": message
-        })        
\ No newline at end of file
@@ -2,11 +2,13 @@ from fastapi import APIRouter
 from datetime import timedelta
 from sqlmodel import SQLModel
 from typing import Annotated
-from database.structure import get_session
+from database.structure import get_session, get_async_session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlmodels.tables_schema import Users, UserInput, UserLogin, ForgetPassword
-from oauth2.jwt_hashing import create_access_token, hash_password, check_hashed_password, get_current_user
+from oauth2.jwt_hashing import create_access_token, get_current_user
+from oauth2.password_pool import hash_password_async, check_hashed_password_async
 from sqlmodel import Session, select
 from email.mime.text import MIMEText
 import smtplib
@@ -19,10 +21,10 @@ router = APIRouter(
 
 # signup router
 @router.post('/user_signup')
-def create_account(user : UserInput,
-             session : Session = Depends(get_session)):
+async def create_account(user : UserInput,
+             session : AsyncSession = Depends(get_async_session)):
     
-    query = session.exec(select(Users).where(Users.email == user.email)).first()
+    query = (await session.exec(select(Users).where(Users.email == user.email))).first()
     if query:
         raise HTTPException(status_code=status.HTTP_302_FOUND,
                             detail = "Email already taken use a different one")
@@ -30,28 +32,28 @@ def create_account(user : UserInput,
         name = user.name,
         #role = "user",
         email = user.email,
-        password = hash_password(user.password),
+        password = await hash_password_async(user.password),
         created_at = date.today()
     )    
     session.add(new_user)
-    session.commit()
-    session.refresh(new_user)
+    await session.commit()
+    await session.refresh(new_user)
     return {'message' : 'Account succesfully created!'}
 
 # login router
 @router.post('/user_login')
-def acc_login(user :UserLogin,
-              session: Session = Depends(get_session)):
+async def acc_login(user :UserLogin,
+              session: AsyncSession = Depends(get_async_session)):
     
-    query = session.exec(select(Users).where(Users.email == user.email)).first()
+    query = (await session.exec(select(Users).where(Users.email == user.email))).first()
         
-    if query.email !=  user.email:
+    if not query or query.email !=  user.email:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Wrong email",
                             headers={"WWW-Authenticate": "Bearer"}
                     )
         
-    if not check_hashed_password(user.password, query.password):
+    if not await check_hashed_password_async(user.password, query.password):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Invalid password") 
      
@@ -102,25 +104,25 @@ def generate_otp(email : str, session: Session = Depends(get_session)):
   
 # Updating password      
 @router.post('/update_password')
-def update_password(user : ForgetPassword,
-                    session: Session = Depends(get_session)):
+async def update_password(user : ForgetPassword,
+                    session: AsyncSession = Depends(get_async_session)):
     query = select(Users).where(Users.otp_code == user.otp_code)
-    user_obj = session.exec(query).first()
+    user_obj = (await session.exec(query)).first()
     
     if user_obj is not None:
        
         if datetime.utcnow() > user_obj.otp_created_at + timedelta(minutes=2):
             user_obj.otp_code = None
             user_obj.otp_created_at = None
-            session.commit()
+            await session.commit()
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="OTP expired, please request a new one") 
         else:
-            user_obj.password = hash_password(user.password)
+            user_obj.password = await hash_password_async(user.password)
             user_obj.otp_code = None
             user_obj.otp_created_at = None
-            session.commit()
+            await session.commit()
             return {"message" : "Password changed successfully"}
          
     else: 
@@ -1,13 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, Form, Request, Response
+from fastapi.responses import JSONResponse
 from oauth2.jwt_hashing import get_current_user
+from oauth2.principal_cache import principal_cache
 from sqlmodels.tables_schema import Users, Videos, Reports, UpdateVideo,Trending, Comments, Requests,WacthVideos, History,Subscription, SubscriptionLink, Notificaions, LikesDislikes, Analytics, Channels, Complain
 from sqlmodel import Session, select, func, desc, delete
-from database.structure import get_session
+from sqlalchemy.exc import IntegrityError
+from database.structure import get_session, get_async_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database.watch_buffer import watch_buffer
+from database.counters import bump_video, bump_creator, bump_video_async
+from database.rollups import bump_engagement, bump_engagement_async
+from trending.index import trending_index, TRENDING_CACHE_SECONDS
+from database.pagination import paginate, page_size, encode_cursor, decode_cursor
 from datetime import timedelta, datetime, date
 from typing import Optional
-from ws_router.websockets import active_connections
-import asyncio
-from push_notify.push_func import send_push_notifications
+from ws_router.bus import notification_bus
+from push_notify.push_func import send_push_notifications, send_push_notifications_async
 
 router = APIRouter(
     tags=['User']
@@ -35,14 +43,7 @@ async def become_a_creator(description : str = Form(...),
     session.commit()
     session.refresh(create_request)
     
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                "Your request has been sent you will be notified soon. Thankyou!"
-            )
-        )
+    notification_bus.publish(current_user.id, "Your request has been sent you will be notified soon. Thankyou!")
     
     return {
     'message' : 'Your request to become a creator has been submitted for review,You will be notified.'}
@@ -78,22 +79,16 @@ async def create_channel(channel_name : str = Form(...), content_type : str = Fo
 
     session.add(create_channel)
     session.commit()
+    principal_cache.invalidate(current_user.id)
     session.refresh(create_channel)
     
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                "Congratulations you have officially created your channel"
-            )
-        )
+    notification_bus.publish(current_user.id, "Congratulations you have officially created your channel")
     
     return {'message' : 'Channel created successfully'}    
 
 @router.post('/user/play_video')
 async def play_video(video_id : int, 
-               session: Session = Depends(get_session),
+               session: AsyncSession = Depends(get_async_session),
                current_user : Users = Depends(get_current_user())):
     
     if current_user.role != "user":
@@ -101,16 +96,17 @@ async def play_video(video_id : int,
                             detail = "You are already a creator")
     timestamp = datetime.utcnow()
     
-    video = session.get(Videos, video_id)
+    video = await session.get(Videos, video_id)
     if not video or video.status != "available":
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Video not found or not available")
         
-    query = session.exec(select(WacthVideos).where(WacthVideos.video_id == video_id, 
+    watch = (await session.exec(select(WacthVideos).where(WacthVideos.video_id == video_id, 
                                        WacthVideos.creator_id == video.creator_id,
-                                       WacthVideos.user_id == current_user.id)).first()  
-       
-    if not query:  
+                                       WacthVideos.user_id == current_user.id))).first()  
+    # an existing row belongs to the watch buffer, its clock restarts through a "play" event
+    replayed = watch is not None
+    if not watch:  
         watch = WacthVideos(
             video_id = video_id,
             creator_id = video.creator_id,
@@ -121,7 +117,6 @@ async def play_video(video_id : int,
             duration = 0
         )
         session.add(watch)    
-        session.refresh(watch)
     
     store_history = History(
         video_id = video_id,
@@ -131,31 +126,18 @@ async def play_video(video_id : int,
     )
     session.add(store_history)
     
-    analytics = session.exec(select(Analytics).where(Analytics.video_id == video_id)).first() 
-    if analytics:
-        analytics.views += 1   
-        
-    engagement = Analytics(
-        video_id = video_id,
-        creator_id = video.creator_id,
-        likes = 0,
-        dislikes = 0,
-        comments = 0,
-        watch_time = 0
-        )
-    if watch is not None:
-        engagement.views += 1
-        
-    session.add(engagement)
-    session.refresh(engagement)
-    session.commit()
-
+    await bump_video_async(session, video_id, video.creator_id, views=1)
+    await session.commit()
+    watch_buffer.remember(watch.id)
+    if replayed:
+        watch_buffer.record(watch.id, "play", timestamp)
+    trending_index.record_view(video_id)
     
     return {"message": f"Video started", "watch_id" : watch.id}
 
 @router.post('/user/pause_video')
 async def pause_video(watch_id : int, 
-               session: Session = Depends(get_session),
+               session: AsyncSession = Depends(get_async_session),
                current_user : Users = Depends(get_current_user())):
       
     if current_user.role != "user":
@@ -163,24 +145,18 @@ async def pause_video(watch_id : int,
                             detail = "You are already a creator")      
       
     timestamp = datetime.utcnow()  
-    watch = session.get(WacthVideos, watch_id)
-    
-    if not watch:
+    if not await watch_buffer.exists(session, watch_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Watch session not found")
 
-    delta = (timestamp - watch.last_stop).total_seconds()
-    watch.duration += int(delta)
-    watch.last_stop = None
-        
-    session.commit()
+    watch_buffer.record(watch_id, "pause", timestamp)
 
     
     return {"message": "Video paused"} 
         
 @router.post('/user/resume_video')
 async def resume_video(watch_id : int, 
-               session: Session = Depends(get_session),
+               session: AsyncSession = Depends(get_async_session),
                current_user : Users = Depends(get_current_user())):
 
     if current_user.role != "user":
@@ -189,21 +165,17 @@ async def resume_video(watch_id : int,
 
     timestamp = datetime.utcnow()  
     
-    watch = session.get(WacthVideos, watch_id)
-    
-    if not watch :
+    if not await watch_buffer.exists(session, watch_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Watch session not found")
 
-    watch.last_stop = timestamp
- 
-    session.commit()    
+    watch_buffer.record(watch_id, "resume", timestamp)
     
     return {"message": "Video resumed"}  
     
 @router.post('/user/end_video')
 async def end_video(watch_id : int,
-               session: Session = Depends(get_session),
+               session: AsyncSession = Depends(get_async_session),
                current_user : Users = Depends(get_current_user())):
       
     if current_user.role != "user":
@@ -212,21 +184,12 @@ async def end_video(watch_id : int,
       
     timestamp = datetime.utcnow()  
     
-    watch = session.get(WacthVideos, watch_id)
-    
-    if not watch :
+    if not await watch_buffer.exists(session, watch_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Watch session not found")
 
-    delta = (timestamp - watch.last_stop).total_seconds()
-    watch.duration += int(delta)
-    watch.end_time = timestamp
-    
-    analytics = session.exec(select(Analytics).where(Analytics.video_id == watch.video_id)).first()
-    if analytics:
-        analytics.watch_time += watch.duration
-    
-    session.commit()
+    # duration and the video's watch time are added when the buffer flushes
+    watch_buffer.record(watch_id, "end", timestamp)
 
     return {"message": "Video ended"} 
 
@@ -269,30 +232,18 @@ async def subscribe(creator_id : int,
             notifications = True
     )
     session.add(subscribe)
-    session.refresh(subscribe)
+    session.flush()  # assigns subscribe.id for the link
     link = SubscriptionLink(
         subsription_id = subscribe.id,
         user_id = current_user.id
     )
     session.add(link)
-    session.refresh(link)
     
-    engagement = Analytics(
-        creator_id = creator_id
-    )    
-    if subscribe:
-        engagement.subscribers += 1
+    bump_creator(session, creator_id, subscription=1)
     session.commit()
     
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                f"Subscribed to {query.name}"
-            )
-        )
-    send_push_notifications(session, query.creator_id, f"{current_user.name} just subscribed to your channel")
+    notification_bus.publish(current_user.id, f"Subscribed to {query.name}")
+    send_push_notifications(query.creator_id, f"{current_user.name} just subscribed to your channel")
     
     return {'message' : f'Subscribed to {query.name} successfully'}
 
@@ -307,25 +258,18 @@ async def unsubscribe(creator_id : int,
     
     query = session.exec(select(Subscription).where(Subscription.creator_id == creator_id,
                             Subscription.user_id == current_user.id)).first()
-    engagement = session.exec(select(Analytics).where(Analytics.creator_id == creator_id)).first()
     
-    if not query or not engagement:
+    if not query:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Subscription not found")
         
     session.delete(query)
+    bump_creator(session, creator_id, subscription=-1)
     session.commit()
-    if engagement.subscribers > 0:
-        engagement.subscribers -= 1
-        
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                f"Unsubscribed to {query.name}"
-            )
-        )
+        
+    channel = session.exec(select(Channels).where(Channels.creator_id == creator_id)).first()
+    if channel:
+        notification_bus.publish(current_user.id, f"Unsubscribed to {channel.name}")
     
     return {'message' : 'Unsubscribed successfully'}    
         
@@ -348,27 +292,19 @@ async def turn_off_notifications(creator_id : int, notify : bool = False,
     session.add(query)
     session.commit()
     
-    email = current_user.email
-    
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                f"Notifications turned off"
-            )
-        )
+    notification_bus.publish(current_user.id, f"Notifications turned off")
     return {'message' : 'Notification preference updated successfully'}
 
 @router.get('/user/get_notifications')
-def get_notifications(session: Session = Depends(get_session),
+async def get_notifications(session: AsyncSession = Depends(get_async_session),
                         current_user : Users = Depends(get_current_user())):
 
     if current_user.role != "user":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are already a creator")
 
-    query = session.exec(select(Notificaions).where(Notificaions.user_id == current_user.id,
-                                                    Notificaions.is_read == False)).all()
+    query = (await session.exec(select(Notificaions).where(Notificaions.user_id == current_user.id,
+                                                    Notificaions.is_read == False))).all()
     if not query:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "No new notifications")
@@ -377,20 +313,20 @@ def get_notifications(session: Session = Depends(get_session),
         notify.is_read = True
         session.add(notify)
         
-    session.commit()
+    await session.commit()
     
     return {'notifications' : query}
     
 @router.post('/user/comment')
 async def post_comment(video_id : int, text : str = Form(),
-                 session: Session = Depends(get_session),
+                 session: AsyncSession = Depends(get_async_session),
                  current_user : Users = Depends(get_current_user())):
 
     if current_user.role != "user":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are already a creator")
 
-    video = session.get(Videos, video_id)
+    video = await session.get(Videos, video_id)
     if not video or video.status != "available":
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Video not found or not available")
@@ -408,19 +344,11 @@ async def post_comment(video_id : int, text : str = Form(),
         created_at = date.today()
     )
     session.add(comment)
-    session.refresh(comment)
-    
-    engagement = Analytics(
-        video_id = video_id,
-        creator_id = video.creator_id
-    )
-    if comment is not None:
-        engagement.comments += 1
     
-    session.add(engagement)
+    await bump_engagement_async(session, video_id, video.creator_id, comments=1)
 
-    session.commit()
-    send_push_notifications(session, video.creator_id, f"{current_user.name} just commented on your video")
+    await session.commit()
+    await send_push_notifications_async(video.creator_id, f"{current_user.name} just commented on your video")
     return {'message' : 'Comment posted successfully'}    
 
 @router.post('/user/reply_comment')
@@ -452,23 +380,18 @@ async def reply_comment(video_id : int, parent_comment_id : int,
     created_at = date.today()
     )
     session.add(comment)
+    session.flush()
     session.refresh(comment)
 
-    engagement = Analytics(
-    video_id = video_id,
-    creator_id = comments.creator_id
-    )
-    if query is not None:
-        engagement.comments += 1
+    bump_engagement(session, video_id, comments.creator_id, comments=1)
         
     session.commit()
     
-    send_push_notifications(session, query.user_id, f"{current_user.name} just replied to your comment")
+    send_push_notifications(query.user_id, f"{current_user.name} just replied to your comment")
     return {'message' : 'Reply posted successfully'}
 
 @router.delete('/user/delete_comment')
-async def delete_comment(comment_id : int, creator_id : int,
-                   video_id,
+async def delete_comment(comment_id : int,
                    session: Session = Depends(get_session),
                    current_user : Users = Depends(get_current_user())):
 
@@ -476,25 +399,19 @@ async def delete_comment(comment_id : int, creator_id : int,
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are already a creator")
 
-    engagement = session.exec(select(Analytics).where(Analytics.video_id == video_id,
-                            Analytics.creator_id == creator_id)).first() 
     comment = session.get(Comments, comment_id)
     if not comment:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Comment not found")
       
-    session.delete(comment)
+    video = session.get(Videos, comment.video_id)
 
+    # read the replies first, deleting the parent would null their parent_comment_id on flush
     comment_replies = session.exec(select(Comments).where(Comments.parent_comment_id == comment_id)).all()
+    session.delete(comment)
     delete_count = 1 + len(comment_replies) # if no parent len is 0 count is 1
     
-    try:
-        if engagement.comments >= delete_count:       
-            engagement.comments -= delete_count 
-        else:
-            raise ValueError("Engagement comments are zero or less than delete count")
-    except ValueError as e: 
-        print(f"Error: {e}")  
+    bump_engagement(session, comment.video_id, video.creator_id, comments=-delete_count)
         
     for reply in comment_replies: # deleting all replies from comments table
             session.delete(reply)     
@@ -531,16 +448,9 @@ async def report_video(video_id : int, report : str = Form(),
     session.commit()
     session.refresh(report)
     
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                "Your report has been submitted successfully"
-            )
-        )
+    notification_bus.publish(current_user.id, "Your report has been submitted successfully")
     for admin in admins:
-            send_push_notifications(session, admin.user_id, f"{current_user.name} just reported a video")
+            send_push_notifications(admin.user_id, f"{current_user.name} just reported a video")
             
     return {'message' : 'Video reported successfully'}
 
@@ -574,45 +484,30 @@ async def report_comment(
      session.commit()
      session.refresh(report)
     
-     email = current_user.email
-     if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                "Your report has been submitted successfully"
-            )
-        )
+     notification_bus.publish(current_user.id, "Your report has been submitted successfully")
         
      for admin in admins:
-            send_push_notifications(session, admin.user_id, f"{current_user.name} just reported a video")    
+            send_push_notifications(admin.user_id, f"{current_user.name} just reported a video")    
      return {'message' : 'Comment reported successfully'}
  
 
     
 @router.post('/user/like_dislike') 
 async def like_dislike(video_id : int, is_like : bool ,
-                 session: Session = Depends(get_session),
+                 session: AsyncSession = Depends(get_async_session),
                  current_user : Users = Depends(get_current_user())):
     
     if current_user.role != "user":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are already a creator")    
     
-    video = session.get(Videos, video_id)
+    video = await session.get(Videos, video_id)
     if not video or video.status != "available":
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail = "Video either removed or unavailable") 
     
-    analytics = session.exec(select(Analytics).where(Analytics.video_id == video_id)).first()
-    if not analytics:
-        analytics = Analytics(
-        video_id = video_id,
-        creator_id = video.creator_id
-        )
-        session.add(analytics)
-        
-    confirmation = session.exec(select(LikesDislikes).where(LikesDislikes.video_id == video_id,
-                                LikesDislikes.user_id == current_user.id)).first()
+    confirmation = (await session.exec(select(LikesDislikes).where(LikesDislikes.video_id == video_id,
+                                LikesDislikes.user_id == current_user.id))).first()
     
     if not confirmation:
         reaction = LikesDislikes(
@@ -622,49 +517,53 @@ async def like_dislike(video_id : int, is_like : bool ,
         )
         
         if is_like:
-            analytics.likes += 1
+            await bump_engagement_async(session, video_id, video.creator_id, likes=1)
         else:
-            analytics.dislikes += 1    
+            await bump_engagement_async(session, video_id, video.creator_id, dislikes=1)
             
         session.add(reaction)
 
     else:
         if confirmation.is_like != is_like:
             if is_like:
-                analytics.likes += 1
-                analytics.dislikes -= 1
+                await bump_engagement_async(session, video_id, video.creator_id, likes=1, dislikes=-1)
             else:
-                analytics.dislikes += 1
-                analytics.likes -= 1
+                await bump_engagement_async(session, video_id, video.creator_id, likes=-1, dislikes=1)
 
             confirmation.is_like = is_like        
              
-    session.commit()       
+    try:
+        await session.commit()
+    except IntegrityError:
+        # the same user's concurrent request inserted the reaction first, redo it as a flip
+        await session.rollback()
+        return await like_dislike(video_id, is_like, session, current_user)       
     
     state = "liked" if is_like else "disliked"
     
-    send_push_notifications(session, video.creator_id, f"{current_user.name} just {state} your video") 
+    await send_push_notifications_async(video.creator_id, f"{current_user.name} just {state} your video") 
     return {'message' : f'Video {state} successfully'}
 
-
 @router.get('/user/liked_videos')
-async def liked_videos(session: Session = Depends(get_session),
+async def liked_videos(cursor : str | None = None, limit : int | None = None,
+                session: Session = Depends(get_session),
                 current_user : Users = Depends(get_current_user())):
         
     if current_user.role != "user":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are already a creator")        
         
-    liked = session.exec(select(LikesDislikes).where(LikesDislikes.user_id == current_user.id,
-                            LikesDislikes.is_like == True)).all()
+    liked, next_cursor = paginate(session, select(LikesDislikes).where(LikesDislikes.user_id == current_user.id,
+                            LikesDislikes.is_like == True), LikesDislikes.id, cursor, limit, descending=True)
     if not liked:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail= "No liked videos found")
         
     liked_videos_id = [l.video_id for l in liked]     
         
-    liked_videos = session.exec(select(Videos).where(Videos.id.in_(liked_videos_id))).all()
-    return {'liked_videos' : liked_videos}
+    videos = {v.id: v for v in session.exec(select(Videos).where(Videos.id.in_(liked_videos_id))).all()}
+    liked_videos = [videos[i] for i in liked_videos_id if i in videos]
+    return {'liked_videos' : liked_videos, 'next_cursor' : next_cursor}
     
    
 @router.get('/user/your_subscriptions')    
@@ -711,7 +610,7 @@ async def like_dislike_comment(comment_id : int, is_like : bool,
     session.commit()
     state = "liked" if is_like else "disliked"
     
-    send_push_notifications(session, comment.user_id, f"{current_user.name} just {state} your comment")
+    send_push_notifications(comment.user_id, f"{current_user.name} just {state} your comment")
     return {'message' : f'Comment {state} successfully'}
 
 @router.post('/user/file_complaint')
@@ -738,17 +637,10 @@ async def file_a_complaint(subject : str = Form(),
     session.commit()
     session.refresh(complain)
     
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                "Your complain has been filed. You will be informed shortly"
-            )
-        )
+    notification_bus.publish(current_user.id, "Your complain has been filed. You will be informed shortly")
     
     for admin in admins:
-            send_push_notifications(session, admin.id, f"{current_user.name} just filed a complaint")
+            send_push_notifications(admin.id, f"{current_user.name} just filed a complaint")
     return {'message' : 'Your complaint has been filed successfully, we will get back to you soon.'}
 
 @router.get('/user/your_complaints')
@@ -767,19 +659,21 @@ async def see_your_complaints_status(session: Session = Depends(get_session),
     return {'complaints' : complaints}
 
 @router.get('/user/see_history')
-async def see_history(session: Session = Depends(get_session),
+async def see_history(cursor : str | None = None, limit : int | None = None,
+                session: Session = Depends(get_session),
                  current_user : Users = Depends(get_current_user())):
     
     if current_user.role != "user":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail = "You are not a user")
         
-    history = session.exec(select(History).where(History.user_id == current_user.id)).all()
+    history, next_cursor = paginate(session, select(History).where(History.user_id == current_user.id),
+                                    History.id, cursor, limit, descending=True)
     if not history:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND,
                             detail = "No history found")
         
-    return {'history' : history}
+    return {'history' : history, 'next_cursor' : next_cursor}
 
 #delete account & history
 @router.delete('/user/delete_account')
@@ -807,33 +701,22 @@ async def delete_account(session: Session = Depends(get_session),
     subscribe = session.exec(select(Subscription).where(Subscription.user_id == current_user.id)).all()
     link = session.exec(select(SubscriptionLink).where(SubscriptionLink.user_id == current_user.id)).all()
   
-    for c in comments:
-        analytics = session.exec(select(Analytics).where(Analytics.video_id == c.video_id)).first()
-        if analytics:
-            analytics.comments -= 1
-    
-    for r in replies:
-        analytics = session.exec(select(Analytics).where(Analytics.video_id == r.video_id)).first()
-        if analytics:
-            analytics.comments -= 1
+    # the rollups of each video need its creator
+    reacted = {c.video_id for c in comments + replies} | {l.video_id for l in like_dislike}
+    creators = dict(session.exec(select(Videos.id, Videos.creator_id).where(Videos.id.in_(reacted))).all())
+    for c in comments + replies:
+        bump_engagement(session, c.video_id, creators.get(c.video_id), comments=-1)
     for l in like_dislike:
-        analytics = session.exec(select(Analytics).where(Analytics.video_id == l.video_id)).first()
-        if analytics:
-            if l.is_like == True:
-                analytics.likes -= 1
-            else:    
-                analytics.dislikes -= 1
+        if l.is_like == True:
+            bump_engagement(session, l.video_id, creators.get(l.video_id), likes=-1)
+        else:    
+            bump_engagement(session, l.video_id, creators.get(l.video_id), dislikes=-1)
     
     for v in watch_videos:
-        analytics = session.exec(select(Analytics).where(Analytics.video_id == v.video_id)).first()
-        if analytics:
-            analytics.views -= 1
-            analytics.watch_time -= v.duration
+        bump_video(session, v.video_id, v.creator_id, views=-1, watch_time=-(v.duration or 0))
         
     for sub in subscribe:
-     analytics = session.exec(select(Analytics).where(Analytics.creator_id == sub.creator_id)).first()
-     if analytics:
-        analytics.subscriber -= 1
+        bump_creator(session, sub.creator_id, subscription=-1)
      
     for obj in (comments + replies + subscribe + link + watch_videos + requests + complains
                 + reports + like_dislike + history):
@@ -841,15 +724,9 @@ async def delete_account(session: Session = Depends(get_session),
         
     session.delete(user)
     session.commit()
+    principal_cache.invalidate(current_user.id)
     
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                "Your account has been deleted"
-            )
-        )
+    notification_bus.publish(current_user.id, "Your account has been deleted")
     
     return {'message' : 'acount deleted'}
 
@@ -870,32 +747,40 @@ async def delete_history(
     session.delete(history)
     session.commit()
     
-    email = current_user.email
-    if email in active_connections:
-        asyncio.create_task(
-            send_notification(
-                email,
-                "Your report has been submitted successfully"
-            )
-        )
+    notification_bus.publish(current_user.id, "Your report has been submitted successfully")
     
     return {'message' : 'history deleted successfully'}    
 
 
 @router.get('/trending_videos')
-def see_trending(
+def see_trending(request : Request, category : str | None = None,
+            cursor : str | None = None, limit : int | None = None,
             session : Session = Depends(get_session),
             current_user : Users = Depends(get_current_user())):
     
-    query = session.exec(select(Trending)).all()
+    if not trending_index.loaded:
+        # no snapshot reached this worker yet (Redis down or first start)
+        fallback = select(Trending)
+        if category:
+            # the table only holds the global top-K, so this is that list narrowed to the category
+            fallback = fallback.join(Videos, Videos.id == Trending.video_id).where(Videos.category == category)
+        query, next_cursor = paginate(session, fallback, Trending.rank, cursor, limit)
+        return {'trending' : query, 'next_cursor' : next_cursor}
+    
+    # ranks are positions in the snapshot, so the cursor is the last rank served
+    after = decode_cursor(cursor) if cursor is not None else 0
+    if not isinstance(after, int) or after < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Invalid cursor")
+    size = page_size(limit)
+    videos, etag = trending_index.top(category, size + 1, after)
+    next_cursor = encode_cursor(videos[size - 1]["rank"]) if len(videos) > size else None
+    videos = videos[:size]
+    headers = {"ETag" : etag, "Cache-Control" : f"private, max-age={TRENDING_CACHE_SECONDS}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
     
-    return query
+    return JSONResponse({'trending' : videos, 'next_cursor' : next_cursor}, headers=headers)
 
-async def send_notification(email:str, message:str):
-    #print(f"Sending notification to {email}: {message}")
-    if email in active_connections:
-        await active_connections[email].send_json({
-            "message": message
-        })       
         
         
\ No newline at end of file
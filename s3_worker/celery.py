@@ -1,19 +1,32 @@
 from celery import Celery
 from celery.schedules import crontab
+from decouple import config
 
 celery_app = Celery('s3_worker',
                     broker='redis://localhost:6379/0',
                     backend = 'redis://localhost:6379/0',
-                    include = ['s3_worker.worker2','s3_worker.worker']
+                    include = ['s3_worker.worker2','s3_worker.worker','s3_worker.chunks','push_notify.delivery']
  # “Hey, when you start, also import the module s3_worker.worker2 because that’s where my tasks are defined.”                    
                     )
 
+TRENDING_INTERVAL_SECONDS: float = config('TRENDING_INTERVAL_SECONDS', cast=float, default=60)
+# set to a dedicated queue (and start a worker with -Q) so pushes can't delay video processing
+PUSH_QUEUE: str = config('PUSH_QUEUE', cast=str, default='celery')
+
+celery_app.conf.task_routes = {'push_notify.delivery.*': {'queue': PUSH_QUEUE}}
+
 celery_app.conf.timezone = 'UTC' #Celery Beat needs a timezone when running scheduled tasks.
 
 celery_app.conf.beat_schedule = {
-    'calculate-trending-every-six-hours':{
+    'calculate-trending-every-minute':{
     'task' : 's3_worker.worker2.calculate_trending',
-    'schedule' : crontab(minute=0, hour='*/6'),
+    'schedule' : TRENDING_INTERVAL_SECONDS,
+    # a run that waited longer than one interval is superseded by the next one
+    'options' : {'expires' : TRENDING_INTERVAL_SECONDS},
+    },
+    'refresh-rollups-every-five-minutes':{
+    'task' : 's3_worker.worker2.refresh_rollups',
+    'schedule' : crontab(minute='*/5'),
     },
 }
 """
@@ -0,0 +1,180 @@
+import subprocess
+import boto3
+import csv
+import math
+import os
+import tempfile
+import shutil
+from celery import chord
+from celery.utils.log import get_task_logger
+from sqlmodel import Session
+from decouple import config
+from .celery import celery_app
+from database.structure import engine
+from sqlmodels.tables_schema import Videos
+from .server import SegmentUploader
+from .encoding import HLS_RESOLUTIONS, encode_hls, audio_output_args, read_segments, start_time, write_master_playlist
+from ws_router.bus import notification_bus
+
+s3 = boto3.client("s3")
+logger = get_task_logger(__name__)
+
+# Sources at least this long (seconds) are encoded as a chord of per-chunk tasks
+CHUNKED_MIN_DURATION: float = config('CHUNKED_MIN_DURATION', cast=float, default=600)
+CHUNK_SECONDS: int = config('CHUNK_SECONDS', cast=int, default=60)
+# a chunk starting further than this from where the previous one ended gets an #EXT-X-DISCONTINUITY
+CHUNK_GAP_SECONDS: float = config('CHUNK_GAP_SECONDS', cast=float, default=0.5)
+
+def split_source(local_input: str, chunk_dir: str) -> list[tuple[str, float]]:
+    """Cuts the video stream into ~CHUNK_SECONDS pieces, returns (path, start time) pairs."""
+    chunk_list = os.path.join(chunk_dir, "chunks.csv")
+    # stream copy can only cut on keyframes, so every chunk starts with a decodable frame
+    subprocess.run([
+        "ffmpeg", "-i", local_input,
+        "-map", "0:v:0", "-c", "copy", "-an",
+        "-f", "segment",
+        "-segment_time", str(CHUNK_SECONDS),
+        "-reset_timestamps", "1",
+        "-segment_list", chunk_list,
+        "-segment_list_type", "csv",
+        os.path.join(chunk_dir, "chunk_%04d.mkv")
+    ], check=True)
+
+    with open(chunk_list, newline="") as f:
+        return [(os.path.join(chunk_dir, row[0]), float(row[1])) for row in csv.reader(f) if row]
+
+def dispatch_chunked(local_input: str, workdir: str, video_id: int, bucket: str, ladder: dict, gop: int,
+                     audio: bool = True):
+    hls_dir = os.path.join(workdir, "hls")
+    chunk_dir = os.path.join(workdir, "chunks")
+    os.makedirs(hls_dir, exist_ok=True)
+    os.makedirs(chunk_dir, exist_ok=True)
+
+    try:
+        # Audio is cheap, encode it once here instead of per chunk
+        if audio:
+            with SegmentUploader(hls_dir, bucket, f"hls/{video_id}", {"ACL": "public-read"}):
+                subprocess.run(["ffmpeg", "-i", local_input, "-map", "0:a:0"] + audio_output_args(hls_dir),
+                               check=True)
+
+        header = []
+        for index, (path, start) in enumerate(split_source(local_input, chunk_dir)):
+            chunk_key = f"chunks/{video_id}/{os.path.basename(path)}"
+            with open(path, "rb") as f:
+                s3.upload_fileobj(f, bucket, chunk_key)
+            header.append(encode_chunk.s(video_id, bucket, chunk_key, index, start, ladder, gop))
+    except Exception:
+        mark_failed(video_id, bucket)
+        raise
+
+    # a failed chunk (or stitch) runs chunks_failed instead of leaving the video in "processing"
+    body = stitch_chunks.s(video_id, bucket, ladder, audio).on_error(chunks_failed.s(video_id, bucket))
+    return chord(header)(body)
+
+def delete_prefix(bucket: str, prefix: str) -> None:
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        keys = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+        if keys:
+            s3.delete_objects(Bucket=bucket, Delete={"Objects": keys})
+
+def mark_failed(video_id: int, bucket: str) -> None:
+    delete_prefix(bucket, f"chunks/{video_id}/")
+    with Session(engine) as session:
+        video = session.get(Videos, video_id)
+        if not video:
+            return
+        video.status = "failed"
+        session.add(video)
+        session.commit()
+        notification_bus.publish(video.creator_id, "Processing of your video failed, please upload it again")
+
+@celery_app.task
+def chunks_failed(request, exc, traceback, video_id: int, bucket: str):
+    # errback of the chord body, celery passes the failed request and exception first
+    logger.error("Chunked processing of video %s failed: %s", video_id, exc)
+    mark_failed(video_id, bucket)
+
+@celery_app.task
+def encode_chunk(video_id: int, bucket: str, chunk_key: str, index: int, start: float, ladder: dict, gop: int):
+    workdir = tempfile.mkdtemp()
+    try:
+        local_chunk = os.path.join(workdir, os.path.basename(chunk_key))
+        s3.download_file(bucket, chunk_key, local_chunk)
+
+        # -itsoffset puts the chunk back at its place in the source timeline; without -copyts the
+        # encoder fills 0..start with copies of the first frame, so every chunk began at zero.
+        # per-chunk playlists stay local since stitch_chunks writes the real ones
+        tag = f"_c{index:04d}"
+        with SegmentUploader(workdir, bucket, f"hls/{video_id}", {"ACL": "public-read"},
+                             upload_playlists=False):
+            encode_hls(local_chunk, workdir, ladder, gop, audio=False, tag=tag,
+                       input_args=["-copyts", "-itsoffset", f"{start:.6f}"])
+
+        renditions = {name: read_segments(os.path.join(workdir, f"{name}{tag}.m3u8")) for name in ladder}
+        # where the chunk really landed on the timeline, stitch_chunks checks it follows the previous one
+        first = renditions[next(iter(ladder))][0][1]
+        return {"start": start_time(os.path.join(workdir, first)), "renditions": renditions}
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def discontinuities(results: list, name: str) -> set[int]:
+    """Indexes of the chunks whose timestamps don't continue the previous chunk's.
+
+    -copyts with -itsoffset keeps the timeline continuous, a chunk that restarted at zero anyway
+    (or left a gap) needs the tag, or players stall or skip at the boundary.
+    """
+    breaks = set()
+    for index in range(1, len(results)):
+        previous = results[index - 1]
+        expected = previous["start"] + sum(duration for duration, _ in previous["renditions"][name])
+        if abs(results[index]["start"] - expected) > CHUNK_GAP_SECONDS:
+            breaks.add(index)
+    return breaks
+
+@celery_app.task
+def stitch_chunks(results: list, video_id: int, bucket: str, ladder: dict, audio: bool = True):
+    # chord results keep the header order, so chunks are already in timeline order
+    workdir = tempfile.mkdtemp()
+    try:
+        breaks = discontinuities(results, next(iter(ladder)))
+        for name in ladder:
+            target = math.ceil(max(duration for chunk in results for duration, _ in chunk["renditions"][name]))
+            with open(os.path.join(workdir, f"{name}.m3u8"), "w") as m3u8:
+                m3u8.write(f"#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:{target}\n")
+                m3u8.write("#EXT-X-MEDIA-SEQUENCE:0\n#EXT-X-PLAYLIST-TYPE:VOD\n")
+                for index, chunk in enumerate(results):
+                    if index in breaks:
+                        m3u8.write("#EXT-X-DISCONTINUITY\n")
+                    for duration, file in chunk["renditions"][name]:
+                        m3u8.write(f"#EXTINF:{duration:.6f},\n{file}\n")
+                m3u8.write("#EXT-X-ENDLIST\n")
+
+        write_master_playlist(workdir, ladder, audio)
+        for file in os.listdir(workdir):
+            with open(os.path.join(workdir, file), "rb") as f:
+                s3.upload_fileobj(f, bucket, f"hls/{video_id}/{file}", ExtraArgs={"ACL": "public-read"})
+
+        # chunk sources are only needed until every rendition is encoded
+        delete_prefix(bucket, f"chunks/{video_id}/")
+
+        with Session(engine) as session:
+            video = session.get(Videos, video_id)
+            if not video:
+                return f"Video {video_id} not found"
+
+            video.hls_url = f"https://{bucket}.s3.amazonaws.com/hls/{video_id}/master.m3u8"
+            # rungs above the source height stay empty
+            for name in HLS_RESOLUTIONS:
+                url = f"https://{bucket}.s3.amazonaws.com/hls/{video_id}/{name}.m3u8" if name in ladder else None
+                setattr(video, f"url_{name}", url)
+
+            video.status = "complete"
+            session.add(video)
+            session.commit()
+            notification_bus.publish(video.creator_id, "Your video has been uploaded successfully")
+        return "Chunked HLS processing complete"
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
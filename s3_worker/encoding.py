@@ -0,0 +1,174 @@
+import subprocess
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+
+# Resolutions for HLS (resolution: (scale, video_bitrate))
+HLS_RESOLUTIONS = {
+    "1080p": ("1920x1080", "5000k"),
+    "720p": ("1280x720", "3000k"),
+    "480p": ("854x480", "1500k"),
+    "360p": ("640x360", "800k"),
+    "144p": ("256x144", "400k"),
+}
+
+AUDIO_BITRATE = "128k"  # Encode audio once
+HLS_SEGMENT_TIME = "6"
+
+# "split" decodes the source once and feeds every rendition from a single ffmpeg graph,
+# "pool" runs one ffmpeg per rendition with at most HLS_MAX_PARALLEL running at a time
+HLS_ENCODE_MODE: str = config('HLS_ENCODE_MODE', cast=str, default='split')
+HLS_MAX_PARALLEL: int = config('HLS_MAX_PARALLEL', cast=int, default=os.cpu_count() or 1)
+
+def probe_video(local_input: str) -> dict:
+    """Reads height, frame rate, bitrate, duration and whether there is audio with ffprobe."""
+    result = subprocess.run([
+        "ffprobe", "-v", "error",
+        "-show_entries", "stream=codec_type,height,r_frame_rate,bit_rate:format=bit_rate,duration",
+        "-of", "json", local_input
+    ], check=True, capture_output=True, text=True)
+    info = json.loads(result.stdout)
+    streams = info.get("streams", [])
+    videos = [s for s in streams if s.get("codec_type") == "video"]
+    if not videos:
+        raise ValueError(f"No video stream found in {local_input}")
+
+    stream = videos[0]
+    fmt = info.get("format", {})
+    num, _, den = stream.get("r_frame_rate", "24/1").partition("/")
+    fps = float(num) / float(den) if den and float(den) else float(num or 0)
+    bitrate = stream.get("bit_rate") or fmt.get("bit_rate")
+
+    return {
+        "height": int(stream["height"]),
+        "fps": fps or 24.0,
+        "bitrate": int(bitrate) if bitrate and bitrate != "N/A" else None,
+        "duration": float(fmt["duration"]) if fmt.get("duration") not in (None, "N/A") else None,
+        # ffmpeg fails an output that gets no stream, so silent sources skip the audio rendition
+        "audio": any(s.get("codec_type") == "audio" for s in streams),
+    }
+
+def build_ladder(probe: dict) -> dict:
+    """Keeps only the rungs the source can fill, never upscaling past its height."""
+    ladder = {}
+    for name, (scale, v_bitrate) in HLS_RESOLUTIONS.items():
+        if int(scale.split("x")[1]) > probe["height"]:
+            continue
+        rate = int(v_bitrate.replace("k", ""))
+        if probe["bitrate"]:
+            # no point spending more bits than the source had
+            rate = max(1, min(rate, probe["bitrate"] // 1000))
+        ladder[name] = (scale, f"{rate}k")
+
+    if not ladder:
+        # sources below the smallest rung still get one rendition
+        name = list(HLS_RESOLUTIONS)[-1]
+        ladder[name] = HLS_RESOLUTIONS[name]
+    return ladder
+
+def audio_output_args(hls_dir: str) -> list[str]:
+    return [
+        "-c:a", "aac", "-b:a", AUDIO_BITRATE,
+        "-vn",
+        "-f", "hls",
+        "-hls_time", HLS_SEGMENT_TIME,
+        "-hls_playlist_type", "vod",
+        "-hls_segment_filename", f"{hls_dir}/audio_%03d.ts",
+        os.path.join(hls_dir, "audio.m3u8")
+    ]
+
+def video_output_args(hls_dir: str, name: str, v_bitrate: str, gop: int = 48, tag: str = "") -> list[str]:
+    # `tag` keeps segment names unique when several chunks of one rendition share a directory
+    return [
+        "-c:v", "h264", "-profile:v", "main",
+        "-pix_fmt", "yuv420p",  # main profile (and most players) can't take 4:2:2/4:4:4 sources
+        "-crf", "20", "-sc_threshold", "0",
+        "-g", str(gop), "-keyint_min", str(gop),
+        "-b:v", v_bitrate,
+        "-maxrate", v_bitrate,
+        "-bufsize", str(int(v_bitrate.replace("k", "")) * 2) + "k",
+        "-an",
+        "-f", "hls",
+        "-hls_time", HLS_SEGMENT_TIME,
+        "-hls_playlist_type", "vod",
+        "-hls_segment_filename", f"{hls_dir}/{name}{tag}_%03d.ts",
+        os.path.join(hls_dir, f"{name}{tag}.m3u8")
+    ]
+
+def scale_filter(scale: str) -> str:
+    w, h = scale.split("x")
+    return f"scale={w}:{h}"
+
+def split_command(local_input: str, hls_dir: str, ladder: dict, gop: int = 48,
+                  audio: bool = True, tag: str = "", input_args: list[str] | None = None) -> list[str]:
+    # one decode, `split` fans the frames out to a scaler + encoder per rendition
+    labels = [f"v{i}" for i in range(len(ladder))]
+    graph = f"[0:v]split={len(ladder)}" + "".join(f"[{l}]" for l in labels)
+    for label, (scale, _) in zip(labels, ladder.values()):
+        graph += f";[{label}]{scale_filter(scale)}[{label}out]"
+
+    cmd = ["ffmpeg"] + (input_args or []) + ["-i", local_input,
+           "-threads", str(HLS_MAX_PARALLEL), "-filter_complex", graph]
+    if audio:
+        cmd += ["-map", "0:a?"] + audio_output_args(hls_dir)
+    for label, (name, (_, v_bitrate)) in zip(labels, ladder.items()):
+        cmd += ["-map", f"[{label}out]"] + video_output_args(hls_dir, name, v_bitrate, gop, tag)
+    return cmd
+
+def rendition_commands(local_input: str, hls_dir: str, ladder: dict, gop: int = 48,
+                       audio: bool = True, tag: str = "", input_args: list[str] | None = None) -> list[list[str]]:
+    head = ["ffmpeg"] + (input_args or []) + ["-i", local_input]
+    cmds = [head + audio_output_args(hls_dir)] if audio else []
+    for name, (scale, v_bitrate) in ladder.items():
+        cmds.append(head + ["-vf", scale_filter(scale)]
+                    + video_output_args(hls_dir, name, v_bitrate, gop, tag))
+    return cmds
+
+def encode_hls(local_input: str, hls_dir: str, ladder: dict, gop: int = 48,
+               audio: bool = True, tag: str = "", input_args: list[str] | None = None) -> None:
+    if HLS_ENCODE_MODE == "split":
+        subprocess.run(split_command(local_input, hls_dir, ladder, gop, audio, tag, input_args), check=True)
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, HLS_MAX_PARALLEL)) as pool:
+        jobs = [pool.submit(subprocess.run, cmd, check=True)
+                for cmd in rendition_commands(local_input, hls_dir, ladder, gop, audio, tag, input_args)]
+        for job in jobs:
+            job.result()  # re-raises CalledProcessError from any rendition
+
+def write_master_playlist(hls_dir: str, ladder: dict, audio: bool = True) -> str:
+    master_playlist = os.path.join(hls_dir, "master.m3u8")
+    with open(master_playlist, "w") as m3u8:
+        m3u8.write("#EXTM3U\n#EXT-X-VERSION:3\n")
+        if audio:
+            m3u8.write('#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",NAME="English",DEFAULT=YES,AUTOSELECT=YES,URI="audio.m3u8"\n')
+        for name, (scale, v_bitrate) in ladder.items():
+            bw = int(v_bitrate.replace("k", "")) * 1000 + (128000 if audio else 0)
+            w, h = scale.split("x")
+            codecs, group = ('avc1.4d401f,mp4a.40.2', ',AUDIO="audio"') if audio else ('avc1.4d401f', '')
+            m3u8.write(
+                f'#EXT-X-STREAM-INF:BANDWIDTH={bw},RESOLUTION={w}x{h},CODECS="{codecs}"{group}\n{name}.m3u8\n'
+            )
+    return master_playlist
+
+def start_time(path: str) -> float:
+    """First timestamp of a media file in seconds, e.g. of an HLS segment."""
+    result = subprocess.run([
+        "ffprobe", "-v", "error", "-show_entries", "format=start_time", "-of", "csv=p=0", path
+    ], check=True, capture_output=True, text=True)
+    return float(result.stdout.strip() or 0)
+
+def read_segments(playlist_path: str) -> list[tuple[float, str]]:
+    """Returns (duration, segment filename) pairs from an HLS media playlist."""
+    segments = []
+    duration = None
+    with open(playlist_path) as m3u8:
+        for line in m3u8:
+            line = line.strip()
+            if line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",")[0])
+            elif line and not line.startswith("#") and duration is not None:
+                segments.append((duration, os.path.basename(line)))
+                duration = None
+    return segments
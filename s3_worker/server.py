@@ -1,9 +1,42 @@
 import boto3
-from botocore.exceptions import NoCredentialsError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import NoCredentialsError, BotoCoreError, ClientError
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+from urllib.parse import urlparse, unquote
+import asyncio
 import os
-import requests
+import re
+import threading
 
-s3 = boto3.client('s3')
+S3_MAX_CONNECTIONS: int = config('S3_MAX_CONNECTIONS', cast=int, default=32)
+S3_MAX_ATTEMPTS: int = config('S3_MAX_ATTEMPTS', cast=int, default=5)
+S3_MULTIPART_THRESHOLD_MB: int = config('S3_MULTIPART_THRESHOLD_MB', cast=int, default=64)
+S3_DOWNLOAD_PART_MB: int = config('S3_DOWNLOAD_PART_MB', cast=int, default=32)
+S3_DOWNLOAD_THREADS: int = config('S3_DOWNLOAD_THREADS', cast=int, default=16)
+S3_UPLOAD_PART_MB: int = config('S3_UPLOAD_PART_MB', cast=int, default=8)
+DOWNLOAD_BUFFER = 1024 * 1024
+
+# one pooled client shared by every upload thread; adaptive mode backs off on throttling
+s3 = boto3.client('s3', config=Config(
+    max_pool_connections=S3_MAX_CONNECTIONS,
+    retries={'max_attempts': S3_MAX_ATTEMPTS, 'mode': 'adaptive'},
+))
+
+# HLS segments are a few MB, so they go up in a single PUT; only big files get multipart
+transfer_config = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD_MB * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=4,
+)
+
+CONTENT_TYPES = {
+    ".ts": "video/MP2T",
+    ".m3u8": "application/vnd.apple.mpegurl",
+}
+
+SEGMENT_PATTERN = re.compile(r"^(?P<prefix>.+)_(?P<index>\d+)\.ts$")
 
 def upload_to_s3(file_obj, filename : str, bucket : str = "mybucket", extra_args : dict = None) -> str:
     try:
@@ -14,24 +47,222 @@ def upload_to_s3(file_obj, filename : str, bucket : str = "mybucket", extra_args
         return f"https://{bucket}.s3.amazonaws.com/{filename}"
     except NoCredentialsError:
         raise RuntimeError("No AWS credentials found.")
+
+
+def start_multipart(filename: str, bucket: str = "mybucket", extra_args: dict = None) -> str:
+    try:
+        upload = s3.create_multipart_upload(Bucket=bucket, Key=filename, **(extra_args or {}))
+    except NoCredentialsError:
+        raise RuntimeError("No AWS credentials found.")
+    return upload["UploadId"]
+
+def upload_part(filename: str, bucket: str, upload_id: str, part_number: int, body: bytes) -> str:
+    response = s3.upload_part(Bucket=bucket, Key=filename, UploadId=upload_id,
+                              PartNumber=part_number, Body=body)
+    return response["ETag"]
+
+def complete_multipart(filename: str, bucket: str, upload_id: str, parts: list[tuple[int, str]]) -> str:
+    s3.complete_multipart_upload(Bucket=bucket, Key=filename, UploadId=upload_id, MultipartUpload={
+        "Parts": [{"PartNumber": number, "ETag": etag} for number, etag in parts]
+    })
+    return f"https://{bucket}.s3.amazonaws.com/{filename}"
+
+def abort_multipart(filename: str, bucket: str, upload_id: str):
+    s3.abort_multipart_upload(Bucket=bucket, Key=filename, UploadId=upload_id)
+
+def presigned_post(filename: str, bucket: str, max_size: int, expires_in: int = 3600) -> dict:
+    """Form fields + URL for a browser POST straight to S3, locked to this key, ACL and size."""
+    return s3.generate_presigned_post(
+        Bucket=bucket, Key=filename,
+        Fields={"acl": "public-read"},
+        Conditions=[{"acl": "public-read"}, ["content-length-range", 1, max_size]],
+        ExpiresIn=expires_in,
+    )
+
+def presigned_part_urls(filename: str, bucket: str, upload_id: str, count: int,
+                        expires_in: int = 6 * 3600) -> list[dict]:
+    return [
+        {"part_number": number, "url": s3.generate_presigned_url("upload_part", Params={
+            "Bucket": bucket, "Key": filename, "UploadId": upload_id, "PartNumber": number
+        }, ExpiresIn=expires_in)}
+        for number in range(1, count + 1)
+    ]
+
+def delete_object(filename: str, bucket: str):
+    s3.delete_object(Bucket=bucket, Key=filename)
+
+def object_size(filename: str, bucket: str) -> int | None:
+    try:
+        return s3.head_object(Bucket=bucket, Key=filename)["ContentLength"]
+    except ClientError:
+        return None
+
+
+class UploadCancelled(Exception):
+    pass
+
+async def stream_to_s3(read, filename: str, bucket: str = "mybucket", extra_args: dict = None,
+                       on_progress=None, is_cancelled=None) -> str:
+    """
+    Streams an async `read(n)` source into an S3 multipart upload without blocking the event loop.
+    Only one S3_UPLOAD_PART_MB part is held in memory at a time. `on_progress(bytes_sent)` is
+    awaited after every part; when `is_cancelled()` returns True the upload is aborted.
+    """
+    part_size = max(S3_UPLOAD_PART_MB, 5) * 1024 * 1024  # S3 rejects parts under 5 MiB
+    upload_id = await asyncio.to_thread(start_multipart, filename, bucket, extra_args)
+
+    parts = []
+    sent = 0
+    try:
+        while True:
+            if is_cancelled and await is_cancelled():
+                raise UploadCancelled(f"Upload of {filename} cancelled by client")
+
+            chunk = await read(part_size)
+            if not chunk and parts:
+                break
+
+            part_number = len(parts) + 1
+            etag = await asyncio.to_thread(upload_part, filename, bucket, upload_id, part_number, chunk)
+            parts.append((part_number, etag))
+            sent += len(chunk)
+            if on_progress:
+                await on_progress(sent)
+            if not chunk:
+                break  # empty file, a single empty part completes it
+
+        return await asyncio.to_thread(complete_multipart, filename, bucket, upload_id, parts)
+    except BaseException:
+        # also runs on CancelledError so no orphaned parts are left billing storage
+        await asyncio.shield(asyncio.to_thread(abort_multipart, filename, bucket, upload_id))
+        raise
+
+class SegmentUploader:
+    """
+    Uploads the HLS output in `directory` to `bucket` under `prefix` on a thread pool.
+    While ffmpeg is running, a watcher thread picks up every segment that is finished;
+    ffmpeg writes name_%03d.ts in order, so a segment is done once a later one exists.
+    Leaving the `with` block uploads whatever is left (last segments and playlists)
+    and waits for every transfer, re-raising the first failure.
+    """
+    def __init__(self, directory: str, bucket: str, prefix: str, extra_args: dict | None = None,
+                 upload_playlists: bool = True, poll_interval: float = 0.5):
+        self.directory = directory
+        self.bucket = bucket
+        self.prefix = prefix
+        self.extra_args = extra_args or {}
+        self.upload_playlists = upload_playlists
+        self.poll_interval = poll_interval
+        self.submitted: set[str] = set()
+        self.futures = []
+        self.pool = ThreadPoolExecutor(max_workers=S3_MAX_CONNECTIONS)
+        self._stop = threading.Event()
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+
+    def __enter__(self):
+        self._watcher.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._watcher.join()
+        try:
+            if exc_type is None:
+                self._scan(final=True)
+                for future in self.futures:
+                    future.result()
+        finally:
+            self.pool.shutdown(wait=True, cancel_futures=exc_type is not None)
+        return False
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self._scan(final=False)
+
+    def _scan(self, final: bool):
+        latest: dict[str, int] = {}
+        segments = []
+        for file in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(file)
+            if match:
+                index = int(match["index"])
+                latest[match["prefix"]] = max(latest.get(match["prefix"], -1), index)
+                segments.append((file, match["prefix"], index))
+            elif final and self.upload_playlists and file.endswith(".m3u8"):
+                self._submit(file)
+
+        for file, prefix, index in segments:
+            if final or index < latest[prefix]:
+                self._submit(file)
+
+    def _submit(self, file: str):
+        if file in self.submitted:
+            return
+        self.submitted.add(file)
+        extra_args = dict(self.extra_args)
+        content_type = CONTENT_TYPES.get(os.path.splitext(file)[1])
+        if content_type:
+            extra_args.setdefault("ContentType", content_type)
+        self.futures.append(self.pool.submit(
+            s3.upload_file, os.path.join(self.directory, file), self.bucket,
+            f"{self.prefix}/{file}", ExtraArgs=extra_args, Config=transfer_config
+        ))
     
 
+def parse_s3_url(url: str) -> tuple[str, str]:
+    """Splits https://{bucket}.s3.amazonaws.com/{key} into (bucket, key)."""
+    parsed = urlparse(url)
+    return parsed.netloc.split(".s3")[0], unquote(parsed.path.lstrip("/"))
+
+def presigned_url(url: str, expires_in: int = 6 * 3600) -> str:
+    """Short-lived GET URL so ffmpeg can read the original straight from S3."""
+    bucket, key = parse_s3_url(url)
+    return s3.generate_presigned_url("get_object", Params={"Bucket": bucket, "Key": key},
+                                     ExpiresIn=expires_in)
+
+def download_range(bucket: str, key: str, local_path: str, start: int, end: int):
+    offset = start
+    for attempt in range(S3_MAX_ATTEMPTS):
+        try:
+            # after a dropped connection only the bytes not yet written are requested again
+            body = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={offset}-{end}")["Body"]
+            with open(local_path, "r+b") as f:
+                f.seek(offset)
+                for chunk in body.iter_chunks(DOWNLOAD_BUFFER):
+                    f.write(chunk)
+                    offset += len(chunk)
+            if offset > end:
+                return
+        except (BotoCoreError, ClientError):
+            if attempt == S3_MAX_ATTEMPTS - 1:
+                raise
+    raise RuntimeError(f"Failed to download bytes {start}-{end} of s3://{bucket}/{key}")
+
 def download_from_s3(url: str, workdir: str) -> str:
     """
-    Downloads a file from S3 to a local path.
-    :param filename: The S3 key (e.g., 'videos/myfile.mp4')
-    :param local_path: The local file path to save as
-    :param bucket: The S3 bucket name
+    Downloads an object from S3 to workdir with parallel ranged GETs.
+    :param url: The public S3 URL stored on the video (e.g. Videos.original_url)
+    :param workdir: The local directory to save into
     :return: The local file path
     """
-    local_path = os.path.join(workdir, os.path.basename(url))
-    
-    response = requests.get(url, stream=True)
-    if response.status_code != 200:
-        raise RuntimeError(f"Failed to download {url}, status={response.status_code}")
+    bucket, key = parse_s3_url(url)
+    local_path = os.path.join(workdir, os.path.basename(key))
+
+    try:
+        size = s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+    except NoCredentialsError:
+        raise RuntimeError("No AWS credentials found.")
 
     with open(local_path, "wb") as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
+        f.truncate(size)  # every range writes into its own slice of the file
+    if size == 0:
+        return local_path
+
+    part_size = S3_DOWNLOAD_PART_MB * 1024 * 1024
+    with ThreadPoolExecutor(max_workers=S3_DOWNLOAD_THREADS) as pool:
+        jobs = [pool.submit(download_range, bucket, key, local_path, start, min(start + part_size, size) - 1)
+                for start in range(0, size, part_size)]
+        for job in jobs:
+            job.result()
 
-    return local_path  
\ No newline at end of file
+    return local_path
@@ -0,0 +1,133 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decouple import config
+from sqlalchemy import update, delete
+from sqlmodel import Session, select, desc, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database.counters import increments, dialect_insert
+from database.rollups import ROLLUP_SETTLE_SECONDS
+from sqlmodels.tables_schema import TrendingScore, Trending, RollupWatermark, History, Videos, Analytics
+
+# score = views + watched minutes, every point losing half its weight per half-life,
+# which keeps the ranking to a sliding window without storing the window itself
+TRENDING_HALF_LIFE_HOURS: float = config('TRENDING_HALF_LIFE_HOURS', cast=float, default=6)
+TRENDING_TOP_K: int = config('TRENDING_TOP_K', cast=int, default=50)
+TRENDING_MIN_SCORE: float = config('TRENDING_MIN_SCORE', cast=float, default=0.01)  # dropped below this
+TRENDING_BATCH_SIZE: int = config('TRENDING_BATCH_SIZE', cast=int, default=20000)
+
+DECAY_RATE = math.log(2) / (TRENDING_HALF_LIFE_HOURS * 3600)  # per second
+
+def decayed(points: float, age_seconds: float) -> float:
+    return points * math.exp(-DECAY_RATE * max(0.0, age_seconds))
+
+def trending_statements(dialect: str, video_id: int, creator_id: int, points: float):
+    bump = update(TrendingScore).where(TrendingScore.video_id == video_id).values(
+        increments(TrendingScore, {"score": points}))
+    create = dialect_insert(dialect)(TrendingScore).values(
+        video_id=video_id, creator_id=creator_id, score=0).on_conflict_do_nothing(index_elements=["video_id"])
+    return bump, create
+
+def bump_trending(session: Session, video_id: int, creator_id: int, points: float) -> None:
+    bump, create = trending_statements(session.get_bind().dialect.name, video_id, creator_id, points)
+    if session.execute(bump).rowcount == 0:
+        session.execute(create)
+        session.execute(bump)
+
+async def bump_trending_async(session: AsyncSession, video_id: int, creator_id: int, points: float) -> None:
+    """Adds points that happened just now, e.g. watch minutes flushed by the watch buffer."""
+    if not points:
+        return
+    bump, create = trending_statements(session.bind.dialect.name, video_id, creator_id, points)
+    if (await session.execute(bump)).rowcount == 0:
+        await session.execute(create)
+        await session.execute(bump)
+
+def watermark(session: Session, source: str, lock: bool = False) -> RollupWatermark:
+    query = select(RollupWatermark).where(RollupWatermark.source == source)
+    if lock:
+        # FOR UPDATE can't lock a row that isn't there yet, two first runs would both go ahead
+        session.execute(dialect_insert(session.get_bind().dialect.name)(RollupWatermark)
+                        .values(source=source, last_id=0).on_conflict_do_nothing(index_elements=["source"]))
+        query = query.with_for_update()  # overlapping runs wait here instead of counting twice
+    return session.exec(query).first() or RollupWatermark(source=source, last_id=0)
+
+def refresh_scores(session: Session, now: datetime) -> int:
+    """Decays every score to `now` and adds the views recorded since the last run."""
+    clock = watermark(session, "trending:clock", lock=True)
+    if clock.updated_at:
+        factor = math.exp(-DECAY_RATE * max(0.0, (now - clock.updated_at).total_seconds()))
+        session.execute(update(TrendingScore).values(score=TrendingScore.score * factor))
+        session.execute(delete(TrendingScore).where(TrendingScore.score < TRENDING_MIN_SCORE))
+    clock.updated_at = now
+    session.add(clock)
+
+    mark = watermark(session, "trending:history")
+    rows = session.exec(
+        select(History.id, History.video_id, Videos.creator_id, History.watched_at)
+        .join(Videos, Videos.id == History.video_id)
+        .where(History.id > mark.last_id).order_by(History.id).limit(TRENDING_BATCH_SIZE)
+    ).all()
+    # same as the rollups, a recent row may still have a lower id in an uncommitted transaction
+    settled = now - timedelta(seconds=ROLLUP_SETTLE_SECONDS)
+    for n, (_, _, _, watched_at) in enumerate(rows):
+        if watched_at is not None and watched_at >= settled:
+            rows = rows[:n]
+            break
+    if not rows:
+        return 0
+
+    points = defaultdict(float)
+    for _, video_id, creator_id, watched_at in rows:
+        points[(video_id, creator_id)] += decayed(1.0, (now - (watched_at or now)).total_seconds())
+    for (video_id, creator_id), score in points.items():
+        bump_trending(session, video_id, creator_id, score)
+
+    mark.last_id = rows[-1][0]
+    mark.updated_at = now
+    session.add(mark)
+    return len(rows)
+
+def swap_top_k(session: Session) -> tuple[list[Trending], list[Trending]]:
+    """Replaces the Trending snapshot in the caller's transaction.
+
+    Returns the whole snapshot and the entries that were not in the previous one.
+    """
+    top = session.exec(select(TrendingScore).order_by(desc(TrendingScore.score)).limit(TRENDING_TOP_K)).all()
+    ids = [row.video_id for row in top]
+    videos = {v.id: v for v in session.exec(select(Videos).where(Videos.id.in_(ids))).all()}
+    totals = {a.video_id: a for a in session.exec(select(Analytics).where(Analytics.video_id.in_(ids))).all()}
+    previous = set(session.exec(select(Trending.video_id)).all())
+
+    session.execute(delete(Trending))
+    snapshot = []
+    for rank, row in enumerate(top, start=1):
+        video = videos.get(row.video_id)
+        if not video:
+            continue
+        total = totals.get(row.video_id)
+        snapshot.append(Trending(
+            creator_id=row.creator_id,
+            video=video.original_url,
+            views=total.views if total else 0,
+            duration=total.watch_time if total else 0,
+            video_id=row.video_id,
+            score=row.score,
+            rank=rank,
+        ))
+    session.add_all(snapshot)
+    return snapshot, [entry for entry in snapshot if entry.video_id not in previous]
+
+def category_top_k(session: Session) -> dict[str, list[tuple[int, float]]]:
+    """Top TRENDING_TOP_K (video_id, score) pairs of every category, in one windowed query."""
+    ranked = select(
+        TrendingScore.video_id, TrendingScore.score, Videos.category,
+        func.row_number().over(partition_by=Videos.category,
+                               order_by=desc(TrendingScore.score)).label("position"),
+    ).join(Videos, Videos.id == TrendingScore.video_id).subquery()
+
+    rankings = defaultdict(list)
+    for video_id, score, category, _ in session.exec(
+            select(ranked).where(ranked.c.position <= TRENDING_TOP_K, ranked.c.category.is_not(None))).all():
+        rankings[category].append((video_id, score))
+    return rankings
@@ -134,23 +134,15 @@ import os
 import tempfile
 import shutil
 from sqlmodel import Session, select, func, desc
-from .server import download_from_s3
-from ws_router.websockets import active_connections
-import asyncio
+from .server import download_from_s3, presigned_url, SegmentUploader
+from .encoding import HLS_RESOLUTIONS, probe_video, build_ladder, encode_hls, write_master_playlist
+from .chunks import CHUNKED_MIN_DURATION, dispatch_chunked
+from ws_router.bus import notification_bus
+from decouple import config
 s3 = boto3.client("s3")
 
-# Resolutions for HLS (resolution: (scale, video_bitrate))
-HLS_RESOLUTIONS = {
-    "1080p": ("1920x1080", "5000k"),
-    "720p": ("1280x720", "3000k"),
-    "480p": ("854x480", "1500k"),
-    "360p": ("640x360", "800k"),
-    "144p": ("256x144", "400k"),
-}
-
-AUDIO_BITRATE = "128k"  # Encode audio once
-
-import shutil
+# Let ffmpeg read the original from a presigned URL instead of staging it on local disk
+HLS_STREAM_SOURCE: bool = config('HLS_STREAM_SOURCE', cast=bool, default=False)
 
 @celery_app.task
 def process_video(file_key: str, bucket: str, video_id: int):
@@ -167,64 +159,15 @@ def process_video(file_key: str, bucket: str, video_id: int):
                 return f"Video {video_id} not found"
 
             # download input
-            local_input = download_from_s3(video.original_url, workdir)
+            if HLS_STREAM_SOURCE:
+                local_input = presigned_url(video.original_url)
+            else:
+                local_input = download_from_s3(video.original_url, workdir)
 
-            renditions = {}
-            # Audio only
-            audio_out = os.path.join(hls_dir, "audio.m3u8")
-            cmd_audio = [
-                "ffmpeg", "-i", local_input,
-                "-c:a", "aac", "-b:a", AUDIO_BITRATE,
-                "-vn",
-                "-f", "hls",
-                "-hls_time", "6",
-                "-hls_playlist_type", "vod",
-                "-hls_segment_filename", f"{hls_dir}/audio_%03d.ts",
-                audio_out
-            ]
-            subprocess.run(cmd_audio, check=True)
-
-            # Video renditions
-            for name, (scale, v_bitrate) in HLS_RESOLUTIONS.items():
-                video_out = os.path.join(hls_dir, f"{name}.m3u8")
-                cmd_video = [
-                    "ffmpeg", "-i", local_input,
-                    "-vf", f"scale={scale}",
-                    "-c:v", "h264", "-profile:v", "main",
-                    "-crf", "20", "-sc_threshold", "0",
-                    "-g", "48", "-keyint_min", "48",
-                    "-b:v", v_bitrate,
-                    "-maxrate", v_bitrate,
-                    "-bufsize", str(int(v_bitrate.replace("k", "")) * 2) + "k",
-                    "-an",
-                    "-f", "hls",
-                    "-hls_time", "6",
-                    "-hls_playlist_type", "vod",
-                    "-hls_segment_filename", f"{hls_dir}/{name}_%03d.ts",
-                    video_out
-                ]
-                subprocess.run(cmd_video, check=True)
-                renditions[name] = f"https://{bucket}.s3.amazonaws.com/hls/{video_id}/{name}.m3u8"
-
-            # Master playlist
-            master_playlist = os.path.join(hls_dir, "master.m3u8")
-            with open(master_playlist, "w") as m3u8:
-                m3u8.write("#EXTM3U\n#EXT-X-VERSION:3\n")
-                m3u8.write('#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",NAME="English",DEFAULT=YES,AUTOSELECT=YES,URI="audio.m3u8"\n')
-                for name, (scale, v_bitrate) in HLS_RESOLUTIONS.items():
-                    bw = int(v_bitrate.replace("k", "")) * 1000 + 128000
-                    w, h = scale.split("x")
-                    m3u8.write(
-                        f'#EXT-X-STREAM-INF:BANDWIDTH={bw},RESOLUTION={w}x{h},CODECS="avc1.4d401f,mp4a.40.2",AUDIO="audio"\n{name}.m3u8\n'
-                    )
-
-            # Upload all HLS files
-            for root, _, files in os.walk(hls_dir):
-                for file in files:
-                    path = os.path.join(root, file)
-                    key = f"hls/{video_id}/{file}"
-                    with open(path, "rb") as f:
-                        s3.upload_fileobj(f, bucket, key, ExtraArgs={"ACL": "public-read"})
+            # Only encode the rungs the source can actually fill
+            probe = probe_video(local_input)
+            ladder = build_ladder(probe)
+            gop = max(1, round(probe["fps"] * 2))  # keyframe every 2s so segments cut cleanly
 
             # Thumbnail
             thumbnail_path = os.path.join(workdir, "thumbnail.jpg")
@@ -237,10 +180,29 @@ def process_video(file_key: str, bucket: str, video_id: int):
             with open(thumbnail_path, "rb") as thumb_file:
                 s3.upload_fileobj(thumb_file, bucket, thumb_key, ExtraArgs={"ACL": "public-read"})
 
+            # Long uploads are split into chunks and encoded across workers
+            if probe["duration"] and probe["duration"] >= CHUNKED_MIN_DURATION:
+                video.thumbnail_url = f"https://{bucket}.s3.amazonaws.com/{thumb_key}"
+                session.add(video)
+                session.commit()
+                dispatch_chunked(local_input, workdir, video_id, bucket, ladder, gop, probe["audio"])
+                return "Chunked HLS processing started"
+
+            # Audio + video renditions, segments go up to S3 while ffmpeg is still encoding
+            with SegmentUploader(hls_dir, bucket, f"hls/{video_id}", {"ACL": "public-read"}):
+                encode_hls(local_input, hls_dir, ladder, gop, audio=probe["audio"])
+                write_master_playlist(hls_dir, ladder, probe["audio"])
+
+            renditions = {
+                name: f"https://{bucket}.s3.amazonaws.com/hls/{video_id}/{name}.m3u8"
+                for name in ladder
+            }
+
             # Update DB fields
             video.hls_url = f"https://{bucket}.s3.amazonaws.com/hls/{video_id}/master.m3u8"
             video.thumbnail_url = f"https://{bucket}.s3.amazonaws.com/{thumb_key}"
 
+            # rungs above the source height stay empty
             video.url_1080p = renditions.get("1080p")
             video.url_720p = renditions.get("720p")
             video.url_480p = renditions.get("480p")
@@ -250,24 +212,10 @@ def process_video(file_key: str, bucket: str, video_id: int):
             video.status = "complete"
             session.add(video)
             session.commit()
-            query = session.exec(select(Users).where(Users.id == video.creator_id)).first()
-            email = query.email
-            if email in active_connections:
-                asyncio.create_task(
-                    send_notification(
-                        email,
-                        "Your video has been uploaded successfully"
-                    )
-                )
+            notification_bus.publish(video.creator_id, "Your video has been uploaded successfully")
         return "HLS processing complete"
 
     finally:
 
         shutil.rmtree(workdir, ignore_errors=True)
 
-async def send_notification(email:str, message:str):
-    #print(f"Sending notification to {email}: {message}")
-    if email in active_connections:
-        await active_connections[email].send_json({
-            "message": message
-        })  
\ No newline at end of file
@@ -1,59 +1,64 @@
-from sqlmodels.tables_schema import WacthVideos, Videos, Trending
+from sqlmodels.tables_schema import WacthVideos, Videos, Trending, Notificaions
 from .celery import celery_app
 from sqlmodel import SQLModel, Session, func, select, desc
 from database.structure import get_session , engine
 import os
 from fastapi import Depends
 from push_notify.push_func import send_push_notifications
+from database.rollups import update_rollups
+from .trending import refresh_scores, swap_top_k, category_top_k
+from trending.index import publish_snapshot, GLOBAL
+from redis import RedisError
+from collections import defaultdict
+from datetime import datetime
 
 @celery_app.task()
 def calculate_trending():
     
+    now = datetime.utcnow()
     with Session(engine) as session:
-        # build subquery with score and totals
-        subq = (
-            select(
-                WacthVideos.video_id,
-                WacthVideos.creator_id,
-                func.count(WacthVideos.id).label("view_count"),
-                func.sum(WacthVideos.duration).label("total_duration"),
-                (func.count(WacthVideos.id) + func.sum(WacthVideos.duration) / 60).label("score"),
-            )
-            .group_by(WacthVideos.video_id, WacthVideos.creator_id)
-            .subquery()
-        )
-
-        # get max score
-        max_score = select(func.max(subq.c.score))
-
-        # select videos whose score >= 80% of max
-        query = (
-            select(subq)
-            .where(subq.c.score >= 0.8 * max_score.scalar_subquery())
-            .order_by(subq.c.score.desc())
-        )
+        # decay, new events and the top-K swap share one transaction,
+        # readers of Trending see either the old snapshot or the new one
+        refresh_scores(session, now)
+        snapshot, entered = swap_top_k(session)
+        rankings = category_top_k(session)
 
-        results = session.exec(query).all()
+        # one notification per creator, however many of their videos just entered
+        titles = defaultdict(list)
+        videos = session.exec(select(Videos).where(Videos.id.in_([t.video_id for t in entered]))).all()
+        for video in videos:
+            titles[video.creator_id].append(video.title)
+        session.add_all([
+            Notificaions(user_id=creator_id, message=trending_message(names), is_read=False, created_at=now)
+            for creator_id, names in titles.items()
+        ])
+        session.commit()
 
-        for video_id, creator_id, view_count, total_duration, score in results:
-            video = session.exec(select(Videos).where(Videos.video_id == video_id)).first()
-            if not video:
-                continue
+        rankings[GLOBAL] = [(entry.video_id, entry.score) for entry in snapshot]
+        ids = {video_id for ranking in rankings.values() for video_id, _ in ranking}
+        meta = {video.id: {"title": video.title, "category": video.category, "creator_id": video.creator_id,
+                           "thumbnail_url": video.thumbnail_url, "hls_url": video.hls_url}
+                for video in session.exec(select(Videos).where(Videos.id.in_(ids))).all()}
+        try:
+            publish_snapshot(rankings, meta)
+        except RedisError as e:
+            print(f"Could not publish trending snapshot: {e}")  # API keeps the previous one
 
-            trending = Trending(
-                creator_id=creator_id,
-                video=video.original_url,
-                views=view_count,
-                duration=total_duration,
-            )
+        for creator_id, names in titles.items():
+            send_push_notifications(creator_id, trending_message(names))
 
-            send_push_notifications(
-                session, creator_id, f"Congratulations! your {video.title} video is now trending"
-            )
+    return {"entered": len(entered)}
 
-            session.add(trending)
+def trending_message(titles: list[str]) -> str:
+    if len(titles) == 1:
+        return f"Congratulations! your {titles[0]} video is now trending"
+    return f"Congratulations! {len(titles)} of your videos are now trending: {', '.join(titles)}"
 
-        session.commit()
+@celery_app.task()
+def refresh_rollups():
+    # picks up where the stored watermarks stopped, beat runs it every few minutes
+    with Session(engine) as session:
+        return update_rollups(session)
 
 """  
 with Session(engine) as session:
@@ -78,7 +83,7 @@ with Session(engine) as session:
                 views = view_count,
                 duration = total_duration
             )
-            send_push_notifications(session, creator_id, f"Congratulations! your {query.title} video is now trending")
+            send_push_notifications(creator_id, f"Congratulations! your {query.title} video is now trending")
             session.add(trending)
         session.commit() 
         """
@@ -1,5 +1,6 @@
 from datetime import datetime, date
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index, text, BigInteger
 from pydantic import field_validator 
 import re
 from typing import Optional, List
@@ -42,8 +43,8 @@ class Users(SQLModel, table = True):
             
       id : int = Field(default = None,primary_key = True) 
       name : str = Field(default = None, nullable = False)   
-      role : Optional[str] = Field(default = "user")
-      email : str = Field(default=None, nullable = False)
+      role : Optional[str] = Field(default = "user", index = True)
+      email : str = Field(default=None, nullable = False, unique = True, index = True)
       password : str = Field(default = None, nullable = False)     
       created_at :  date = Field(default = date.today(), nullable = False)
       is_banned : bool = Field(default=False)
@@ -63,7 +64,7 @@ class ForgetPassword(SQLModel):
                 
 class Videos(SQLModel, table=True):
     id: int = Field(default=None, primary_key=True)
-    creator_id : int = Field(default=None, foreign_key="users.id")
+    creator_id : int = Field(default=None, foreign_key="users.id", index=True)
     title: str
     description: str | None = None
     category: str | None = None
@@ -97,22 +98,24 @@ class Reports(SQLModel, table= True):
         
 
 class WacthVideos(SQLModel, table=True):
+    # play/pause/resume look a watch up by video and viewer
+    __table_args__ = (Index("ix_wacthvideos_video_id_user_id", "video_id", "user_id"),)
     id : int = Field(default=None, primary_key=True)
     video_id : int = Field(default=None, foreign_key="videos.id")
-    creator_id : int = Field(default=None, foreign_key="users.id")
-    user_id : int = Field(default=None, foreign_key="users.id")
+    creator_id : int = Field(default=None, foreign_key="users.id", index=True)
+    user_id : int = Field(default=None, foreign_key="users.id", index=True)
     start_time :Optional[datetime] = Field(default = None, nullable = False)
-    last_stop : Optional[datetime] = Field(default = None, nullable = False)
-    end_time : Optional[datetime] = Field(default = None, nullable = False)
+    last_stop : Optional[datetime] = Field(default = None, nullable = True)  # None while paused
+    end_time : Optional[datetime] = Field(default = None, nullable = True)
     duration : Optional[int] = Field(default = 0, nullable = False)  # in seconds
     
 
 class Comments(SQLModel, table=True):
     id : int = Field(default=None, primary_key=True)
-    user_id : int = Field(default=None, foreign_key="users.id")
-    video_id : int = Field(default=None, foreign_key="videos.id")
+    user_id : int = Field(default=None, foreign_key="users.id", index=True)
+    video_id : int = Field(default=None, foreign_key="videos.id", index=True)
     # Top level comment can have many replies
-    parent_comment_id : int | None = Field(default=None, foreign_key="comments.id")
+    parent_comment_id : int | None = Field(default=None, foreign_key="comments.id", index=True)
 
     text : str = Field(default=None)
     created_at : Optional[datetime] = Field(default= None )
@@ -137,12 +140,15 @@ class SubscriptionLink(SQLModel, table=True):
     
     
 class Subscription(SQLModel, table=True):
+    __table_args__ = (Index("ix_subscription_creator_id_user_id", "creator_id", "user_id"),)
     id : int = Field(default=None, primary_key=True)
-    user_id : int = Field(default=None, foreign_key="users.id")    
+    user_id : int = Field(default=None, foreign_key="users.id", index=True)    
     creator_id : int = Field(default=None, foreign_key="users.id")
     notifications : bool = Field(default=True)
     
 class Notificaions(SQLModel, table = True):
+    # unread notifications are fetched per user
+    __table_args__ = (Index("ix_notificaions_user_id_is_read", "user_id", "is_read"),)
     id : int = Field(default=None, primary_key=True)
     user_id : int = Field(default=None, foreign_key="users.id")    
     message : str  = Field(default=None)
@@ -150,15 +156,23 @@ class Notificaions(SQLModel, table = True):
     created_at : Optional[datetime] = Field(default = None )  
     
 class LikesDislikes(SQLModel, table=True):
+    # one vote per viewer per video, like_dislike flips the existing row
+    __table_args__ = (Index("ix_likesdislikes_video_id_user_id", "video_id", "user_id", unique=True),
+                      Index("ix_likesdislikes_user_id_is_like", "user_id", "is_like"))
     id : int = Field(default=None, primary_key=True)
     video_id : int = Field(default=None, foreign_key="videos.id")    
     user_id : int = Field(default=None, foreign_key="users.id")
     is_like : bool = Field(default=True)  # True for like, False for dislike    
     
 class Analytics(SQLModel, table=True):
+    # one row per video, plus one per creator (video_id NULL) for channel metrics,
+    # counters are only changed through database/counters.py
+    __table_args__ = (Index("ix_analytics_creator_channel", "creator_id", unique=True,
+                            sqlite_where=text("video_id IS NULL"),
+                            postgresql_where=text("video_id IS NULL")),)
     id : int = Field(default=None, primary_key=True)
-    video_id : int = Field(default=None, foreign_key="videos.id")    
-    creator_id : int = Field(default=None, foreign_key="users.id")
+    video_id : int | None = Field(default=None, foreign_key="videos.id", unique=True, index=True)    
+    creator_id : int = Field(default=None, foreign_key="users.id", index=True)
     views : int | None = Field(default=0)
     likes : int | None = Field(default=0)
     dislikes : int | None = Field(default=0)
@@ -168,7 +182,7 @@ class Analytics(SQLModel, table=True):
     
 class Channels(SQLModel, table=True):
     id : int = Field(default=None, primary_key=True)
-    creator_id : int = Field(default=None, foreign_key="users.id")
+    creator_id : int = Field(default=None, foreign_key="users.id", index=True)
     name : str = Field(default=None)
     content_type : str | None = Field(default = None)
     created_at : Optional[datetime] = Field(default = None )    
@@ -183,7 +197,7 @@ class Complain(SQLModel, table = True):
     
 class History(SQLModel, table = True):
     id : int = Field(default=None, primary_key=True)
-    user_id : int = Field(default=None, foreign_key="users.id")
+    user_id : int = Field(default=None, foreign_key="users.id", index=True)
     video_id : int = Field(default=None, foreign_key="videos.id")
     video_url : str | None = Field(default=None)
     watched_at : Optional[datetime] = Field(default = None )    
@@ -202,4 +216,70 @@ class Trending(SQLModel, table = True):
     creator_id : int = Field(default=None, foreign_key="users.id")
     video : str = Field(default = None , foreign_key = "videos.original_url" )
     views : int = Field(default = None)
-    duration : int = Field(default = None)
\ No newline at end of file
+    duration : int = Field(default = None)
+    # snapshot of the current top-K, replaced as a whole by calculate_trending
+    video_id : int | None = Field(default=None, foreign_key="videos.id")
+    score : float | None = Field(default=None)
+    rank : int | None = Field(default=None)
+
+class TrendingScore(SQLModel, table = True):
+    video_id : int = Field(default=None, foreign_key="videos.id", primary_key=True)
+    creator_id : int = Field(default=None, foreign_key="users.id")
+    score : float = Field(default=0, index=True)  # decayed to the time of the last trending run
+class UploadSessions(SQLModel, table=True):
+    id : str = Field(default=None, primary_key=True)  # uuid handed to the client
+    creator_id : int = Field(default=None, foreign_key="users.id")
+    s3_key : str = Field(default=None)
+    upload_id : str | None = Field(default=None)  # S3 multipart upload id, None for a presigned POST
+    title : str = Field(default=None)
+    description : str | None = None
+    category : str | None = None
+    tags : str | None = None
+    disable_comments : bool = Field(default=False)
+    size : int | None = Field(default=None, sa_type=BigInteger)  # total bytes announced by the client, can pass 2 GiB
+    status : str = Field(default="open")  # open, completing, completed, aborted
+    video_id : int | None = Field(default=None, foreign_key="videos.id")
+    created_at : Optional[datetime] = Field(default = None )
+
+class UploadedPart(SQLModel):
+    part_number : int
+    etag : str
+
+class CompleteUpload(SQLModel):
+    parts : List[UploadedPart] = []  # only for multipart presigned uploads
+
+class UploadParts(SQLModel, table=True):
+    session_id : str = Field(default=None, foreign_key="uploadsessions.id", primary_key=True)
+    part_number : int = Field(default=None, primary_key=True)
+    etag : str = Field(default=None)
+    size : int = Field(default=0)
+
+class RollupCounts(SQLModel):
+    creator_id : int = Field(default=None, foreign_key="users.id")
+    views : int = Field(default=0)
+    unique_viewers : int = Field(default=0)  # summed per video, not distinct across a creator's videos
+    watch_seconds : int = Field(default=0)
+    likes : int = Field(default=0)
+    dislikes : int = Field(default=0)
+    comments : int = Field(default=0)
+
+class HourlyRollup(RollupCounts, table=True):
+    __table_args__ = (Index("ix_hourlyrollup_creator_id_bucket", "creator_id", "bucket"),
+                      Index("ix_hourlyrollup_bucket", "bucket"))
+    video_id : int = Field(default=None, foreign_key="videos.id", primary_key=True)
+    bucket : datetime = Field(default=None, primary_key=True)  # start of the hour, UTC
+
+class DailyRollup(RollupCounts, table=True):
+    __table_args__ = (Index("ix_dailyrollup_creator_id_bucket", "creator_id", "bucket"),
+                      Index("ix_dailyrollup_bucket", "bucket"))
+    video_id : int = Field(default=None, foreign_key="videos.id", primary_key=True)
+    bucket : datetime = Field(default=None, primary_key=True)  # midnight, UTC
+
+class RollupWatermark(SQLModel, table=True):
+    source : str = Field(default=None, primary_key=True)  # table the rollup job reads
+    last_id : int = Field(default=0)
+    updated_at : Optional[datetime] = Field(default = None )
+
+class AppliedSegment(SQLModel, table=True):
+    name : str = Field(default=None, primary_key=True)  # watch buffer log whose batch is committed
+    applied_at : Optional[datetime] = Field(default = None )
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import tempfile
+
+# settings are read at import time, point them at throwaway locations before any app module loads
+TMP = tempfile.mkdtemp(prefix="streaming-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{TMP}/test.db")
+os.environ.setdefault("WATCH_BUFFER_DIR", os.path.join(TMP, "watch_buffer"))
+os.environ.setdefault("NOTIFY_BUS_URL", "local")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+import moto  # noqa: E402  must patch botocore before the modules create their clients
+import pytest  # noqa: E402
+from sqlmodel import SQLModel, Session, select, func  # noqa: E402
+from database.structure import engine, async_engine  # noqa: E402
+import sqlmodels.tables_schema  # noqa: E402,F401
+import push_notify.sub  # noqa: E402,F401
+
+@pytest.fixture
+def db():
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    SQLModel.metadata.drop_all(engine)
+    # a test's event loops end with it, the async pool must not keep waiters bound to them
+    asyncio.run(async_engine.dispose())
+
+@pytest.fixture
+def session(db):
+    with Session(db) as session:
+        yield session
+
+def make_user(session, role: str = "user", name: str | None = None):
+    from sqlmodels.tables_schema import Users
+    from oauth2.jwt_hashing import create_access_token
+    name = name or f"{role}{session.exec(select(func.count()).select_from(Users)).one() + 1}"
+    user = Users(name=name, email=f"{name}@example.com", password="x", role=role)
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+    token = create_access_token({"sub": user.email, "id": user.id, "role": role})
+    return user, {"Authorization": f"Bearer {token}"}
+
+@pytest.fixture
+def buffer(db, tmp_path):
+    from database.watch_buffer import watch_buffer, LogSegment
+    # what start() does, minus the background flush loop
+    watch_buffer.directory, watch_buffer.name = str(tmp_path), "test"
+    watch_buffer.segment = LogSegment(str(tmp_path / "test.log"))
+    yield watch_buffer
+    watch_buffer.pending, watch_buffer.retry, watch_buffer.count = {}, [], 0
+    watch_buffer.sealed, watch_buffer.discarded = 0, []
+    watch_buffer.known.clear()
+    watch_buffer.segment = None
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+    from main.main import app
+    from oauth2.principal_cache import principal_cache
+    principal_cache.clear()
+    # no `with`, so the startup hooks (Redis index, watch buffer task) don't run
+    return TestClient(app)
+
+def make_video(session, creator, **fields):
+    from sqlmodels.tables_schema import Videos
+    video = Videos(creator_id=creator.id, title=fields.pop("title", "clip"), status="available",
+                   original_url="https://example.com/clip.mp4", **fields)
+    session.add(video)
+    session.commit()
+    session.refresh(video)
+    return video
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import statistics
+import time
+import fakeredis
+import pytest
+from ws_router import bus
+from ws_router.bus import NotificationBus, NOTIFY_CHANNEL
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(bus.redis.Redis, "from_url", lambda url: fakeredis.FakeRedis(server=server))
+    monkeypatch.setattr(bus.aioredis.Redis, "from_url", lambda url: fakeredis.FakeAsyncRedis(server=server))
+    return server
+
+class Inbox:
+    def __init__(self):
+        self.received: list[tuple[dict, float]] = []
+        self.arrived = asyncio.Event()
+        self.expected = 1
+
+    async def deliver(self, payload: dict) -> None:
+        payload.pop("user_id")  # what ws_router.websockets.deliver does
+        self.received.append((payload, time.perf_counter()))
+        if len(self.received) >= self.expected:
+            self.arrived.set()
+
+    async def wait_for(self, count: int, timeout: float = 10) -> None:
+        self.expected = count
+        self.arrived.clear()
+        if len(self.received) < count:
+            await asyncio.wait_for(self.arrived.wait(), timeout)
+
+async def started_bus(inbox: Inbox) -> NotificationBus:
+    notification_bus = NotificationBus("redis://bus")
+    await notification_bus.start(inbox.deliver)
+    await asyncio.sleep(0.05)  # let the subscriber reach SUBSCRIBE
+    return notification_bus
+
+def test_publish_from_the_loop_does_not_block(redis_server, monkeypatch):
+    async def run():
+        inbox = Inbox()
+        notification_bus = await started_bus(inbox)
+        # the sync client must not be touched from inside the event loop
+        monkeypatch.setattr(bus.redis.Redis, "from_url", lambda url: pytest.fail("blocking publish"))
+        notification_bus.publish(1, "hello")
+        await inbox.wait_for(1)
+        await notification_bus.stop()
+        return inbox.received
+    [(payload, _)] = asyncio.run(run())
+    assert payload == {"message": "hello"}
+
+def test_malformed_messages_do_not_stop_the_subscriber(redis_server):
+    async def run():
+        inbox = Inbox()
+        notification_bus = await started_bus(inbox)
+        raw = fakeredis.FakeAsyncRedis(server=redis_server)
+        await raw.publish(NOTIFY_CHANNEL, "not json")
+        await raw.publish(NOTIFY_CHANNEL, json.dumps({"message": "no user"}))
+        notification_bus.publish(2, "still here")
+        await inbox.wait_for(1)
+        alive = not notification_bus.task.done()
+        await notification_bus.stop()
+        return alive, inbox.received
+    alive, received = asyncio.run(run())
+    assert alive and [payload["message"] for payload, _ in received] == ["still here"]
+
+def test_fan_out_latency(redis_server):
+    messages = 500
+
+    async def run():
+        inbox = Inbox()
+        notification_bus = await started_bus(inbox)
+        sent = {}
+        for n in range(messages):
+            sent[n] = time.perf_counter()
+            notification_bus.publish(n, "ping", seq=n)
+        # Celery and threadpool handlers take the sync path
+        for n in range(messages, 2 * messages):
+            sent[n] = time.perf_counter()
+            await asyncio.to_thread(notification_bus.publish, n, "ping", seq=n)
+        await inbox.wait_for(2 * messages)
+        await notification_bus.stop()
+        return [(arrived - sent[payload["seq"]]) * 1000 for payload, arrived in inbox.received]
+
+    latencies = sorted(asyncio.run(run()))
+    assert len(latencies) == 2 * messages
+    p50, p99 = statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+    print(f"\nbus fan-out over {len(latencies)} messages: p50 {p50:.2f} ms, p99 {p99:.2f} ms")
@@ -0,0 +1,94 @@
+import json
+import os
+import shutil
+import subprocess
+import boto3
+import pytest
+from moto import mock_aws
+from s3_worker import chunks, encoding
+from s3_worker.chunks import chunks_failed, discontinuities, split_source, stitch_chunks
+from sqlmodels.tables_schema import Users, Videos
+
+def fake_ffprobe(streams):
+    def run(cmd, **kwargs):
+        out = json.dumps({"streams": streams, "format": {"duration": "700.0", "bit_rate": "4000000"}})
+        return subprocess.CompletedProcess(cmd, 0, stdout=out)
+    return run
+
+def test_probe_reports_missing_audio(monkeypatch):
+    monkeypatch.setattr(encoding.subprocess, "run", fake_ffprobe(
+        [{"codec_type": "video", "height": 720, "r_frame_rate": "30/1"}]))
+    probe = encoding.probe_video("silent.mp4")
+    assert probe["height"] == 720 and probe["audio"] is False
+
+    monkeypatch.setattr(encoding.subprocess, "run", fake_ffprobe(
+        [{"codec_type": "audio"}, {"codec_type": "video", "height": 1080, "r_frame_rate": "25/1"}]))
+    probe = encoding.probe_video("talk.mp4")
+    assert probe["height"] == 1080 and probe["audio"] is True
+
+def test_silent_sources_get_no_audio_rendition(tmp_path):
+    ladder = {"720p": ("1280x720", "3000k")}
+    with open(encoding.write_master_playlist(str(tmp_path), ladder, audio=False)) as f:
+        master = f.read()
+    assert "audio" not in master.lower() and "mp4a" not in master
+
+    cmd = encoding.split_command("in.mp4", str(tmp_path), ladder, audio=False)
+    assert "0:a?" not in cmd
+
+@mock_aws
+def test_failed_chord_marks_video_failed_and_removes_chunks(session):
+    s3 = boto3.client("s3")
+    s3.create_bucket(Bucket="videos")
+    for i in range(3):
+        s3.put_object(Bucket="videos", Key=f"chunks/1/chunk_{i:04d}.mkv", Body=b"x")
+    s3.put_object(Bucket="videos", Key="chunks/2/chunk_0000.mkv", Body=b"x")
+
+    session.add(Users(id=1, name="c", email="c@x.com", password="p", role="creator"))
+    session.add(Videos(id=1, creator_id=1, title="long", status="processing"))
+    session.commit()
+
+    chunks_failed(None, RuntimeError("ffmpeg exited 1"), None, 1, "videos")
+
+    session.expire_all()
+    assert session.get(Videos, 1).status == "failed"
+    keys = [o["Key"] for o in s3.list_objects_v2(Bucket="videos").get("Contents", [])]
+    assert keys == ["chunks/2/chunk_0000.mkv"]
+
+@mock_aws
+def test_stitched_playlist_marks_chunks_whose_timestamps_reset(db):
+    s3 = boto3.client("s3")
+    s3.create_bucket(Bucket="videos")
+    ladder = {"360p": ("640x360", "800k")}
+    results = [
+        {"start": 1.4, "renditions": {"360p": [(6.0, "360p_c0000_000.ts"), (6.0, "360p_c0000_001.ts")]}},
+        {"start": 13.4, "renditions": {"360p": [(6.0, "360p_c0001_000.ts")]}},
+        {"start": 1.4, "renditions": {"360p": [(6.0, "360p_c0002_000.ts")]}},  # encoded without its offset
+    ]
+    stitch_chunks(results, 99, "videos", ladder, audio=False)
+
+    playlist = s3.get_object(Bucket="videos", Key="hls/99/360p.m3u8")["Body"].read().decode().splitlines()
+    assert playlist.count("#EXT-X-DISCONTINUITY") == 1
+    assert playlist[playlist.index("#EXT-X-DISCONTINUITY") + 2] == "360p_c0002_000.ts"
+
+@pytest.mark.skipif(not (shutil.which("ffmpeg") and shutil.which("ffprobe")), reason="ffmpeg not installed")
+def test_offset_chunks_continue_the_timeline(tmp_path, monkeypatch):
+    source = str(tmp_path / "source.mp4")
+    subprocess.run(["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc=duration=6:size=320x180:rate=30",
+                    "-c:v", "libx264", "-g", "30", source], check=True)
+    monkeypatch.setattr(chunks, "CHUNK_SECONDS", 2)
+    os.makedirs(tmp_path / "chunks")
+    ladder = {"144p": ("256x144", "400k")}
+
+    results = []
+    for index, (path, start) in enumerate(split_source(source, str(tmp_path / "chunks"))):
+        # what encode_chunk does, minus the S3 round trips
+        out = tmp_path / f"out{index}"
+        out.mkdir()
+        tag = f"_c{index:04d}"
+        encoding.encode_hls(path, str(out), ladder, gop=30, audio=False, tag=tag,
+                            input_args=["-copyts", "-itsoffset", f"{start:.6f}"])
+        segments = encoding.read_segments(str(out / f"144p{tag}.m3u8"))
+        results.append({"start": encoding.start_time(str(out / segments[0][1])), "renditions": {"144p": segments}})
+
+    assert len(results) == 3
+    assert discontinuities(results, "144p") == set()
@@ -0,0 +1,119 @@
+import asyncio
+import httpx
+import pytest
+from sqlmodel import select
+from push_notify import push_func
+from sqlmodels.tables_schema import Analytics, Channels, Comments, Subscription, SubscriptionLink, LikesDislikes
+from conftest import make_user, make_video
+
+@pytest.fixture(autouse=True)
+def no_push(monkeypatch):
+    monkeypatch.setattr(push_func.deliver_batch, "delay", lambda *args: None)
+
+def creator_analytics(session, creator_id):
+    session.expire_all()
+    return session.exec(select(Analytics).where(Analytics.creator_id == creator_id,
+                                                Analytics.video_id.is_(None))).one()
+
+def test_subscribe_links_the_new_subscription(client, session):
+    creator, _ = make_user(session, "creator")
+    session.add(Channels(creator_id=creator.id, name="chan"))
+    session.commit()
+    user, headers = make_user(session)
+
+    response = client.post("/user/subscribe", params={"creator_id": creator.id}, headers=headers)
+    assert response.status_code == 200, response.text
+    subscription = session.exec(select(Subscription).where(Subscription.user_id == user.id)).one()
+    link = session.exec(select(SubscriptionLink).where(SubscriptionLink.user_id == user.id)).one()
+    assert link.subsription_id == subscription.id
+    assert creator_analytics(session, creator.id).subscription == 1
+
+def test_unsubscribe_removes_subscription_and_notifies(client, session, monkeypatch):
+    from ws_router.bus import notification_bus
+    published = []
+    monkeypatch.setattr(notification_bus, "publish", lambda user_id, msg: published.append((user_id, msg)))
+    creator, _ = make_user(session, "creator")
+    session.add(Channels(creator_id=creator.id, name="chan"))
+    session.commit()
+    user, headers = make_user(session)
+    assert client.post("/user/subscribe", params={"creator_id": creator.id}, headers=headers).status_code == 200
+
+    response = client.delete("/user/unsubscribe", params={"creator_id": creator.id}, headers=headers)
+    assert response.status_code == 200, response.text
+    session.expire_all()
+    assert session.exec(select(Subscription).where(Subscription.user_id == user.id)).first() is None
+    assert creator_analytics(session, creator.id).subscription == 0
+    assert published[-1] == (user.id, "Unsubscribed to chan")
+
+    assert client.delete("/user/unsubscribe", params={"creator_id": creator.id}, headers=headers).status_code == 404
+
+def test_reply_and_delete_comment_keep_the_counter(client, session):
+    creator, _ = make_user(session, "creator")
+    video = make_video(session, creator)
+    other = make_video(session, creator)
+    _, headers = make_user(session)
+
+    assert client.post("/user/comment", params={"video_id": video.id},
+                       data={"text": "first"}, headers=headers).status_code == 200
+    parent = session.exec(select(Comments).where(Comments.video_id == video.id)).one()
+    response = client.post("/user/reply_comment", params={"video_id": video.id, "parent_comment_id": parent.id},
+                           data={"text": "reply"}, headers=headers)
+    assert response.status_code == 200, response.text
+    session.expire_all()
+    assert session.exec(select(Analytics).where(Analytics.video_id == video.id)).one().comments == 2
+
+    # ids sent by the client are ignored, the counter follows the deleted row
+    response = client.delete("/user/delete_comment", params={"comment_id": parent.id, "video_id": other.id,
+                                                             "creator_id": 0}, headers=headers)
+    assert response.status_code == 200, response.text
+    session.expire_all()
+    assert session.exec(select(Analytics).where(Analytics.video_id == video.id)).one().comments == 0
+    assert session.exec(select(Analytics).where(Analytics.video_id == other.id)).first() is None
+
+def test_no_lost_likes_with_100_parallel_likers(client, session):
+    creator, _ = make_user(session, "creator")
+    video = make_video(session, creator)
+    likers = [make_user(session)[1] for _ in range(100)]
+
+    async def react(viewers, is_like):
+        # one event loop like a uvicorn worker, all requests in flight together
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=client.app),
+                                     base_url="http://test") as http:
+            responses = await asyncio.gather(*(
+                http.post("/user/like_dislike", params={"video_id": video.id, "is_like": is_like},
+                          headers=headers) for headers in viewers))
+        return {response.status_code for response in responses}
+
+    def counters():
+        session.expire_all()
+        row = session.exec(select(Analytics).where(Analytics.video_id == video.id)).one()
+        return row.likes, row.dislikes
+
+    async def run():
+        assert await react(likers, True) == {200}
+        assert counters() == (100, 0)
+        assert len(session.exec(select(LikesDislikes).where(LikesDislikes.video_id == video.id)).all()) == 100
+
+        # half of them change their mind at the same time
+        assert await react(likers[:50], False) == {200}
+        assert counters() == (50, 50)
+    asyncio.run(run())
+
+def test_same_user_double_like_is_not_a_500(client, session):
+    creator, _ = make_user(session, "creator")
+    video = make_video(session, creator)
+    _, headers = make_user(session)
+
+    async def react():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=client.app),
+                                     base_url="http://test") as http:
+            responses = await asyncio.gather(*(
+                http.post("/user/like_dislike", params={"video_id": video.id, "is_like": True},
+                          headers=headers) for _ in range(10)))
+        return {response.status_code for response in responses}
+
+    assert asyncio.run(react()) == {200}
+    session.expire_all()
+    row = session.exec(select(Analytics).where(Analytics.video_id == video.id)).one()
+    assert (row.likes, row.dislikes) == (1, 0)
+    assert len(session.exec(select(LikesDislikes).where(LikesDislikes.video_id == video.id)).all()) == 1
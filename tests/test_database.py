@@ -0,0 +1,100 @@
+import os
+import time
+from datetime import datetime
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+from sqlmodel import Session, SQLModel, select
+from database.structure import engine, get_session, is_sqlite, set_sqlite_pragmas
+from oauth2.jwt_hashing import get_current_user
+from sqlmodels.tables_schema import Analytics, History, Users, Videos, WacthVideos
+from conftest import TMP
+from conftest import make_user, make_video
+
+# /user/play_video as it was before the port: the hardcoded engine with echo=True, no pragmas,
+# and a sync Session. refresh() on the pending rows and the unbound `watch` on a replay made the
+# original crash, those two lines are the only ones changed
+baseline_engine = create_engine(f"sqlite:///{os.path.join(TMP, 'baseline.db')}", echo=True,
+                                connect_args={"check_same_thread": False})
+baseline = FastAPI()
+
+def get_baseline_session():
+    with Session(baseline_engine) as session:
+        yield session
+baseline.dependency_overrides[get_session] = get_baseline_session
+
+@baseline.post('/user/play_video')
+async def baseline_play_video(video_id : int,
+               session: Session = Depends(get_session),
+               current_user : Users = Depends(get_current_user())):
+    timestamp = datetime.utcnow()
+    video = session.get(Videos, video_id)
+    watch = session.exec(select(WacthVideos).where(WacthVideos.video_id == video_id,
+                                       WacthVideos.creator_id == video.creator_id,
+                                       WacthVideos.user_id == current_user.id)).first()
+    if not watch:
+        watch = WacthVideos(video_id = video_id, creator_id = video.creator_id, user_id = current_user.id,
+                            start_time = timestamp, last_stop = timestamp, end_time = None, duration = 0)
+        session.add(watch)
+        session.flush()
+    session.add(History(video_id = video_id, video_url = video.original_url,
+                        user_id = current_user.id, watched_at = timestamp))
+    analytics = session.exec(select(Analytics).where(Analytics.video_id == video_id)).first()
+    if analytics:
+        analytics.views += 1
+    else:
+        session.add(Analytics(video_id = video_id, creator_id = video.creator_id, views = 1))
+    session.commit()
+    return {"message": f"Video started", "watch_id" : watch.id}
+
+def play_videos_per_second(http, video_id, viewers, requests=200) -> float:
+    started = time.perf_counter()
+    for n in range(requests):
+        response = http.post("/user/play_video", params={"video_id": video_id},
+                             headers=viewers[n % len(viewers)])
+        assert response.status_code == 200, response.text
+    return requests / (time.perf_counter() - started)
+
+def test_sqlite_pragmas_are_applied(db):
+    assert is_sqlite
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() > 0
+        assert connection.execute(text("PRAGMA mmap_size")).scalar() > 0
+
+def test_play_video_throughput_before_and_after(client, session, buffer):
+    SQLModel.metadata.drop_all(baseline_engine)
+    SQLModel.metadata.create_all(baseline_engine)
+    with Session(baseline_engine) as old:
+        # same names and ids as below, so the tokens mean the same user in both databases
+        old_video_id = make_video(old, make_user(old, "creator")[0]).id
+        old_viewers = [make_user(old)[1] for _ in range(20)]
+    creator, _ = make_user(session, "creator")
+    video = make_video(session, creator)
+    viewers = [make_user(session)[1] for _ in range(20)]
+
+    before = play_videos_per_second(TestClient(baseline), old_video_id, old_viewers)
+    after = play_videos_per_second(client, video.id, viewers)
+    baseline_engine.dispose()
+    print(f"\n/user/play_video: {before:.0f} requests/s before, {after:.0f} requests/s after")
+
+def commits_per_second(url: str, tuned: bool, commits: int = 300) -> float:
+    bench = create_engine(url)
+    if tuned:
+        event.listen(bench, "connect", set_sqlite_pragmas)
+    with bench.connect() as connection:
+        connection.execute(text("CREATE TABLE hits (id INTEGER PRIMARY KEY, video_id INTEGER)"))
+        connection.commit()
+        started = time.perf_counter()
+        for n in range(commits):
+            connection.execute(text("INSERT INTO hits (video_id) VALUES (:n)"), {"n": n})
+            connection.commit()
+        elapsed = time.perf_counter() - started
+    bench.dispose()
+    return commits / elapsed
+
+def test_sqlite_commit_throughput_before_and_after():
+    before = commits_per_second(f"sqlite:///{os.path.join(TMP, 'default.db')}", tuned=False)
+    after = commits_per_second(f"sqlite:///{os.path.join(TMP, 'tuned.db')}", tuned=True)
+    print(f"\nsqlite commits/s: {before:.0f} with the defaults, {after:.0f} with WAL and synchronous=NORMAL")
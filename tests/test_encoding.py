@@ -0,0 +1,47 @@
+import os
+import shutil
+import subprocess
+import time
+import pytest
+from s3_worker import encoding
+
+pytestmark = pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg not installed")
+
+LADDER = {"360p": ("640x360", "800k"), "144p": ("256x144", "400k")}
+
+@pytest.fixture(scope="module")
+def testsrc(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("src") / "testsrc.mp4")
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc=duration=8:size=640x360:rate=30",
+        "-f", "lavfi", "-i", "sine=frequency=440:duration=8",
+        "-c:v", "libx264", "-c:a", "aac", "-shortest", path,
+    ], check=True)
+    return path
+
+def encode_serial(local_input, hls_dir, ladder, gop):
+    # the per-rendition loop the worker ran before, one ffmpeg after the other
+    for cmd in encoding.rendition_commands(local_input, hls_dir, ladder, gop):
+        subprocess.run(cmd, check=True)
+
+def test_encode_ladder_benchmark(testsrc, tmp_path, monkeypatch):
+    # wall clock of every strategy on the same clip, run with -s to see the numbers
+    timings = {}
+    for mode in ("serial", "split", "pool"):
+        out = tmp_path / mode
+        out.mkdir()
+        started = time.perf_counter()
+        if mode == "serial":
+            encode_serial(testsrc, str(out), LADDER, gop=60)
+        else:
+            monkeypatch.setattr(encoding, "HLS_ENCODE_MODE", mode)
+            encoding.encode_hls(testsrc, str(out), LADDER, gop=60)
+        timings[mode] = time.perf_counter() - started
+
+        for name in list(LADDER) + ["audio"]:
+            segments = encoding.read_segments(os.path.join(out, f"{name}.m3u8"))
+            assert segments, (mode, name)
+            assert sum(duration for duration, _ in segments) == pytest.approx(8, abs=0.5)
+
+    print(f"\n{len(LADDER)} renditions + audio: " + ", ".join(
+        f"{mode} {elapsed:.2f}s ({timings['serial'] / elapsed:.1f}x)" for mode, elapsed in timings.items()))
@@ -0,0 +1,26 @@
+import zlib
+import pytest
+from database import export
+from database.export import export_rows
+from conftest import make_user
+
+@pytest.fixture
+def users(session, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_BATCH_ROWS", 2)
+    return [make_user(session)[0] for _ in range(5)]
+
+def test_every_gzip_chunk_inflates_on_arrival(users):
+    inflate = zlib.decompressobj(31)
+    batches = []
+    for chunk in export_rows("users", "ndjson", compress=True):
+        text = inflate.decompress(chunk).decode()
+        if text:
+            # nothing of a batch is held back in the compressor
+            assert text.endswith("\n")
+            batches.append(text.splitlines())
+    assert inflate.eof
+    assert [len(rows) for rows in batches] == [2, 2, 1]
+
+def test_csv_export_has_a_header(users):
+    body = b"".join(export_rows("users", "csv")).decode().splitlines()
+    assert body[0].split(",")[:3] == ["id", "name", "email"] and len(body) == 6
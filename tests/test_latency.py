@@ -0,0 +1,60 @@
+import asyncio
+import statistics
+import time
+from datetime import date
+import httpx
+import pytest
+from fastapi import Depends, FastAPI, Form
+from sqlmodel import Session
+from database.rollups import bump_engagement
+from database.structure import get_session
+from oauth2.jwt_hashing import get_current_user
+from push_notify import push_func
+from sqlmodels.tables_schema import Comments, Users, Videos
+from conftest import make_user, make_video
+
+BROKER_SECONDS = 0.002  # one Redis round trip to enqueue the push
+
+@pytest.fixture(autouse=True)
+def slow_broker(monkeypatch):
+    monkeypatch.setattr(push_func.deliver_batch, "delay", lambda *args: time.sleep(BROKER_SECONDS))
+
+# /user/comment as it was before the port, the sync Session and the enqueue run on the event loop
+baseline = FastAPI()
+
+@baseline.post('/user/comment')
+async def post_comment(video_id : int, text : str = Form(),
+                 session: Session = Depends(get_session),
+                 current_user : Users = Depends(get_current_user())):
+    video = session.get(Videos, video_id)
+    session.add(Comments(video_id=video_id, user_id=current_user.id, text=text, created_at=date.today()))
+    bump_engagement(session, video_id, video.creator_id, comments=1)
+    session.commit()
+    push_func.send_push_notifications(video.creator_id, f"{current_user.name} just commented on your video")
+    return {'message' : 'Comment posted successfully'}
+
+async def latencies(app, video_id, viewers, requests=300, concurrency=50):
+    slots = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+        async def one(n):
+            async with slots:
+                started = time.perf_counter()
+                response = await http.post("/user/comment", params={"video_id": video_id},
+                                           data={"text": "nice"}, headers=viewers[n % len(viewers)])
+                assert response.status_code == 200, response.text
+                return time.perf_counter() - started
+        return await asyncio.gather(*(one(n) for n in range(requests)))
+
+def p50_p99(samples):
+    cuts = statistics.quantiles(samples, n=100)
+    return cuts[49] * 1000, cuts[98] * 1000
+
+def test_comment_tail_latency_before_and_after(client, session):
+    creator, _ = make_user(session, "creator")
+    video = make_video(session, creator)
+    viewers = [make_user(session)[1] for _ in range(50)]
+
+    before = p50_p99(asyncio.run(latencies(baseline, video.id, viewers)))
+    after = p50_p99(asyncio.run(latencies(client.app, video.id, viewers)))
+    print(f"\n/user/comment at 50 in flight: p50 {before[0]:.1f} ms, p99 {before[1]:.1f} ms with the sync Session,"
+          f" p50 {after[0]:.1f} ms, p99 {after[1]:.1f} ms with the AsyncSession")
@@ -0,0 +1,87 @@
+import asyncio
+import time
+import httpx
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database.structure import get_async_session
+from oauth2 import password_pool
+from oauth2.jwt_hashing import check_hashed_password, create_access_token, hash_password
+from sqlmodels.tables_schema import Users, UserLogin
+
+@pytest.fixture
+def pool():
+    yield password_pool
+    password_pool.shutdown_pool()
+
+def test_hashes_in_forkserver_processes(pool):
+    assert pool.get_pool()._mp_context.get_start_method() == "forkserver"
+
+    async def roundtrip():
+        hashed = await pool.hash_password_async("Secret#123")
+        return (await pool.check_hashed_password_async("Secret#123", hashed),
+                await pool.check_hashed_password_async("wrong", hashed))
+    assert asyncio.run(roundtrip()) == (True, False)
+
+def test_rejects_past_the_queue_limit(pool, monkeypatch):
+    monkeypatch.setattr(pool, "HASH_POOL_WORKERS", 1)
+    monkeypatch.setattr(pool, "HASH_QUEUE_MAX", 2)
+
+    async def burst():
+        return await asyncio.gather(*(pool.hash_password_async("Secret#123") for _ in range(6)),
+                                    return_exceptions=True)
+    results = asyncio.run(burst())
+    rejected = [r for r in results if isinstance(r, HTTPException)]
+    assert len(rejected) == 3 and all(r.status_code == 429 for r in rejected)
+    assert pool.pool_stats()["in_flight"] == 0
+
+# /user_login as it was before the pool, bcrypt runs on the event loop
+baseline = FastAPI()
+
+@baseline.post('/user_login')
+async def acc_login(user :UserLogin,
+              session: AsyncSession = Depends(get_async_session)):
+    query = (await session.exec(select(Users).where(Users.email == user.email))).first()
+    if not query or not check_hashed_password(user.password, query.password):
+        raise HTTPException(status_code=404, detail = "Invalid password")
+    return {'access_token' : create_access_token(data = {'sub' : query.email, 'id' : query.id,
+                                                         'role' : query.role}), 'token_type' : 'bearer'}
+
+async def login_burst(app, logins):
+    """Logins per second, and the longest the event loop went without running a 10 ms ticker."""
+    stalled = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal stalled
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            stalled = max(stalled, time.perf_counter() - started - 0.01)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+        ticking = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(http.post("/user_login", json={"email": "viewer@example.com",
+                                                                           "password": "Secret#123"})
+                                           for _ in range(logins)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await ticking
+    assert {response.status_code for response in responses} == {200}
+    return logins / elapsed, stalled
+
+def test_login_throughput_before_and_after(client, session, pool):
+    session.add(Users(name="viewer", email="viewer@example.com", password=hash_password("Secret#123"), role="user"))
+    session.commit()
+    logins = pool.HASH_POOL_WORKERS * 8
+
+    async def both():
+        await pool.hash_password_async("warm up")  # the forkserver starts outside the timing
+        return await login_burst(baseline, logins), await login_burst(client.app, logins)
+    (before, before_stall), (after, after_stall) = asyncio.run(both())
+    print(f"\n/user_login, {logins} at once: {before:.1f} logins/s with the loop stalled up to "
+          f"{before_stall * 1000:.0f} ms inline, {after:.1f} logins/s stalled up to "
+          f"{after_stall * 1000:.0f} ms with {pool.HASH_POOL_WORKERS} hashing processes")
+    assert after_stall < before_stall
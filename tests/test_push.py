@@ -0,0 +1,126 @@
+import asyncio
+import base64
+import os
+import time
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from py_vapid import Vapid
+from push_notify import delivery
+from push_notify.delivery import deliver, origin_of
+from push_notify.sub import PushSubscription, subscriptions_for
+from push_notify.vapid import VapidSigner, VAPID_PRIVATE_KEY_FILE
+from conftest import make_user
+
+PUSHES = 300
+ORIGINS = ("https://fcm.googleapis.com", "https://updates.push.services.mozilla.com")
+
+def b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+def browser_subscription(n: int) -> PushSubscription:
+    public = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint)
+    return PushSubscription(user_id=n, endpoint=f"{ORIGINS[n % 2]}/send/{n}",
+                            p256dh=b64(public), auth=b64(os.urandom(16)))
+
+@pytest.fixture
+def push_service(monkeypatch):
+    received = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        received.append(request)
+        return httpx.Response(201)
+    transport = httpx.MockTransport(handler)
+    real = httpx.AsyncClient
+    monkeypatch.setattr(delivery.httpx, "AsyncClient", lambda **kwargs: real(transport=transport, **kwargs))
+    return received
+
+def pushes_per_cpu_second(subscriptions) -> float:
+    started = time.process_time()
+    outcome, _ = asyncio.run(deliver(subscriptions, "benchmark"))
+    assert len(outcome["sent"]) == len(subscriptions)
+    return len(subscriptions) / (time.process_time() - started)
+
+class SignEveryPush(VapidSigner):
+    # what push_func did before: parse the PEM and sign a fresh token for every push
+    def headers_for(self, origin: str) -> dict:
+        return Vapid.from_file(self.key_file).sign({"sub": self.subject, "aud": origin,
+                                                    "exp": int(time.time()) + 3600})
+
+def test_vapid_headers_are_signed_once_per_origin(push_service, monkeypatch):
+    signer = VapidSigner(VAPID_PRIVATE_KEY_FILE)
+    monkeypatch.setattr(delivery, "vapid_signer", signer)
+    asyncio.run(deliver([browser_subscription(n) for n in range(20)], "hi"))
+
+    assert signer.signed == len(ORIGINS)
+    by_origin = {}
+    for request in push_service:
+        by_origin.setdefault(origin_of(str(request.url)), set()).add(request.headers["Authorization"])
+    assert all(len(tokens) == 1 for tokens in by_origin.values())
+
+def test_pushes_per_second_per_core(push_service, monkeypatch):
+    subscriptions = [browser_subscription(n) for n in range(PUSHES)]
+    rates = {}
+    for name, signer in (("sign every push", SignEveryPush(VAPID_PRIVATE_KEY_FILE)),
+                         ("cached VAPID", VapidSigner(VAPID_PRIVATE_KEY_FILE))):
+        monkeypatch.setattr(delivery, "vapid_signer", signer)
+        rates[name] = pushes_per_cpu_second(subscriptions)
+    print("\n" + ", ".join(f"{name}: {rate:.0f} pushes/s per core" for name, rate in rates.items()))
+    assert rates["cached VAPID"] > rates["sign every push"]
+
+def test_throttled_pushes_wait_for_retry_after(session, monkeypatch):
+    user, _ = make_user(session)
+    device = browser_subscription(user.id)
+    session.add(device)
+    session.commit()
+    transport = httpx.MockTransport(lambda request: httpx.Response(429, headers={"Retry-After": "120"}))
+    real = httpx.AsyncClient
+    monkeypatch.setattr(delivery.httpx, "AsyncClient", lambda **kwargs: real(transport=transport, **kwargs))
+    retried = {}
+    monkeypatch.setattr(delivery.deliver_batch, "retry", lambda **kwargs: retried.update(kwargs))
+
+    delivery.deliver_batch(user_ids=[user.id], msg="hi")
+    assert retried["countdown"] == 120
+    assert retried["kwargs"]["endpoints"] == [device.endpoint]
+
+def test_retry_after_accepts_an_http_date():
+    later = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 90))
+    assert 80 < delivery.retry_after(httpx.Response(503, headers={"Retry-After": later})) <= 90
+    assert delivery.retry_after(httpx.Response(503, headers={"Retry-After": "soon"})) == 0
+    assert delivery.retry_after(httpx.Response(503)) == 0
+
+def subscribe_body(subscription: PushSubscription) -> dict:
+    return {"subscribe": {"endpoint": subscription.endpoint, "expirationTime": None,
+                          "keys": {"p256dh": subscription.p256dh, "auth": subscription.auth}}}
+
+def test_subscribe_stores_the_device_for_the_caller(client, session):
+    user, headers = make_user(session)
+    device = browser_subscription(1)
+    assert client.post("/subscribe", json=subscribe_body(device)).status_code == 401
+    assert client.post("/subscribe", json={"subscribe": {"endpoint": "x"}}, headers=headers).status_code == 422
+
+    # user_id in the body is ignored, the token decides
+    response = client.post("/subscribe", json=dict(subscribe_body(device), user_id=999), headers=headers)
+    assert response.status_code == 200, response.text
+    [stored] = subscriptions_for(session, user.id)
+    assert stored.endpoint == device.endpoint
+
+    refreshed = browser_subscription(1)
+    assert client.post("/subscribe", json=subscribe_body(refreshed), headers=headers).status_code == 200
+    session.expire_all()
+    assert subscriptions_for(session, user.id)[0].p256dh == refreshed.p256dh
+
+def test_subscribe_cannot_take_over_another_users_endpoint(client, session):
+    owner, owner_headers = make_user(session)
+    other, other_headers = make_user(session)
+    device = browser_subscription(1)
+    client.post("/subscribe", json=subscribe_body(device), headers=owner_headers)
+
+    hijack = browser_subscription(1)
+    response = client.post("/subscribe", json=subscribe_body(hijack), headers=other_headers)
+    assert response.status_code == 409
+    session.expire_all()
+    assert subscriptions_for(session, other.id) == []
+    assert subscriptions_for(session, owner.id)[0].p256dh == device.p256dh
@@ -0,0 +1,33 @@
+import pytest
+from sqlalchemy import text
+from sqlmodel import select
+from database.structure import engine
+from sqlmodels.tables_schema import (Users, WacthVideos, Analytics, LikesDislikes, Subscription,
+                                     Notificaions, History, Comments, Videos)
+
+# the lookups the routers run per request, by the columns they filter on
+HOT_QUERIES = {
+    "login": select(Users).where(Users.email == "a@example.com"),
+    "admins": select(Users).where(Users.role == "admin"),
+    "play_video": select(WacthVideos).where(WacthVideos.video_id == 1, WacthVideos.creator_id == 2,
+                                            WacthVideos.user_id == 3),
+    "analytics_video": select(Analytics).where(Analytics.video_id == 1),
+    "analytics_creator": select(Analytics).where(Analytics.creator_id == 1),
+    "like_dislike": select(LikesDislikes).where(LikesDislikes.video_id == 1, LikesDislikes.user_id == 2),
+    "liked_videos": select(LikesDislikes).where(LikesDislikes.user_id == 1, LikesDislikes.is_like == True),  # noqa: E712
+    "subscribe": select(Subscription).where(Subscription.creator_id == 1, Subscription.user_id == 2),
+    "subscriptions": select(Subscription).where(Subscription.user_id == 1),
+    "get_notifications": select(Notificaions).where(Notificaions.user_id == 1, Notificaions.is_read == False),  # noqa: E712
+    "history": select(History).where(History.user_id == 1),
+    "replies": select(Comments).where(Comments.parent_comment_id == 1),
+    "video_comments": select(Comments).where(Comments.video_id == 1),
+    "my_videos": select(Videos).where(Videos.creator_id == 1),
+}
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_query_uses_an_index(db, name):
+    sql = str(HOT_QUERIES[name].compile(engine, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as connection:
+        plan = [row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    # SQLite says "SCAN <table>" for a full table scan and "SEARCH ... USING INDEX" otherwise
+    assert not [step for step in plan if step.startswith("SCAN")], plan
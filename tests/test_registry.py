@@ -0,0 +1,78 @@
+import asyncio
+import gc
+import random
+import pytest
+from fastapi import WebSocketDisconnect
+from ws_router import registry
+from ws_router.registry import ConnectionRegistry
+
+class FakeSocket:
+    """A client that reads everything, never reads (stalls), or has gone away."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.received = 0
+        self.closed_with: int | None = None
+
+    async def send_text(self, message):
+        if self.kind == "stalled":
+            await asyncio.Event().wait()
+        if self.kind == "gone":
+            raise WebSocketDisconnect()
+        self.received += 1
+
+    send_json = send_text
+
+    async def close(self, code: int):
+        self.closed_with = code
+
+@pytest.fixture
+def fast_clock(monkeypatch):
+    monkeypatch.setattr(registry, "WS_HEARTBEAT_SECONDS", 0.2)
+    monkeypatch.setattr(registry, "WS_IDLE_TIMEOUT_SECONDS", 0.5)
+    monkeypatch.setattr(registry, "WS_SEND_TIMEOUT_SECONDS", 0.3)
+    monkeypatch.setattr(registry, "WS_SEND_QUEUE", 8)
+
+@pytest.fixture
+def quiet_heap():
+    # whatever earlier tests left on the heap (moto's service models) makes every full collection
+    # a few hundred ms, longer than the shortened idle timeout; keep it out of the collector
+    gc.collect()
+    gc.freeze()
+    yield
+    gc.unfreeze()
+
+def test_soak_with_many_clients(fast_clock, quiet_heap):
+    clients = 3000
+    random.seed(7)
+    kinds = random.choices(["listener", "chatty", "stalled", "gone"], weights=[70, 20, 5, 5], k=clients)
+
+    async def soak():
+        connections = ConnectionRegistry(slots=10)
+        sockets = [FakeSocket(kind) for kind in kinds]
+        entries = [connections.add(n % 500, socket) for n, socket in enumerate(sockets)]
+        await connections.start()
+        for _ in range(15):  # 1.5s, three idle timeouts
+            await asyncio.sleep(0.1)
+            for user_id in range(0, 500, 7):
+                connections.send(user_id, {"message": "new video"})
+            for socket, entry in zip(sockets, entries):
+                if socket.kind == "chatty":
+                    entry.touch()  # what the receive loop does for a client that answers
+        await connections.stop()
+        await asyncio.sleep(0)
+        return connections, sockets
+
+    connections, sockets = asyncio.run(soak())
+    alive = {socket for slot in connections.wheel for socket in (c.websocket for c in slot)}
+    by_kind = {kind: [socket for socket in sockets if socket.kind == kind] for kind in set(kinds)}
+
+    assert all(socket in alive and socket.closed_with is None for socket in by_kind["listener"])
+    assert all(socket in alive for socket in by_kind["chatty"])
+    assert not any(socket in alive for socket in by_kind["stalled"] + by_kind["gone"])
+    assert all(socket.closed_with is not None for socket in by_kind["stalled"] + by_kind["gone"])
+    assert all(socket.received > 0 for socket in by_kind["listener"])
+
+    # users and the wheel agree, and nothing is left queued for a socket that is gone
+    assert sum(len(entries) for entries in connections.users.values()) == connections.stats()["connections"]
+    assert all(len(c.outbox) <= registry.WS_SEND_QUEUE for slot in connections.wheel for c in slot)
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlmodel import select
+from database import rollups
+from database.rollups import update_rollups, rollup_report
+from push_notify import push_func
+from sqlmodels.tables_schema import History, RollupWatermark
+from conftest import make_user, make_video
+
+@pytest.fixture
+def video(session):
+    creator, _ = make_user(session, "creator")
+    return make_video(session, creator)
+
+def watched(session, video, *ages_in_minutes):
+    viewer, _ = make_user(session)
+    now = datetime.utcnow()
+    for age in ages_in_minutes:
+        session.add(History(user_id=viewer.id, video_id=video.id, watched_at=now - timedelta(minutes=age)))
+    session.commit()
+
+def views(session, video):
+    session.expire_all()
+    return sum(row["views"] for row in rollup_report(session, "daily") if row["video_id"] == video.id)
+
+def test_backlog_is_drained_in_one_run(session, video, monkeypatch):
+    monkeypatch.setattr(rollups, "ROLLUP_BATCH_SIZE", 3)
+    watched(session, video, *range(10, 20))
+    assert update_rollups(session)["history"] == 10
+    assert views(session, video) == 10
+
+def test_time_budget_stops_the_run(session, video, monkeypatch):
+    monkeypatch.setattr(rollups, "ROLLUP_TIME_BUDGET_SECONDS", 0)
+    watched(session, video, 10)
+    assert update_rollups(session)["history"] == 0
+
+def test_recent_rows_wait_for_late_commits(session, video):
+    watched(session, video, 10, 0)
+    assert update_rollups(session)["history"] == 1
+    assert session.get(RollupWatermark, "history").last_id == 1
+
+    # the fresh row settles; a lower id committing late would still be above the watermark
+    row = session.exec(select(History).where(History.id == 2)).one()
+    row.watched_at -= timedelta(minutes=5)
+    session.add(row)
+    session.commit()
+    assert update_rollups(session)["history"] == 1
+    assert views(session, video) == 2
+
+def test_like_flips_and_deletes_move_the_rollups(client, session, video, monkeypatch):
+    monkeypatch.setattr(push_func.deliver_batch, "delay", lambda *args: None)
+    _, headers = make_user(session)
+
+    def react(is_like):
+        response = client.post("/user/like_dislike", params={"video_id": video.id, "is_like": is_like},
+                               headers=headers)
+        assert response.status_code == 200, response.text
+
+    def totals():
+        session.expire_all()
+        [row] = [row for row in rollup_report(session, "hourly") if row["video_id"] == video.id]
+        return row["likes"], row["dislikes"]
+
+    react(True)
+    assert totals() == (1, 0)
+    react(False)
+    assert totals() == (0, 1)
+    assert client.delete("/user/delete_account", headers=headers).status_code == 200
+    assert totals() == (0, 0)
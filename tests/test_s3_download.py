@@ -0,0 +1,56 @@
+import os
+import boto3
+import pytest
+from botocore.exceptions import EndpointConnectionError
+from moto import mock_aws
+from s3_worker import server
+
+@pytest.fixture
+def bucket(monkeypatch):
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket="videos")
+        monkeypatch.setattr(server, "S3_DOWNLOAD_PART_MB", 1)
+        yield "videos"
+
+def put(key: str, data: bytes) -> str:
+    boto3.client("s3").put_object(Bucket="videos", Key=key, Body=data)
+    return f"https://videos.s3.amazonaws.com/{key}"
+
+def test_parallel_ranges_rebuild_the_object(bucket, tmp_path):
+    data = os.urandom(3 * 1024 * 1024 + 12345)  # three full ranges and a short one
+    path = server.download_from_s3(put("uploads/a b.mp4", data), str(tmp_path))
+    assert os.path.basename(path) == "a b.mp4"
+    with open(path, "rb") as f:
+        assert f.read() == data
+
+def test_empty_object(bucket, tmp_path):
+    path = server.download_from_s3(put("uploads/empty.mp4", b""), str(tmp_path))
+    assert os.path.getsize(path) == 0
+
+def test_dropped_range_resumes_from_written_offset(bucket, tmp_path, monkeypatch):
+    data = os.urandom(2 * 1024 * 1024)
+    url = put("uploads/flaky.mp4", data)
+    real_get = server.s3.get_object
+    ranges = []
+
+    class Dropping:
+        # hands out half of the body, then fails like a reset connection
+        def __init__(self, body):
+            self.body = body
+        def iter_chunks(self, size):
+            yield self.body.read(256 * 1024)
+            raise EndpointConnectionError(endpoint_url="https://videos.s3.amazonaws.com")
+
+    def get_object(**kwargs):
+        ranges.append(kwargs["Range"])
+        response = real_get(**kwargs)
+        if len(ranges) == 1:
+            response["Body"] = Dropping(response["Body"])
+        return response
+
+    monkeypatch.setattr(server, "S3_DOWNLOAD_THREADS", 1)
+    monkeypatch.setattr(server.s3, "get_object", get_object)
+    path = server.download_from_s3(url, str(tmp_path))
+    with open(path, "rb") as f:
+        assert f.read() == data
+    assert ranges[:2] == ["bytes=0-1048575", "bytes=262144-1048575"]
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+import fakeredis
+import pytest
+from sqlalchemy import inspect
+from s3_worker.trending import refresh_scores, watermark
+from trending import index
+from database.pagination import encode_cursor
+from trending.index import publish_snapshot, ranking_key, trending_index
+from sqlmodels.tables_schema import History, RollupWatermark, Trending, TrendingScore
+from conftest import make_user, make_video
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    server = fakeredis.FakeServer()
+    opened = []
+
+    def from_url(url):
+        opened.append(url)
+        return fakeredis.FakeRedis(server=server)
+    monkeypatch.setattr(index.redis.Redis, "from_url", from_url)
+    monkeypatch.setattr(index, "_client", None)
+    return fakeredis.FakeRedis(server=server), opened
+
+def test_publish_snapshot_reuses_its_client(fake_redis):
+    reader, opened = fake_redis
+    publish_snapshot({"": [(1, 5.0), (2, 3.0)], "music": [(2, 3.0)]}, {1: {"title": "a"}, 2: {"title": "b"}})
+    publish_snapshot({"": [(2, 4.0)]}, {2: {"title": "b"}})
+
+    assert len(opened) == 1
+    assert reader.zrange(ranking_key(""), 0, -1) == [b"2"]
+    assert not reader.exists(ranking_key("music"))
+    assert int(reader.get(index.VERSION_KEY)) == 2
+
+def test_fallback_filters_on_category(client, session):
+    creator, _ = make_user(session, "creator")
+    _, headers = make_user(session)
+    for rank, category in enumerate(["music", "sports", "music"], start=1):
+        video = make_video(session, creator, category=category)
+        session.add(Trending(creator_id=creator.id, video=video.original_url, video_id=video.id,
+                             views=0, duration=0, rank=rank, score=10 - rank))
+    session.commit()
+    assert not trending_index.loaded
+
+    response = client.get("/trending_videos", params={"category": "music"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert [video["rank"] for video in response.json()["trending"]] == [1, 3]
+
+@pytest.fixture
+def loaded_index(monkeypatch):
+    monkeypatch.setattr(trending_index, "version", b"1")
+    monkeypatch.setattr(trending_index, "scores", {"": {7: 2.0, 8: 1.0}})
+    trending_index.rebuild()
+    yield trending_index
+    trending_index.served = {}
+
+@pytest.mark.parametrize("cursor", [encode_cursor("abc"), encode_cursor(1.5), encode_cursor(-1), "!!"])
+def test_bad_cursor_is_rejected(client, session, loaded_index, cursor):
+    _, headers = make_user(session)
+    response = client.get("/trending_videos", params={"cursor": cursor}, headers=headers)
+    assert response.status_code == 400
+
+def test_cursor_pages_through_the_snapshot(client, session, loaded_index):
+    _, headers = make_user(session)
+    first = client.get("/trending_videos", params={"limit": 1}, headers=headers).json()
+    second = client.get("/trending_videos", params={"limit": 1, "cursor": first["next_cursor"]},
+                        headers=headers).json()
+    assert [v["video_id"] for v in first["trending"] + second["trending"]] == [7, 8]
+    assert second["next_cursor"] is None
+
+def test_recent_views_wait_for_late_commits(session):
+    creator, _ = make_user(session, "creator")
+    viewer, _ = make_user(session)
+    video = make_video(session, creator)
+    now = datetime(2026, 1, 1, 12)
+    session.add_all([History(user_id=viewer.id, video_id=video.id, watched_at=now - timedelta(minutes=10)),
+                     History(user_id=viewer.id, video_id=video.id, watched_at=now)])
+    session.commit()
+
+    assert refresh_scores(session, now) == 1
+    session.commit()
+    assert session.get(RollupWatermark, "trending:history").last_id == 1
+
+    # settled by the next run, the watermark only ever passed rows old enough to have no late predecessor
+    assert refresh_scores(session, now + timedelta(minutes=5)) == 1
+    session.commit()
+    assert session.get(RollupWatermark, "trending:history").last_id == 2
+    assert session.get(TrendingScore, video.id).score > 1
+
+def test_first_locked_watermark_is_a_stored_row(session):
+    mark = watermark(session, "trending:clock", lock=True)
+    # a locked row, not a fresh object a concurrent first run would also get
+    assert inspect(mark).persistent
+    session.commit()
+    assert watermark(session, "trending:clock", lock=True) is mark
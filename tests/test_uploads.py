@@ -0,0 +1,74 @@
+import boto3
+import pytest
+from fastapi import HTTPException
+from moto import mock_aws
+from sqlmodel import Session, select
+from routers import creator
+from sqlmodels.tables_schema import UploadSessions, Videos
+from conftest import make_user
+
+BUCKET = "my-fastapi-videos"
+
+@pytest.fixture
+def s3(monkeypatch):
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        queued = []
+        monkeypatch.setattr(creator.process_video, "delay", lambda *args: queued.append(args))
+        monkeypatch.setattr(creator, "notify_subscribers", lambda *args: None)
+        yield client
+
+def presigned_session(client, headers, size: int) -> str:
+    response = client.post("/upload_url", headers=headers, data={
+        "filename": "clip.mp4", "size": size, "title": "t", "description": "d",
+        "category": "c", "tags": "x", "disable_comments": False})
+    assert response.status_code == 200, response.text
+    assert response.json()["method"] == "post"
+    return response.json()["upload_id"]
+
+def test_presigned_post_size_mismatch_is_rejected(client, session, s3):
+    _, headers = make_user(session, "creator")
+    upload_id = presigned_session(client, headers, 1000)
+    key = session.get(UploadSessions, upload_id).s3_key
+    s3.put_object(Bucket=BUCKET, Key=key, Body=b"x" * 10)
+
+    response = client.post("/upload_complete", params={"upload_id": upload_id}, headers=headers, json={})
+    assert response.status_code == 400
+    session.expire_all()
+    assert session.get(UploadSessions, upload_id).status == "aborted"
+    assert "Contents" not in s3.list_objects_v2(Bucket=BUCKET)
+    assert session.exec(select(Videos)).all() == []
+
+def test_presigned_post_completes_once(client, session, s3):
+    _, headers = make_user(session, "creator")
+    upload_id = presigned_session(client, headers, 10)
+    s3.put_object(Bucket=BUCKET, Key=session.get(UploadSessions, upload_id).s3_key, Body=b"x" * 10)
+
+    first = client.post("/upload_complete", params={"upload_id": upload_id}, headers=headers, json={})
+    second = client.post("/upload_complete", params={"upload_id": upload_id}, headers=headers, json={})
+    assert first.status_code == 200, first.text
+    assert second.status_code == 409
+    assert len(session.exec(select(Videos)).all()) == 1
+
+def test_abort_presigned_post_deletes_the_object(client, session, s3):
+    _, headers = make_user(session, "creator")
+    upload_id = presigned_session(client, headers, 10)
+    s3.put_object(Bucket=BUCKET, Key=session.get(UploadSessions, upload_id).s3_key, Body=b"x" * 10)
+
+    response = client.delete(f"/uploads/{upload_id}", headers=headers)
+    assert response.status_code == 200, response.text
+    assert "Contents" not in s3.list_objects_v2(Bucket=BUCKET)
+
+def test_concurrent_claims_let_one_caller_through(db, session):
+    user, _ = make_user(session, "creator")
+    session.add(UploadSessions(id="u1", creator_id=user.id, s3_key="k", title="t", status="open"))
+    session.commit()
+
+    # both requests loaded the session while it was still open
+    with Session(db) as first, Session(db) as second:
+        a, b = first.get(UploadSessions, "u1"), second.get(UploadSessions, "u1")
+        creator.claim_upload(first, a, "completing")
+        with pytest.raises(HTTPException) as conflict:
+            creator.claim_upload(second, b, "completing")
+    assert conflict.value.status_code == 409
@@ -0,0 +1,161 @@
+import asyncio
+import glob
+import os
+from datetime import datetime, timedelta
+import pytest
+from sqlmodel import select
+import database.watch_buffer as watch_buffer_module
+from database.watch_buffer import WatchState, WatchBuffer, LogSegment, apply_batch, fold_events
+from sqlmodels.tables_schema import WacthVideos, AppliedSegment
+from conftest import make_user, make_video
+
+def test_play_reopens_an_ended_watch():
+    start = datetime(2026, 1, 1)
+    state = WatchState()
+    for kind, second in (("end", 30), ("play", 100), ("pause", 160)):
+        state.fold(kind, start + timedelta(seconds=second))
+    change = state.changes(1, last_stop=start)
+    assert change["added"] == 30 + 60
+    assert change["set_end"] and change["end_time"] is None and change["last_stop"] is None
+
+def test_playing_again_restarts_the_clock(client, session, buffer):
+    creator, _ = make_user(session, "creator")
+    video = make_video(session, creator)
+    _, headers = make_user(session)
+
+    watch_id = client.post("/user/play_video", params={"video_id": video.id}, headers=headers).json()["watch_id"]
+    client.post("/user/end_video", params={"watch_id": watch_id}, headers=headers)
+    asyncio.run(buffer.flush())
+    session.expire_all()
+    ended = session.get(WacthVideos, watch_id)
+    assert ended.end_time is not None and ended.last_stop is None
+    ended_at = ended.end_time
+
+    again = client.post("/user/play_video", params={"video_id": video.id}, headers=headers).json()["watch_id"]
+    assert again == watch_id
+    asyncio.run(buffer.flush())
+    session.expire_all()
+    replayed = session.get(WacthVideos, watch_id)
+    assert replayed.end_time is None
+    assert replayed.last_stop is not None and replayed.last_stop >= ended_at
+
+def test_poison_batch_is_set_aside(buffer, monkeypatch):
+    monkeypatch.setattr(watch_buffer_module, "WATCH_BUFFER_MAX_ATTEMPTS", 2)
+    applied = []
+
+    async def apply(batch, **marks):
+        if 1 in batch:
+            raise ValueError("poison")
+        applied.append(set(batch))
+    monkeypatch.setattr(watch_buffer_module, "apply_batch", apply)
+
+    now = datetime.utcnow()
+    buffer.record(1, "pause", now)
+    with pytest.raises(ValueError):
+        asyncio.run(buffer.flush())
+    buffer.record(2, "pause", now)
+    asyncio.run(buffer.flush())
+
+    assert applied == [{2}] and buffer.retry == [] and buffer.attempts == 0
+    [dead] = glob.glob(os.path.join(buffer.directory, "*.dead"))
+    assert [event[0] for event in watch_buffer_module.read_log(dead)] == [1]
+
+def test_retry_list_is_capped_while_the_database_is_down(buffer, monkeypatch):
+    monkeypatch.setattr(watch_buffer_module, "WATCH_BUFFER_MAX_RETRY", 2)
+
+    async def down(batch, **marks):
+        raise OSError("database unavailable")  # never counts towards WATCH_BUFFER_MAX_ATTEMPTS
+    monkeypatch.setattr(watch_buffer_module, "apply_batch", down)
+
+    start = datetime(2026, 1, 1)
+    for n in range(10):
+        buffer.record(7, "resume", start + timedelta(seconds=2 * n))
+        buffer.record(7, "pause", start + timedelta(seconds=2 * n + 1))
+        with pytest.raises(OSError):
+            asyncio.run(buffer.flush())
+    # the batches past the cap kept folding into one state instead of queueing
+    assert len(buffer.retry) == 2 and buffer.attempts == 0
+    assert buffer.pending[7].added == 8
+
+def test_concurrent_events_add_up(client, session, buffer):
+    creator, _ = make_user(session, "creator")
+    video = make_video(session, creator)
+    viewers = [make_user(session)[1] for _ in range(20)]
+    watch_ids = [client.post("/user/play_video", params={"video_id": video.id}, headers=headers).json()["watch_id"]
+                 for headers in viewers]
+    session.expire_all()
+    started = {watch_id: session.get(WacthVideos, watch_id).last_stop for watch_id in watch_ids}
+
+    async def viewer(watch_id):
+        # 10s playing, 10s paused, repeated, while the buffer flushes in between
+        for n in range(5):
+            buffer.record(watch_id, "pause", started[watch_id] + timedelta(seconds=20 * n + 10))
+            await asyncio.sleep(0)
+            buffer.record(watch_id, "resume", started[watch_id] + timedelta(seconds=20 * n + 20))
+            await asyncio.sleep(0)
+        buffer.record(watch_id, "end", started[watch_id] + timedelta(seconds=110))
+
+    async def run():
+        watching = asyncio.gather(*(viewer(watch_id) for watch_id in watch_ids))
+        flushes = 0
+        while not watching.done():  # what the run loop does, one flush at a time
+            await buffer.flush()
+            await asyncio.sleep(0)
+            flushes += 1
+        await watching
+        await buffer.flush()
+        return flushes
+    assert asyncio.run(run()) > 1
+
+    session.expire_all()
+    assert [session.get(WacthVideos, watch_id).duration for watch_id in watch_ids] == [60] * len(watch_ids)
+
+def test_record_before_start_is_a_clear_error(tmp_path):
+    with pytest.raises(RuntimeError, match="before start"):
+        WatchBuffer(str(tmp_path)).record(1, "pause", datetime.utcnow())
+
+def watch_row(session, **fields):
+    creator, _ = make_user(session, "creator")
+    video = make_video(session, creator)
+    viewer, _ = make_user(session)
+    watch = WacthVideos(video_id=video.id, user_id=viewer.id, creator_id=creator.id, **fields)
+    session.add(watch)
+    session.commit()
+    return watch.id
+
+def test_workers_flushing_one_watch_both_keep_their_time(session, db):
+    start = datetime(2026, 1, 1)
+    watch_id = watch_row(session, start_time=start, last_stop=None, duration=100)
+
+    # the sticky worker's resume/pause and the /play_video worker's play, flushed together
+    sticky = fold_events([(watch_id, "resume", start), (watch_id, "pause", start + timedelta(seconds=40))])
+    other = fold_events([(watch_id, "play", start + timedelta(seconds=50))])
+
+    async def both():
+        await asyncio.gather(apply_batch(sticky), apply_batch(other))
+    asyncio.run(both())
+    session.expire_all()
+    assert session.get(WacthVideos, watch_id).duration == 140
+
+def test_replay_skips_a_batch_committed_before_the_crash(session, buffer, tmp_path):
+    start = datetime(2026, 1, 1)
+    watch_id = watch_row(session, start_time=start, last_stop=start, duration=0)
+
+    # a dead worker's sealed batch, committed with its mark but never deleted
+    path = str(tmp_path / "dead-worker.000001.pending")
+    segment = LogSegment(path)
+    segment.append(watch_id, "pause", start + timedelta(seconds=30))
+    batch = fold_events(watch_buffer_module.read_log(path))
+    asyncio.run(apply_batch(batch, applied=[segment.key]))
+    segment.file.close()  # the worker's lock goes with it
+
+    asyncio.run(buffer.replay_orphans())
+    session.expire_all()
+    assert session.get(WacthVideos, watch_id).duration == 30
+    assert not os.path.exists(path)
+
+    # the mark goes with the next flush once the file is gone
+    buffer.record(watch_id, "resume", start + timedelta(seconds=40))
+    asyncio.run(buffer.flush())
+    session.expire_all()
+    assert [mark.name for mark in session.exec(select(AppliedSegment)).all()] == ["test.000001"]
@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import json
+import redis
+import redis.asyncio as aioredis
+from decouple import config
+
+REDIS_URL: str = config('REDIS_URL', cast=str, default='redis://localhost:6379/0')
+# how often API workers look for a new snapshot, and how long clients may cache one
+TRENDING_INDEX_REFRESH_SECONDS: float = config('TRENDING_INDEX_REFRESH_SECONDS', cast=float, default=2)
+TRENDING_CACHE_SECONDS: int = config('TRENDING_CACHE_SECONDS', cast=int, default=30)
+
+VERSION_KEY = "trending:version"
+META_KEY = "trending:meta"
+GLOBAL = ""  # list key of the all-categories ranking
+
+def ranking_key(category: str) -> str:
+    return f"trending:rank:{category}" if category else "trending:rank"
+
+_client: redis.Redis | None = None
+
+def get_client() -> redis.Redis:
+    # one connection pool per process instead of a new one every trending run
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL)
+    return _client
+
+def publish_snapshot(rankings: dict[str, list[tuple[int, float]]], meta: dict[int, dict]) -> None:
+    """Replaces every sorted set and the metadata in one MULTI, readers never see a half snapshot.
+
+    `rankings` maps a category ("" for the global list) to (video_id, score) pairs.
+    """
+    client = get_client()
+    old_keys = [key for key in client.scan_iter(match="trending:rank*")]
+    with client.pipeline(transaction=True) as pipe:
+        if old_keys:
+            pipe.delete(*old_keys)
+        pipe.delete(META_KEY)
+        for category, ranking in rankings.items():
+            if ranking:
+                pipe.zadd(ranking_key(category), {str(video_id): score for video_id, score in ranking})
+        if meta:
+            pipe.hset(META_KEY, mapping={str(video_id): json.dumps(info) for video_id, info in meta.items()})
+        pipe.incr(VERSION_KEY)
+        pipe.execute()
+
+class TrendingIndex:
+    """Per process copy of the latest trending snapshot, reads never leave memory.
+
+    A background task pulls a new snapshot from Redis when the version moves. In between,
+    views recorded here re-order the videos already in the snapshot.
+    """
+
+    def __init__(self):
+        self.version: bytes | None = None
+        self.meta: dict[int, dict] = {}
+        self.scores: dict[str, dict[int, float]] = {}
+        self.views: dict[int, float] = {}
+        self.served: dict[str, tuple[list[dict], str]] = {}
+        self.client: aioredis.Redis | None = None
+        self.task: asyncio.Task | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.version is not None
+
+    def record_view(self, video_id: int) -> None:
+        if video_id in self.meta:
+            self.views[video_id] = self.views.get(video_id, 0.0) + 1.0
+
+    def top(self, category: str | None = None, limit: int = 20, after: int = 0) -> tuple[list[dict], str]:
+        videos, etag = self.served.get(category or GLOBAL, ([], '"empty"'))
+        after = max(0, after)
+        return videos[after:after + limit], f'{etag[:-1]}-{after}-{limit}"'
+
+    async def start(self) -> None:
+        self.client = aioredis.Redis.from_url(REDIS_URL)
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+        if self.client:
+            await self.client.aclose()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except (redis.RedisError, OSError) as e:
+                print(f"Trending index refresh failed: {e}")  # keep serving the last snapshot
+            await asyncio.sleep(TRENDING_INDEX_REFRESH_SECONDS)
+
+    async def refresh(self) -> None:
+        version = await self.client.get(VERSION_KEY)
+        if version is not None and version != self.version:
+            await self.load(version)
+        elif self.views:
+            for scores in self.scores.values():
+                for video_id in scores.keys() & self.views.keys():
+                    scores[video_id] += self.views[video_id]
+            self.views = {}
+            self.rebuild()
+
+    async def load(self, version: bytes) -> None:
+        keys = [key async for key in self.client.scan_iter(match="trending:rank*")]
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hgetall(META_KEY)
+            for key in keys:
+                pipe.zrevrange(key, 0, -1, withscores=True)
+            meta, *rankings = await pipe.execute()
+
+        self.meta = {int(video_id): json.loads(info) for video_id, info in meta.items()}
+        self.scores = {}
+        for key, ranking in zip(keys, rankings):
+            category = key.decode().removeprefix("trending:rank").removeprefix(":")
+            self.scores[category] = {int(video_id): score for video_id, score in ranking}
+        self.views = {}
+        self.version = version
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        # sorted once per change, so a request only slices a ready list
+        served = {}
+        for category, scores in self.scores.items():
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            videos = [dict(self.meta.get(video_id, {}), video_id=video_id, score=round(score, 3), rank=rank)
+                      for rank, (video_id, score) in enumerate(ranked, start=1)]
+            digest = hashlib.md5(json.dumps(videos, sort_keys=True).encode()).hexdigest()
+            served[category] = (videos, f'"{digest}"')
+        self.served = served
+
+trending_index = TrendingIndex()
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import redis
+import redis.asyncio as aioredis
+from decouple import config
+
+# "local" delivers inside the publishing process only, enough for a single uvicorn worker
+NOTIFY_BUS_URL: str = config('NOTIFY_BUS_URL', cast=str, default='redis://localhost:6379/0')
+NOTIFY_CHANNEL: str = config('NOTIFY_CHANNEL', cast=str, default='notifications')
+# messages from async handlers waiting for the sender task, past this they are dropped
+NOTIFY_OUTBOX_MAX: int = config('NOTIFY_OUTBOX_MAX', cast=int, default=10000)
+NOTIFY_PUBLISH_BATCH: int = config('NOTIFY_PUBLISH_BATCH', cast=int, default=100)
+
+def running_loop() -> asyncio.AbstractEventLoop | None:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+class NotificationBus:
+    """Carries websocket notifications from any process to the one holding the socket.
+
+    API workers, Celery and beat publish to a user id. Every API worker subscribes at startup
+    and hands each message to `deliver`, which ignores users connected elsewhere.
+    """
+
+    def __init__(self, url: str = NOTIFY_BUS_URL):
+        self.url = url
+        self.local = url == "local"
+        self.client: redis.Redis | None = None
+        self.publisher: aioredis.Redis | None = None
+        self.outbox: asyncio.Queue | None = None
+        self.sender: asyncio.Task | None = None
+        self.subscriber: aioredis.Redis | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.deliver = None
+        self.task: asyncio.Task | None = None
+
+    def publish(self, user_id: int, message: str, **extra) -> None:
+        payload = dict(extra, user_id=user_id, message=message)
+        if self.local:
+            self.dispatch(payload)
+            return
+        if self.outbox is not None and running_loop() is self.loop:
+            # an async handler, a blocking round trip here would stall every request of the worker
+            try:
+                self.outbox.put_nowait(json.dumps(payload))
+            except asyncio.QueueFull:
+                print(f"Notification for user {user_id} not published: outbox full")
+            return
+        try:
+            # threadpool handlers and Celery have no loop to hand the call to
+            if self.client is None:
+                self.client = redis.Redis.from_url(self.url)
+            self.client.publish(NOTIFY_CHANNEL, json.dumps(payload))
+        except redis.RedisError as e:
+            # lost like a message to a user who isn't connected, the request itself succeeded
+            print(f"Notification for user {user_id} not published: {e}")
+
+    async def send(self) -> None:
+        """Publishes the outbox over one connection, in order, a pipeline per batch."""
+        while True:
+            batch = [await self.outbox.get()]
+            while len(batch) < NOTIFY_PUBLISH_BATCH and not self.outbox.empty():
+                batch.append(self.outbox.get_nowait())
+            try:
+                async with self.publisher.pipeline(transaction=False) as pipe:
+                    for data in batch:
+                        pipe.publish(NOTIFY_CHANNEL, data)
+                    await pipe.execute()
+            except (redis.RedisError, OSError) as e:
+                print(f"{len(batch)} notifications not published: {e}")
+            finally:
+                for _ in batch:
+                    self.outbox.task_done()
+
+    def dispatch(self, payload: dict) -> None:
+        if self.loop is None:
+            return  # no websockets in this process
+        if running_loop() is self.loop:
+            self.loop.create_task(self.deliver(payload))
+        else:
+            # sync route handlers run in the threadpool
+            asyncio.run_coroutine_threadsafe(self.deliver(payload), self.loop)
+
+    async def start(self, deliver) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.deliver = deliver
+        if not self.local:
+            self.subscriber = aioredis.Redis.from_url(self.url)
+            self.task = asyncio.create_task(self.run())
+            self.publisher = aioredis.Redis.from_url(self.url)
+            self.outbox = asyncio.Queue(NOTIFY_OUTBOX_MAX)
+            self.sender = asyncio.create_task(self.send())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+        if self.sender:
+            try:
+                await asyncio.wait_for(self.outbox.join(), 1)  # what is queued still goes out
+            except asyncio.TimeoutError:
+                pass
+            self.sender.cancel()
+            self.outbox = None
+        if self.publisher:
+            await self.publisher.aclose()
+        if self.subscriber:
+            await self.subscriber.aclose()
+        if self.client:
+            self.client.close()
+        self.loop = None
+
+    async def run(self) -> None:
+        while True:
+            try:
+                async with self.subscriber.pubsub() as pubsub:
+                    await pubsub.subscribe(NOTIFY_CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            await self.handle(message["data"])
+            except (redis.RedisError, OSError) as e:
+                print(f"Notification bus disconnected: {e}")
+                await asyncio.sleep(1)
+
+    async def handle(self, data: bytes) -> None:
+        # one bad message from any publisher must not end the subscription for everyone
+        try:
+            await self.deliver(json.loads(data))
+        except Exception as e:
+            print(f"Notification dropped: {e!r} in {data[:200]!r}")
+
+notification_bus = NotificationBus()
@@ -0,0 +1,141 @@
+import asyncio
+import itertools
+import time
+from collections import defaultdict, deque
+from decouple import config
+from fastapi import WebSocket, WebSocketDisconnect, status
+
+WS_HEARTBEAT_SECONDS: float = config('WS_HEARTBEAT_SECONDS', cast=float, default=30)
+WS_WHEEL_SLOTS: int = config('WS_WHEEL_SLOTS', cast=int, default=30)
+# a socket that neither sent anything nor accepted a write for this long is closed
+WS_IDLE_TIMEOUT_SECONDS: float = config('WS_IDLE_TIMEOUT_SECONDS', cast=float, default=90)
+# messages waiting per socket before it counts as a slow consumer and is dropped
+WS_SEND_QUEUE: int = config('WS_SEND_QUEUE', cast=int, default=64)
+WS_SEND_TIMEOUT_SECONDS: float = config('WS_SEND_TIMEOUT_SECONDS', cast=float, default=10)
+
+PING = "__ping__"
+
+class Connection:
+    def __init__(self, user_id: int, websocket: WebSocket, slot: int):
+        self.user_id = user_id
+        self.websocket = websocket
+        self.slot = slot
+        self.last_seen = time.monotonic()
+        self.outbox: deque = deque()
+        self.sender: asyncio.Task | None = None
+        self.closed = False
+
+    def touch(self) -> None:
+        self.last_seen = time.monotonic()
+
+class ConnectionRegistry:
+    """Open sockets of this process, any number per user (tabs, devices).
+
+    One task walks a timing wheel: every tick pings the connections of one slot and evicts
+    the idle ones, so each connection is visited once per WS_HEARTBEAT_SECONDS without a
+    timer of its own. Sends go through a short per-socket outbox drained by a task that
+    only exists while there is something to send.
+    """
+
+    def __init__(self, slots: int = WS_WHEEL_SLOTS):
+        self.users: dict[int, set[Connection]] = defaultdict(set)
+        self.wheel: list[set[Connection]] = [set() for _ in range(max(1, slots))]
+        self.slots = itertools.cycle(range(len(self.wheel)))
+        self.task: asyncio.Task | None = None
+        self.dropped = 0
+        self.evicted = 0
+
+    def add(self, user_id: int, websocket: WebSocket) -> Connection:
+        connection = Connection(user_id, websocket, next(self.slots))
+        self.users[user_id].add(connection)
+        self.wheel[connection.slot].add(connection)
+        return connection
+
+    def remove(self, connection: Connection) -> None:
+        connection.closed = True
+        self.wheel[connection.slot].discard(connection)
+        sockets = self.users.get(connection.user_id)
+        if sockets is not None:
+            sockets.discard(connection)
+            if not sockets:
+                del self.users[connection.user_id]
+
+    def send(self, user_id: int, message) -> int:
+        """Queues `message` for every socket of the user, returns how many got it."""
+        sent = 0
+        for connection in list(self.users.get(user_id, ())):
+            sent += self.enqueue(connection, message)
+        return sent
+
+    def enqueue(self, connection: Connection, message) -> bool:
+        if connection.closed:
+            return False
+        if len(connection.outbox) >= WS_SEND_QUEUE:
+            # the client reads slower than we write, keep memory flat and let it reconnect
+            self.dropped += 1
+            self.close(connection, status.WS_1013_TRY_AGAIN_LATER)
+            return False
+        connection.outbox.append(message)
+        if connection.sender is None:
+            connection.sender = asyncio.create_task(self.drain(connection))
+        return True
+
+    async def drain(self, connection: Connection) -> None:
+        try:
+            while connection.outbox and not connection.closed:
+                message = connection.outbox.popleft()
+                send = (connection.websocket.send_text(message) if isinstance(message, str)
+                        else connection.websocket.send_json(message))
+                await asyncio.wait_for(send, WS_SEND_TIMEOUT_SECONDS)
+                # listen-only clients never answer the ping, a write that went through keeps them;
+                # a peer that is gone stalls the send or fails uvicorn's protocol level ping
+                connection.touch()
+        except (asyncio.TimeoutError, WebSocketDisconnect, RuntimeError, OSError):
+            self.close(connection, status.WS_1013_TRY_AGAIN_LATER)
+        finally:
+            connection.sender = None
+
+    def close(self, connection: Connection, code: int) -> None:
+        if connection.closed:
+            return
+        self.remove(connection)
+        connection.outbox.clear()
+        asyncio.create_task(self.close_socket(connection.websocket, code))
+
+    async def close_socket(self, websocket: WebSocket, code: int) -> None:
+        try:
+            await websocket.close(code=code)
+        except (RuntimeError, OSError):
+            pass  # already gone
+
+    async def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+
+    async def run(self) -> None:
+        tick = WS_HEARTBEAT_SECONDS / len(self.wheel)
+        for slot in itertools.cycle(range(len(self.wheel))):
+            await asyncio.sleep(tick)
+            self.turn(slot)
+
+    def turn(self, slot: int) -> None:
+        idle_since = time.monotonic() - WS_IDLE_TIMEOUT_SECONDS
+        for connection in list(self.wheel[slot]):
+            if WS_IDLE_TIMEOUT_SECONDS and connection.last_seen < idle_since:
+                self.evicted += 1
+                self.close(connection, status.WS_1001_GOING_AWAY)
+            else:
+                self.enqueue(connection, PING)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.users),
+            "connections": sum(len(slot) for slot in self.wheel),
+            "dropped_slow": self.dropped,
+            "evicted_idle": self.evicted,
+        }
+
+connection_registry = ConnectionRegistry()